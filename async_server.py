@@ -0,0 +1,178 @@
+#!venv/bin/python
+
+import os
+import json
+import math
+import asyncio
+from urllib.parse import parse_qs
+
+from utils.metrics import Metrics
+from utils.my_logging import get_logger
+from terminal_game import internet
+from terminal_game.gateway import Gateway
+from terminal_game.journal import Journal
+from terminal_game.locks import SystemLocks
+from terminal_game.scheduler import CommandScheduler
+from terminal_game.session import SessionServer
+
+
+logger = get_logger(__name__)
+
+
+class AsyncServer(object):
+    """ASGI front-end for the /commands API.
+
+    Requests for different systems run concurrently in a thread pool, while
+    requests touching the same system are serialized through SystemLocks.
+    It serves the same routes and payloads as server.py: /commands takes a
+    form (or json) with func and info, /commands/batch a json list of
+    operations and GET /metrics the command metrics. Run it with any ASGI
+    server, e.g. `uvicorn async_server:app --port 5555`.
+
+    If session_port is set, a SessionServer sharing the same locks is
+    started with the app, for clients holding a session open instead of
+    sending one request per command. Commands from both go through the same
+    scheduler, if one is given, and a throttled request gets a 429 response.
+
+    Attributes:
+        internet: Internet the requests are run against.
+        gateway: Gateway running the requests, and holding the scheduler.
+        locks: per-system locks.
+        sessions: SessionServer started with the app (None if session_port is not set).
+    """
+
+    def __init__(self, web=None, session_port=None, scheduler=None):
+        """Initializes the server using an internet (a new one by default), the port of its session server and a CommandScheduler (None to run commands right away)."""
+
+        self.internet = web if web else internet.Internet()
+        self.gateway = Gateway(self.internet, scheduler)
+        self.locks = SystemLocks(self.internet)
+        self.session_port = session_port
+        self.sessions = SessionServer(self.internet, self.locks, scheduler) if session_port else None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    if self.sessions:
+                        await self.sessions.start(port=self.session_port)
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    if self.sessions:
+                        await self.sessions.close()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        if scope['method'] == 'GET' and scope['path'] == '/metrics':
+            return await self._send_text(send, 200, Metrics.render())
+        if scope['method'] != 'POST' or scope['path'] not in ['/commands', '/commands/batch']:
+            return await self._send_json(send, 404, {'message': 'Not found.'})
+
+        body = await self._read_body(receive)
+        try:
+            if scope['path'] == '/commands':
+                func, info = self._parse_command(scope, body)
+                status, response = 200, await self.run(func, info)
+            else:
+                status, response = await self._run_batch(json.loads(body or b'null'))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            status, response = 400, {'message': 'Malformed request.'}
+        headers = []
+        if 'retry_after' in response:
+            status = 429
+            headers.append((b'retry-after', str(math.ceil(response['retry_after'])).encode()))
+        await self._send_json(send, status, response, headers)
+
+    async def run(self, func, info):
+        """Runs a single request, holding the locks of every system it may touch."""
+
+        loop = asyncio.get_running_loop()
+        if func == 'new':
+            async with self.locks.internet_lock:
+                return await loop.run_in_executor(None, self.gateway.dispatch, func, info)
+
+        ip = info.get('id')
+        args = info['input'].split(' ') if func == 'cmd' else None
+        ips = await self.locks.acquire(ip, args)
+        try:
+            return await loop.run_in_executor(None, self.gateway.dispatch, func, info)
+        finally:
+            self.locks.release(ips)
+
+    async def _run_batch(self, body):
+        """Runs a batch of requests in order, with the same error policies as Gateway.batch."""
+
+        if isinstance(body, list):
+            body = {'operations': body}
+        if not isinstance(body, dict) or not isinstance(body.get('operations'), list):
+            return 400, {'response_type': 'error', 'response': 'Body needs to be a json list of operations.', 'results': []}
+        on_error = body.get('on_error', 'stop')
+        if on_error not in Gateway.BATCH_POLICIES:
+            return 200, self.gateway.batch([], on_error)
+
+        results = []
+        failed = 0
+        stopped = set()
+        for operation in body['operations']:
+            sequence = self.gateway.sequence(operation)
+            if sequence in stopped and on_error == 'stop':
+                results.append(self.gateway.skipped(operation))
+                continue
+            try:
+                result = await self.run(operation['func'], operation['info'])
+            except (KeyError, TypeError, AttributeError):
+                result = self.gateway.malformed()
+            results.append(result)
+            if self.gateway.failed(result):
+                failed += 1
+                stopped.add(sequence)
+
+        return 200, self.gateway.batch_response(results, failed)
+
+    def _parse_command(self, scope, body):
+        """Returns the func and info of a /commands request sent as a form or as json."""
+
+        headers = dict(scope.get('headers', []))
+        if headers.get(b'content-type', b'').startswith(b'application/json'):
+            payload = json.loads(body)
+            info = payload['info']
+            return payload['func'], json.loads(info) if isinstance(info, str) else info
+
+        form = parse_qs(body.decode('utf-8'))
+        return form['func'][0], json.loads(form['info'][0])
+
+    async def _read_body(self, receive):
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+        return body
+
+    async def _send_json(self, send, status, response, headers=()):
+        payload = json.dumps(response).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode()), *headers],
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def _send_text(self, send, status, text):
+        payload = text.encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/plain; version=0.0.4'), (b'content-length', str(len(payload)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+
+
+journal_path = os.environ.get('HACKNET_JOURNAL')
+session_port = os.environ.get('HACKNET_SESSION_PORT')
+scheduler = None if os.environ.get('HACKNET_SCHEDULER') == '0' else CommandScheduler()
+app = AsyncServer(Journal.recover(journal_path) if journal_path else None, int(session_port) if session_port else None, scheduler)
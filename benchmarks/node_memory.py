@@ -0,0 +1,83 @@
+"""Reports the memory used per storage unit.
+
+Builds a tree of directories and files the way a snapshot load does
+(trusted constructors, no ids written to disk) and measures the memory
+allocated for it with tracemalloc. The same tree is also built with
+DictUnit, which mimics the former layout (a __dict__ per unit, string ids,
+filename and extension stored apart), as the baseline.
+
+Run it from the repository root:
+    python benchmarks/node_memory.py [number of files]
+"""
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.id_generator import IdGenerator
+from terminal_game.root_dir import RootDir
+from terminal_game.directory import Directory
+from terminal_game.file import File
+
+
+FILES_PER_DIRECTORY = 100
+
+
+class DictUnit(object):
+    """Storage unit laid out like before __slots__: every field in the instance __dict__."""
+
+    def __init__(self, suid, name, contents, parent):
+        self.SUID = suid
+        self.parent = parent
+        namesplit = name.split('.')
+        self.filename = namesplit[0] if len(namesplit) == 1 else '.'.join(namesplit[0:-1])
+        self.extension = None if len(namesplit) == 1 else namesplit[-1]
+        self.contents = contents
+
+
+def build_dict_units(n_files):
+    """Same tree as build, made of DictUnit."""
+
+    root = DictUnit('DIR-AAAA', '', {}, None)
+    directory = None
+    for i in range(n_files):
+        if i % FILES_PER_DIRECTORY == 0:
+            directory = DictUnit(f'DIR-{IdGenerator.generate_id(4)}', f'dir{i // FILES_PER_DIRECTORY}', {}, root)
+            root.contents[directory.filename] = directory
+        unit = DictUnit(f'FIL-{IdGenerator.generate_id(4)}', f'file{i % FILES_PER_DIRECTORY}.txt', 'contents', directory)
+        directory.contents[f'{unit.filename}.{unit.extension}'] = unit
+    return root
+
+
+def build(n_files):
+    """Returns a root directory holding n_files files spread over directories."""
+
+    root = RootDir.new_trusted('', {}, None)
+    directory = None
+    for i in range(n_files):
+        if i % FILES_PER_DIRECTORY == 0:
+            directory = Directory.new_trusted(f'dir{i // FILES_PER_DIRECTORY}', {}, root)
+            root.contents[directory.get_name()] = directory
+        unit = File.new_trusted(f'file{i % FILES_PER_DIRECTORY}.txt', 'contents', directory)
+        directory.contents[unit.get_name()] = unit
+    return root
+
+
+def main(n_files=100000):
+    IdGenerator.configure('none')
+    n_units = n_files + n_files // FILES_PER_DIRECTORY + 1
+
+    for label, builder in (('dict layout', build_dict_units), ('compact layout', build)):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        root = builder(n_files)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f'{label}: {n_units} storage units, {(after - before) / n_units:.1f} bytes per unit')
+        del root
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -1,14 +1,44 @@
-import json
-from types import resolve_bases
-import requests
-
-response = requests.post('http://127.0.0.1:5555/commands',data={
-    'func': 'cmd',
-    'info': json.dumps({
-        'id': '98.57.252.204',
-        'input': 'disconnect'
-    })
-})
-
-print(response.status_code)
-print(response.json())
\ No newline at end of file
+import sys
+import asyncio
+
+from utils import exceptions
+from terminal_game.session import SessionClient
+
+
+async def main(host, port, ip):
+    """Opens a session with the system with the given IP and runs the commands typed in."""
+
+    client = await SessionClient.connect(host, port)
+    try:
+        await client.attach(ip)
+    except exceptions.SessionError as e:
+        print(e.message)
+        return
+
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            line = await loop.run_in_executor(None, input, client.prompt)
+        except EOFError:
+            break
+        try:
+            response = await client.run(line)
+        except exceptions.SessionError as e:
+            print(e.message)
+            continue
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError) as e:
+            print(f'Session closed: {e}')
+            break
+        for output in (response['stdout'], response['stderr']):
+            if output:
+                print(output)
+    await client.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Syntax: python client.py <ip> [host] [port]')
+        sys.exit(1)
+    host = sys.argv[2] if len(sys.argv) > 2 else '127.0.0.1'
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else 5556
+    asyncio.run(main(host, port, sys.argv[1]))
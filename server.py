@@ -1,19 +1,33 @@
 #!venv/bin/python
 
+import os
 import json
+import math
 
 from types import new_class
-from utils import exceptions
+from utils.metrics import Metrics
 from utils.my_logging import get_logger
-from flask import Flask
+from flask import Flask, Response, request, stream_with_context
 from flask_restful import Api, Resource, reqparse
 from utils.my_logging import get_logger
 from terminal_game import internet
+from terminal_game.gateway import Gateway
+from terminal_game.journal import Journal
+from terminal_game.scheduler import CommandScheduler
+from terminal_game.shard import ShardedInternet
 
 
 logger = get_logger(__name__)
 
-web = internet.Internet()
+journal_path = os.environ.get('HACKNET_JOURNAL')
+shards = int(os.environ.get('HACKNET_SHARDS', 0))
+if shards:
+    web = ShardedInternet(shards, journal_path)
+elif journal_path:
+    web = Journal.recover(journal_path)
+else:
+    web = internet.Internet()
+gateway = Gateway(web, None if os.environ.get('HACKNET_SCHEDULER') == '0' else CommandScheduler())
 
 app = Flask(__name__)
 api = Api(app)
@@ -27,73 +41,55 @@ class Commands(Resource):
         
         args = parser.parse_args()
 
-        print(args)
+        logger.debug('Request: %s', args)
         func = args['func']
         info = json.loads(args['info'])
         
-        if func == 'new':
-            return self.new_os(info), 200
-        elif func == 'cmd':
-            return self.cmd(info), 200
-        elif func == 'new_line':
-            return self.new_line(info), 200
-
-    def new_os(self, info):
-        temp_id = info['temp_id']
-        try:
-            v_os = web.add_os(info['username'], info['password'])
-        except Exception as e:
-            return {
-                'id': temp_id,
-                'response_type': 'error',
-                'response': e.message
-            }
-        else:
-            return {
-                'id': temp_id,
-                'response_type': 'success',
-                'response': v_os.IP
-            }
-
-    def cmd(self, info):
-        ip = info['id']
-        inp = info['input']
-
-        try:
-            v_os = web.get_os_by_ip(ip)
-        except exceptions.OSNotFound as e:
-            return {
-                'id': ip,
-                'response_type': 'error',
-                'response': e.message
-            }
-        else:
-            return {
-                'id': ip,
-                'response_type': 'success',
-                'response': v_os.main_terminal.run_command([arg.strip() for arg in inp.split(' ')])
-            }
-
-    def new_line(self, info):
-        ip = info['id']
-
-        try:
-            v_os = web.get_os_by_ip(ip)
-        except exceptions.OSNotFound as e:
-            return {
-                'id': ip,
-                'response_type': 'error',
-                'response': e.message
-            }
-        else:
-            return {
-                'id': ip,
-                'response_type': 'success',
-                'response': v_os.main_terminal.new_line()
-            }
+        if func == 'stream':
+            return self.stream(info)
+        response = gateway.dispatch(func, info)
+        if 'retry_after' in response:
+            return response, 429, {'Retry-After': str(math.ceil(response['retry_after']))}
+        return response, 200
+
+    def stream(self, info):
+        """Streams the output of a tree command as plain text, one line at a time."""
+
+        response = gateway.stream(info)
+        if 'retry_after' in response:
+            return response, 429, {'Retry-After': str(math.ceil(response['retry_after']))}
+        if response['response_type'] != 'success':
+            return response, 200
+        return Response(stream_with_context(f'{line}\n' for line in response['response']), mimetype='text/plain')
+
+
+class BatchCommands(Resource):
+    def post(self):
+        """Runs a json list of new, cmd and new_line operations in order.
+
+        The body is either the list itself or a dict with the list under
+        'operations' and the error policy ('stop' or 'continue') under 'on_error'.
+        """
+
+        body = request.get_json(force=True, silent=True)
+        if isinstance(body, list):
+            body = {'operations': body}
+        if not isinstance(body, dict) or not isinstance(body.get('operations'), list):
+            return {'response_type': 'error', 'response': 'Body needs to be a json list of operations.', 'results': []}, 400
+        return gateway.batch(body['operations'], body.get('on_error', 'stop')), 200
+
+
+class CommandMetrics(Resource):
+    def get(self):
+        """Returns the command metrics in the Prometheus text format (merged from every worker in sharded mode)."""
+
+        registry = web.metrics() if shards else Metrics.registry
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
 
 
 api.add_resource(Commands, '/commands')
+api.add_resource(BatchCommands, '/commands/batch')
+api.add_resource(CommandMetrics, '/metrics')
 
 if __name__ == '__main__':
     app.run(port=5555)
\ No newline at end of file
@@ -1,3 +1,5 @@
+import threading
+
 from utils.id_generator import IdGenerator
 from utils import exceptions
 from utils.my_logging import get_logger
@@ -7,6 +9,8 @@ from terminal_game.file import File
 
 logger = get_logger(__name__)
 
+_materializing = threading.RLock()
+
 
 class Directory(StorageUnit):
     """Class representing a Directory in the virtual file system.
@@ -14,12 +18,23 @@ class Directory(StorageUnit):
     This class represents a Directory in the virtual file system.
     It needs to have a name, contents and a parent.
 
+    A directory can be backed by a directory of the shared base layer (the
+    cached os_root.json template). Its children are then only copied into
+    this directory the first time they are needed, so that untouched parts
+    of a file system cost nothing per OS. Materializing publishes the
+    copied children before dropping the base, so a reader that does not
+    materialize (see peek_contents, used by snapshots) sees one or the other.
+
     Attributes:
         name: string representing the name of the directory.
-        contents: list representing the contents of the directory.
+        contents: dict mapping names to the storage units in the directory, in insertion order.
         parent: directory which the current directory belongs to
     """
 
+    __slots__ = ('_base', '_generation')
+
+    ID_PREFIX = 'DIR'
+
     def __init__(self, name: str, contents, parent):
         """Initialized the directory using a name, contents and a parent.
         
@@ -29,85 +44,216 @@ class Directory(StorageUnit):
             parent -- parent of the directory
         """
 
-        super().__init__(f'DIR-{IdGenerator.generate_id(4)}', name, contents, parent)
+        super().__init__(self.generate_suid(), name, contents, parent)
+
+    def _init_slots(self):
+        """Gives the slots that have a default value their default."""
+
+        super()._init_slots()
+        self._base = None
+        self._generation = 0
+
+    @classmethod
+    def new_layered(cls, name: str, base, parent):
+        """Creates a directory backed by a directory of the shared base layer."""
+
+        dr = cls.new_trusted(name, {}, parent)
+        dr._base = base
+        return dr
+
+    def get_contents(self):
+        """Returns a list of the storage units in the directory."""
+
+        return list(self._index().values())
 
-    def bfs(self, depth=0):
+    def peek_contents(self):
+        """Returns the storage units in the directory without materializing the base layer.
+
+        Returns a pair of the units and a boolean telling whether they belong
+        to the shared base layer (and so must not be modified or handed out).
+        """
+
+        base = self._base
+        if base is not None:
+            return list(base._index().values()), True
+        return list(self.contents.values()), False
+
+    def peek_su(self, element_name):
+        """Returns the storage unit with the given name (None if there is none), without materializing the base layer."""
+
+        base = self._base
+        return (base._index() if base is not None else self.contents).get(element_name)
+
+    def has_su(self, element_name):
+        """Returns True if the directory contains a storage unit with the given name."""
+
+        return element_name in self._index()
+
+    def bfs(self, max_depth=None, max_entries=None):
         """Returns the contents of the directory in tree format."""
 
-        bfs = ''
-        for content in self.get_contents():
-            bfs += ('|    '*depth)
-            bfs += '| -- '
-            if isinstance(content, Directory):
-                bfs += f'{content.get_name()}\n'
-                bfs += content.bfs(depth+1)
-            elif isinstance(content, File):
-                bfs += f'{content.get_name()}\n'
-        return bfs
+        from terminal_game.tree import TreeRenderer
+        return ''.join(f'{line}\n' for line in TreeRenderer(self, max_depth, max_entries).lines())
 
     def is_sub_su(self, storage_unit):
-        """Checks if another storage unit is a sub SU of the current directory."""
+        """Checks if another storage unit is inside the current directory, at any depth.
+
+        Walks up the parents of the storage unit once, stopping at the
+        current directory or at the root, instead of scanning the subtree.
+        """
 
-        for content in self.get_contents():
-            if content == storage_unit:
+        parent = storage_unit.get_parent()
+        while parent is not None:
+            if parent is self:
                 return True
-            if isinstance(content, Directory):
-                return content.is_sub_su(storage_unit)
+            parent = parent.get_parent()
         return False
 
+    def get_depth(self):
+        """Returns the number of directories above the current one."""
+
+        depth = -1
+        node = self
+        while node is not None:
+            depth += 1
+            node = node.parent
+        return depth
+
     def add(self, storage_unit):
         """Adds an object of type StorageUnit to the contents of the directory."""
         
         self._validate_directory_element(storage_unit)
-        self.contents.append(storage_unit)
+        self._index()[storage_unit.get_name()] = storage_unit
         storage_unit.set_parent(self)
-        logger.info(f'Added storage unit with id {storage_unit.get_id()}, name "{storage_unit.get_name()}" and contents {storage_unit.get_contents()} to {self.__class__.__name__} with id {self.SUID}.')
+        self._bump_generation()
+        logger.debug('Added storage unit with id %s, name "%s" to %s with id %s.', storage_unit.get_id(), storage_unit.get_name(), self.__class__.__name__, self.SUID)
 
     def delete(self, storage_unit_name):
         """Deleted the storage unit with the given name"""
 
         unit = self.get_su_by_name(storage_unit_name)
-        self.contents.remove(unit)
-        logger.info(f'Deleted storage unit with id {unit.get_id()} from {self.__class__.__name__} with id {self.SUID}.')
+        del self.contents[storage_unit_name]
+        self._bump_generation()
+        unit._changed()
+        logger.debug('Deleted storage unit with id %s from %s with id %s.', unit.get_id(), self.__class__.__name__, self.SUID)
+
+    def discard(self):
+        """Releases the contents of every file below a directory removed from the file system.
+
+        The shared base layer is not owned by the directory and is left alone.
+        """
 
-    def get_path(self):
-        """Returns the absolute path of directory."""
+        stack = [self]
+        while stack:
+            for unit in stack.pop().contents.values():
+                if isinstance(unit, Directory):
+                    stack.append(unit)
+                else:
+                    unit.discard()
 
-        return f'{self.get_parent().get_path()}{self.get_name()}/'
+    def _set_topology(self, topology):
+        """Makes the directory and the units materialized below it part of the file system a Topology belongs to."""
+
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node._topology = topology
+            if isinstance(node, Directory):
+                stack.extend((getattr(node, 'contents', None) or {}).values())
+
+    def _path_segment(self):
+        """Returns what the directory adds to the path of its parent."""
+
+        return f'{self.get_name()}/'
 
     def get_su_by_name(self, element_name):
         """Returns element with given name from contents."""
         
-        elements = list(filter(lambda e: e.get_name() == element_name, self.contents))
-        if len(elements) > 0:
-            return elements[0]
-        logger.warning(f'SU with name "{element_name}" not found in {self.__class__.__name__} with id {self.SUID}.')
+        element = self._index().get(element_name)
+        if element is not None:
+            return element
+        logger.debug('SU with name "%s" not found in %s with id %s.', element_name, self.__class__.__name__, self.SUID)
         raise exceptions.SUNotFound(f'SU with name {element_name} not found.', element_name)
 
     def set_contents(self, contents):
-        """Sets the self.contents attribute to contents."""
+        """Sets the self.contents attribute to contents, discarding the storage units left out."""
 
         self._validate_contents(contents)
-        self.contents = []
+        old = getattr(self, 'contents', None) or {}
+        self._base = None
+        self.contents = {}
         for element in contents:
             self._validate_directory_element(element)
-            self.contents.append(element)
-        logger.info(f'Setting contents for {self.__class__.__name__} with id {self.SUID} to {[content.get_name() for content in self.contents]}.')
+            self.contents[element.get_name()] = element
+        for unit in old.values():
+            if unit.get_parent() is self and self.contents.get(unit.get_name()) is not unit:
+                unit.discard()
+        self._bump_generation()
+        logger.debug('Setting contents for %s with id %s to %s storage units.', self.__class__.__name__, self.SUID, len(self.contents))
+
+    def rename_su(self, storage_unit, old_name):
+        """Moves a storage unit that was renamed to its new name in the index."""
+
+        if self.contents.get(old_name) is storage_unit:
+            del self.contents[old_name]
+            self.contents[storage_unit.get_name()] = storage_unit
+            self._bump_generation()
+
+    def get_generation(self):
+        """Returns a counter that changes whenever a storage unit is added to, deleted from or renamed in the directory itself."""
+
+        return self._generation
+
+    def _bump_generation(self):
+        """Changes the generation of the directory (only, so a change costs the same at any depth) and counts the change in its Topology."""
+
+        self._generation += 1
+        self._topology.changed()
+
+    def _index(self):
+        """Returns the dict mapping names to storage units, materializing the base layer first if needed."""
+
+        if self._base is not None:
+            self._materialize()
+        return self.contents
+
+    def _materialize(self):
+        """Copies the children of the base layer into this directory.
+
+        Child directories are copied as directories backed by the matching
+        base directory, so only one level is materialized at a time. File
+        contents are immutable and shared with the base layer.
+        """
+
+        with _materializing:
+            base = self._base
+            if base is None:
+                return
+            children = base._index()
+            IdGenerator.reserve(len(children), StorageUnit.ID_LENGTH)
+            contents = {}
+            for name, content in children.items():
+                if isinstance(content, Directory):
+                    contents[name] = Directory.new_layered(name, content, self)
+                else:
+                    contents[name] = content.__class__.new_trusted(name, content.get_stored(), self)
+            self.contents = contents
+            self._base = None
 
     def _validate_contents(self, contents):
         """Raises appropriate exception if directory contents are of invalid type."""
 
-        logger.info(f'Validating contents for {self.__class__.__name__} with id {self.SUID}.')
+        logger.debug('Validating contents for %s with id %s.', self.__class__.__name__, self.SUID)
         if not isinstance(contents, list):
             raise exceptions.SUInvalidContents('Directory contents need to be of type list.', contents)
 
     def _validate_directory_element(self, storage_unit):
         """Raises appropriate exception if directory element is not of valid type."""
 
-        logger.info(f'Validating storage unit to add it to {self.__class__.__name__} with id {self.SUID}.')        
+        logger.debug('Validating storage unit to add it to %s with id %s.', self.__class__.__name__, self.SUID)        
         if not isinstance(storage_unit, StorageUnit):
             raise exceptions.SUDirectoryElementError('Directory element needs to be of type StorageUnit.', storage_unit)
-        if storage_unit.get_name() in [unit.get_name() for unit in self.get_contents()]:
+        if self.has_su(storage_unit.get_name()):
             raise exceptions.SUDirectoryElementError('Another storage unit with this name already exists in this directory.', storage_unit.get_name())
 
         
\ No newline at end of file
@@ -1,4 +1,7 @@
-from utils.id_generator import IdGenerator
+import codecs
+
+from utils.blob_store import Blob, BlobStore
+from utils.content_pool import ContentPool
 from utils import exceptions
 from utils.my_logging import get_logger
 from terminal_game.storage_unit import StorageUnit
@@ -15,10 +18,14 @@ class File(StorageUnit):
 
     Attributes:
         name: string representing the name of the file.
-        contents: represent the contents of the file.
+        contents: represent the contents of the file, shared through the ContentPool (a Blob handle for large contents).
         parent: Directory which the file belongs to.
     """
 
+    __slots__ = ()
+
+    ID_PREFIX = 'FIL'
+
     def __init__(self, name: str, contents, parent):
         """Inits the file using name, contents and a parent.
         
@@ -28,21 +35,146 @@ class File(StorageUnit):
             parent -- parent of the file (must be a Directory).
         """
         
-        super().__init__(f'FIL-{IdGenerator.generate_id(4)}', name, contents, parent)
+        super().__init__(self.generate_suid(), name, contents, parent)
+
+    @classmethod
+    def new_trusted(cls, name: str, contents, parent, suid=None):
+        """Creates a file from values already known to be valid, taking a reference to its contents in the ContentPool."""
+
+        return super().new_trusted(name, ContentPool.intern(contents), parent, suid)
+
+    @property
+    def filename(self):
+        """Returns the name of the file without its extension."""
+
+        namesplit = self.name.split('.')
+        return namesplit[0] if len(namesplit) == 1 else '.'.join(namesplit[0:-1])
+
+    @property
+    def extension(self):
+        """Returns the extension of the file (None if it has none)."""
+
+        namesplit = self.name.split('.')
+        return None if len(namesplit) == 1 else namesplit[-1]
+
+    @classmethod
+    def normalize_name(cls, name: str):
+        """Returns the name without a trailing dot (an empty extension)."""
+
+        return name[:-1] if name.endswith('.') else name
+
+    def set_contents(self, contents):
+        """Sets the contents of the file to their canonical copy in the ContentPool.
+
+        Arguments:
+            contents -- str, bytes, or the stored contents of another file (shared without copying).
+        """
+
+        if not isinstance(contents, Blob):
+            self._validate_contents(contents)
+        old = getattr(self, 'contents', None)
+        self.contents = ContentPool.intern(contents)
+        ContentPool.release(old)
+        self._changed()
+        logger.debug('Setting contents for %s with id %s.', self.__class__.__name__, self.SUID)
 
-    def set_name(self, name: str):
-        """Splits name into filename and extension and stores them."""
+    def discard(self):
+        """Releases the contents of a file removed from the file system, leaving it empty.
 
-        self._validate_name(name)
-        namesplit = name.split('.')
-        self.filename = namesplit[0] if len(namesplit) == 1 else '.'.join(namesplit[0:-1])
-        self.extension = None if len(namesplit) == 1 else namesplit[-1]
-        logger.info(f'Setting name for {self.__class__.__name__} with id {self.SUID} to "{name}".')
+        Files do not release their contents when they are garbage collected,
+        so whatever removes a file for good has to call this.
+        """
+
+        ContentPool.release(self.contents)
+        self.contents = ContentPool.intern('')
+
+    def _set_stored(self, contents):
+        """Sets contents the caller already took a reference to in the ContentPool, releasing the previous ones."""
+
+        old = self.contents
+        self.contents = contents
+        if old is not contents:
+            ContentPool.release(old)
+        self._changed()
+
+    def get_contents(self):
+        """Returns the contents of the file, reading them from the blob store if needed."""
+
+        contents = self.contents
+        return contents.materialize() if isinstance(contents, Blob) else contents
+
+    def get_stored(self):
+        """Returns the contents as stored: a Blob handle for contents in the blob store, else the str or bytes."""
+
+        return self.contents
 
-    def get_name(self):
-        """returns the name of the file."""
+    def get_view(self):
+        """Returns a read-only memoryview over the encoded contents, without copying them out of the blob store."""
 
-        return f'{self.filename}.{self.extension}' if self.extension else self.filename
+        contents = self.contents
+        if isinstance(contents, Blob):
+            return contents.view()
+        return memoryview(contents.encode('utf-8') if isinstance(contents, str) else contents)
+
+    def is_text(self):
+        """Returns True if the contents are text, False if they are bytes."""
+
+        contents = self.contents
+        return contents.text if isinstance(contents, Blob) else isinstance(contents, str)
+
+    def get_size(self):
+        """Returns the size of the contents in bytes."""
+
+        contents = self.contents
+        if isinstance(contents, (Blob, bytes)):
+            return len(contents)
+        return len(contents.encode('utf-8'))
+
+    def iter_lines(self, chunk_size=64 << 10):
+        """Yields the lines of a text file one at a time, without their line endings (see lines)."""
+
+        return File.lines(self.contents, chunk_size)
+
+    @staticmethod
+    def lines(contents, chunk_size=64 << 10):
+        """Yields the lines of stored contents (as returned by get_stored) one at a time, without their line endings.
+
+        Contents in the blob store are decoded chunk_size bytes at a time, so
+        only the line being yielded is ever copied out of the arena. Byte
+        contents are yielded as a single line, as cat shows them.
+        """
+
+        if isinstance(contents, bytes):
+            yield str(contents)
+            return
+        if isinstance(contents, str):
+            pos = 0
+            while pos < len(contents):
+                end = contents.find('\n', pos)
+                if end == -1:
+                    end = len(contents)
+                yield contents[pos:end]
+                pos = end + 1
+            return
+        if not contents.text:
+            yield str(contents.materialize())
+            return
+
+        view = contents.view()
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        rest = ''
+        for start in range(0, len(view), chunk_size):
+            lines = (rest + decoder.decode(view[start:start + chunk_size])).split('\n')
+            rest = lines.pop()
+            yield from lines
+        rest += decoder.decode(b'', final=True)
+        if rest:
+            yield rest
+
+    def appender(self, truncate=False):
+        """Returns a FileAppender adding text to the end of the file (or replacing its contents if truncate)."""
+
+        return FileAppender(self, truncate)
 
     def replace(self, old: str, new: str, count=None):
         """Replaces a part of the contents with something else.
@@ -53,19 +185,153 @@ class File(StorageUnit):
             count -- (optional) how many of old to replace with new.
         """
 
-        if isinstance(self.get_contents(), bytes):
+        if not self.is_text():
             raise TypeError('Cannot replace contents of a byte file.')
         if not (isinstance(old, str) and isinstance(new, str)):
             raise TypeError('Both arguments need to be of type str.', old, new)
 
-        self.contents = self.contents.replace(old, new, count) if count else self.get_contents().replace(old, new)
-        logger.info(f'Replaced "{old}" with "{new}" in the contents of {self.__class__.__name__} with id {self.SUID}.')
+        contents = self.get_contents()
+        self.set_contents(contents.replace(old, new, count) if count else contents.replace(old, new))
+        logger.debug('Replaced "%s" with "%s" in the contents of %s with id %s.', old, new, self.__class__.__name__, self.SUID)
 
     def _validate_contents(self, contents):
         """Raises appropriate exception if file contents are of invalid type."""
 
         super()._validate_contents(contents)
-        logger.info(f'Validating contents for {self.__class__.__name__} with id {self.SUID}.')
+        logger.debug('Validating contents for %s with id %s.', self.__class__.__name__, self.SUID)
         if isinstance(contents, list):
             raise exceptions.SUInvalidContents('File contents need to be of type str or bytes.', contents)
-        
\ No newline at end of file
+        
+
+class FileAppender(object):
+    """Appends text to a file in chunks.
+
+    Written text is buffered and encoded in chunks of CHUNK_SIZE characters.
+    With the blob store enabled (or when the file already lives in the
+    arena), each chunk is appended straight to a blob: the blob of the file
+    itself if no other file shares it, grown in place, else a new blob the
+    existing contents are copied to once. Without the blob store, the chunks
+    are joined a single time when the appender is closed.
+
+    The file is only updated when the appender is closed, and contents
+    smaller than the blob store threshold end up as a plain str again. Use it
+    as a context manager; nothing is written if the block raises. Readers
+    that started before (e.g. cat a >> a) keep seeing the contents they
+    started with.
+
+    Attributes:
+        file: file the text is appended to.
+    """
+
+    CHUNK_SIZE = 64 << 10
+
+    def __init__(self, file, truncate=False):
+        """Raises TypeError when appending to a byte file."""
+
+        if not truncate and not file.is_text():
+            raise TypeError('Cannot append text to a byte file.')
+        self.file = file
+        self._truncate = truncate
+        self._chunks = []
+        self._buffer = []
+        self._buffered = 0
+        self._blob = None
+        self._owned = False
+        self._length = 0
+        self._retired = []
+
+    def write(self, text):
+        """Adds text to the end of the file."""
+
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= FileAppender.CHUNK_SIZE:
+            self._flush()
+
+    def close(self):
+        """Sets the contents of the file to everything written."""
+
+        if self._blob is None and not self._in_arena():
+            self._flush()
+            contents = self._chunks if self._truncate else [self.file.get_contents()] + self._chunks
+            self.file.set_contents(''.join(contents))
+            self._chunks = []
+            return
+
+        self._flush(True)
+        blob, self._blob = self._blob, None
+        arena = blob.arena
+        arena.trim(blob)
+        arena.release(self._retired)
+        self._retired = []
+        if blob.length < BlobStore.threshold:
+            contents = blob.materialize()
+            arena.free(blob)
+            self.file._set_stored(ContentPool.intern(contents))
+        else:
+            self.file._set_stored(ContentPool.adopt(blob))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.close()
+        else:
+            self._abort()
+
+    def _in_arena(self):
+        """Returns True if the written text goes to a blob rather than to a list of chunks."""
+
+        if BlobStore.arena is not None:
+            return True
+        return not self._truncate and isinstance(self.file.get_stored(), Blob)
+
+    def _flush(self, final=False):
+        """Moves the buffered text to the blob (opening it first if needed), or to the list of chunks."""
+
+        if self._buffer:
+            self._chunks.append(''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+        if self._blob is None and (final or self._in_arena()):
+            self._open_blob()
+        if self._blob is not None:
+            for chunk in self._chunks:
+                self._blob.arena.append(self._blob, chunk.encode('utf-8'), self._retired)
+            self._chunks = []
+
+    def _open_blob(self):
+        """Starts writing to the blob of the file if nothing shares it, else to a new blob holding the existing contents."""
+
+        stored = None if self._truncate else self.file.get_stored()
+        if isinstance(stored, Blob) and ContentPool.detach(stored):
+            self._blob, self._owned, self._length = stored, True, stored.length
+            return
+
+        if stored is None:
+            existing = b''
+        elif isinstance(stored, Blob):
+            existing = stored.view()
+        else:
+            existing = stored.encode('utf-8')
+        arena = stored.arena if isinstance(stored, Blob) else BlobStore.arena
+        self._blob = arena.reserve(len(existing) + FileAppender.CHUNK_SIZE, True)
+        arena.append(self._blob, existing, self._retired)
+
+    def _abort(self):
+        """Drops everything written, giving the file its own blob back unchanged."""
+
+        blob, self._blob = self._blob, None
+        self._chunks = []
+        self._buffer = []
+        if blob is None:
+            return
+        arena = blob.arena
+        if self._owned:
+            arena.trim(blob, self._length)
+            self.file._set_stored(ContentPool.adopt(blob))
+        else:
+            arena.free(blob)
+        arena.release(self._retired)
+        self._retired = []
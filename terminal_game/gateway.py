@@ -0,0 +1,181 @@
+from utils import exceptions
+from utils.my_logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class Gateway(object):
+    """Runs the requests of the /commands API against an Internet.
+
+    This class holds the request handling that does not depend on the web
+    framework, so that single requests and batches go through the same code.
+
+    Attributes:
+        internet: Internet the requests are run against.
+        scheduler: CommandScheduler admitting the commands (None to run them right away).
+    """
+
+    BATCH_POLICIES = ('stop', 'continue')
+
+    def __init__(self, internet, scheduler=None):
+        """Initializes the gateway using the internet the requests are run against and an optional scheduler."""
+
+        self.internet = internet
+        self.scheduler = scheduler
+        if scheduler:
+            internet.on_remove(scheduler.forget)
+        self.funcs = {
+            'new': self.new_os,
+            'cmd': self.cmd,
+            'new_line': self.new_line,
+        }
+
+    def dispatch(self, func, info):
+        """Runs a single request and returns its response."""
+
+        try:
+            handler = self.funcs[func]
+        except KeyError:
+            return self._response(info.get('id') if isinstance(info, dict) else None, 'error', f'Unknown func {func}.')
+        return handler(info)
+
+    def batch(self, operations, on_error='stop'):
+        """Runs a list of requests in order and returns all their responses.
+
+        Arguments:
+            operations -- list of dicts, each with a func and its info.
+            on_error -- 'stop' to skip the operations sent to a system after one of them failed, 'continue' to run them all.
+
+        An operation fails if its response is an error, or if it runs a
+        command that exits with a non zero exit code. Operations are ordered
+        per system (see sequence): with 'stop', a failure only skips the
+        later operations of the same sequence.
+        """
+
+        if on_error not in Gateway.BATCH_POLICIES:
+            return {'response_type': 'error', 'response': f'on_error needs to be one of {Gateway.BATCH_POLICIES}.', 'results': []}
+
+        results = []
+        failed = 0
+        stopped = set()
+        for operation in operations:
+            sequence = self.sequence(operation)
+            if sequence in stopped and on_error == 'stop':
+                results.append(self.skipped(operation))
+                continue
+            try:
+                result = self.dispatch(operation['func'], operation['info'])
+            except (KeyError, TypeError, AttributeError):
+                result = self.malformed()
+            results.append(result)
+            if self.failed(result):
+                failed += 1
+                stopped.add(sequence)
+
+        return self.batch_response(results, failed)
+
+    def sequence(self, operation):
+        """Returns the key of the sequence an operation of a batch belongs to.
+
+        Operations are keyed by the id of the system they are sent to.
+        Operations without one (new, or malformed ones) share the None key.
+        """
+
+        info = operation.get('info') if isinstance(operation, dict) else None
+        return info.get('id') if isinstance(info, dict) else None
+
+    def skipped(self, operation):
+        """Returns the response of an operation skipped because of the batch policy."""
+
+        return self._response(self.sequence(operation), 'skipped', None)
+
+    def malformed(self):
+        """Returns the response of an operation missing its func or info."""
+
+        return self._response(None, 'error', 'Operations need a func and an info.')
+
+    def failed(self, result):
+        """Returns True if a response counts as a failure for the batch policy."""
+
+        if result['response_type'] != 'success':
+            return True
+        response = result['response']
+        return isinstance(response, dict) and response.get('exit_code', 0) != 0
+
+    def batch_response(self, results, failed):
+        """Returns the response of a whole batch."""
+
+        return {
+            'response_type': 'error' if failed else 'success',
+            'response': f'{failed} operations failed.' if failed else None,
+            'results': results,
+        }
+
+    def new_os(self, info):
+        temp_id = info['temp_id']
+        try:
+            v_os = self.internet.add_os(info['username'], info['password'])
+        except Exception as e:
+            return self._response(temp_id, 'error', getattr(e, 'message', str(e)))
+        return self._response(temp_id, 'success', v_os.IP)
+
+    def cmd(self, info):
+        ip = info['id']
+        inp = info['input']
+
+        try:
+            v_os = self.internet.get_os_by_ip(ip)
+        except exceptions.OSNotFound as e:
+            return self._response(ip, 'error', e.message)
+        args = [arg.strip() for arg in inp.split(' ')]
+        return self._scheduled(ip, v_os, lambda: v_os.main_terminal.run_counted(args))
+
+    def stream(self, info):
+        """Runs a tree command and returns its output lines as a list, to be streamed by the front-end.
+
+        The lines are produced at once (at most TREE_MAX_ENTRIES of them), so
+        the command goes through the scheduler like any other and does not
+        hold a slot while a slow client reads them.
+        """
+
+        ip = info['id']
+        inp = info['input']
+
+        try:
+            v_os = self.internet.get_os_by_ip(ip)
+        except exceptions.OSNotFound as e:
+            return self._response(ip, 'error', e.message)
+        args = [arg.strip() for arg in inp.split(' ')]
+        if args[0] != 'tree':
+            return self._response(ip, 'error', 'Only the tree command can be streamed.')
+        return self._scheduled(ip, v_os, lambda: v_os.main_terminal.collect_tree(args[1:]))
+
+    def new_line(self, info):
+        ip = info['id']
+
+        try:
+            v_os = self.internet.get_os_by_ip(ip)
+        except exceptions.OSNotFound as e:
+            return self._response(ip, 'error', e.message)
+        return self._response(ip, 'success', v_os.main_terminal.new_line())
+
+    def _scheduled(self, ip, v_os, func):
+        """Runs func (returning a result and the storage units it touched) through the scheduler. Returns the response."""
+
+        if not self.scheduler:
+            return self._response(ip, 'success', func()[0])
+        try:
+            response = self.scheduler.run(v_os.IP, func)
+        except exceptions.CommandThrottled as e:
+            throttled = self._response(ip, 'error', e.message)
+            throttled['retry_after'] = round(e.info[0], 3)
+            return throttled
+        return self._response(ip, 'success', response)
+
+    def _response(self, id, response_type, response):
+        return {
+            'id': id,
+            'response_type': response_type,
+            'response': response
+        }
@@ -0,0 +1,56 @@
+from utils.my_logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class IntegrityGuard(object):
+    """Keeps track of changes to the system files of an operating system.
+
+    The guard watches the storage units holding the system files. Every change
+    to one of them (contents, name, parent or removal from its directory)
+    bumps the version counter, so the system files only need to be checked
+    again when the version differs from the one they were last verified at.
+
+    Attributes:
+        version: counter bumped on every change to a watched storage unit.
+        verified_version: version the system files were last verified at (-1 if they are not valid).
+        terminal_class: terminal class loaded from the system files at the last verification.
+    """
+
+    def __init__(self):
+        """Initializes a guard that is not watching anything yet."""
+
+        self.version = 0
+        self.verified_version = -1
+        self.terminal_class = None
+        self._watched = []
+
+    def is_verified(self):
+        """Returns True if nothing changed since the last successful verification."""
+
+        return self.version == self.verified_version
+
+    def changed(self):
+        """Called by a watched storage unit whenever it changes."""
+
+        self.version += 1
+
+    def verified(self, units, terminal_class):
+        """Records a successful verification of the given storage units."""
+
+        for unit in self._watched:
+            unit.remove_watcher(self)
+        self._watched = list(units)
+        for unit in self._watched:
+            unit.add_watcher(self)
+
+        self.terminal_class = terminal_class
+        self.verified_version = self.version
+        logger.debug('System files verified at version %s.', self.version)
+
+    def invalidate(self):
+        """Marks the system files as not valid, so that they are checked again."""
+
+        self.verified_version = -1
+        self.terminal_class = None
@@ -1,5 +1,7 @@
 from utils import exceptions
+from utils.metrics import Metrics
 from utils.my_logging import get_logger
+from utils.ip_registry import IpRegistry
 from terminal_game.system import System
 
 
@@ -8,15 +10,75 @@ logger = get_logger(__name__)
 
 class Internet(object):
     def __init__(self):
-        self.operating_systems = []
+        self.ip_registry = IpRegistry()
+        self.journal = None
+        self._removal_hooks = []
 
-    def add_os(self, username, password):
-        os = System(self, username, password)
-        self.operating_systems.append(os)
+    @property
+    def operating_systems(self):
+        return list(self.ip_registry.systems())
+
+    def add_os(self, username, password, ip=None):
+        """Creates a system and gives it a free IP, or the given one (e.g. when replaying the journal)."""
+
+        if self.journal:
+            with self.journal.mutating():
+                os = self._add_os(username, password, ip)
+                self.journal.append(self.journal.NEW, os.IP, [username, password])
+            self.journal.maybe_checkpoint()
+            return os
+        return self._add_os(username, password, ip)
+
+    def _add_os(self, username, password, ip):
+        ip = self.ip_registry.claim(ip) if ip else self.ip_registry.allocate()
+        try:
+            os = System(self, username, password, ip)
+        except Exception:
+            self.ip_registry.release(ip)
+            raise
+        self.ip_registry.register(ip, os)
+        return os
+
+    def remove_os(self, ip):
+        """Tears down the system with the given IP and releases its address."""
+
+        os = self.get_os_by_ip(ip)
+        if os.main_terminal.connected_to:
+            os.main_terminal.connected_to._disconnect([])
+        for term in list(os.terminals):
+            if term.opened_by != os:
+                term._disconnect([])
+        if self.journal:
+            with self.journal.mutating():
+                self.ip_registry.release(ip)
+                self.journal.append(self.journal.REMOVE, ip)
+        else:
+            self.ip_registry.release(ip)
+        os.search_index.clear()
+        os.root.discard()
+        Metrics.registry.forget(ip)
+        for hook in self._removal_hooks:
+            hook(ip)
+        logger.info('Removed OS with ip %s.', ip)
         return os
 
+    def on_remove(self, hook):
+        """Registers a function called with the IP of every system removed from the internet."""
+
+        self._removal_hooks.append(hook)
+
     def get_os_by_ip(self, ip):
-        for os in self.operating_systems:
-            if os.IP == ip:
-                return os
-        raise exceptions.OSNotFound('os not found.', ip)
\ No newline at end of file
+        return self.ip_registry.lookup(ip)
+
+    def snapshot(self, path):
+        """Saves every system, terminal state and directory tree to a binary snapshot file."""
+
+        from terminal_game import snapshot
+        snapshot.save(self, path)
+
+    @classmethod
+    def restore(cls, path):
+        """Returns a new internet loaded from a snapshot file written by snapshot."""
+
+        from terminal_game import snapshot
+        return snapshot.load(path, cls())
@@ -0,0 +1,362 @@
+import os
+import glob
+import zlib
+import struct
+import threading
+
+from utils import exceptions
+from utils.ip_registry import IpRegistry
+from utils.my_logging import get_logger
+
+
+logger = get_logger(__name__)
+
+_HEADER = struct.Struct('<II')
+_RECORD = struct.Struct('<BII')
+_U32 = struct.Struct('<I')
+_VERSION = struct.Struct('<H')
+
+SEGMENT_MAGIC = b'HNWL'
+SEGMENT_VERSION = 1
+
+
+class Journal(object):
+    """Write-ahead log of every change made to the systems of an internet.
+
+    Each mutating terminal command (and each system created or removed) is
+    appended as a compact binary record: u32 payload length, u32 crc32 of
+    the payload, then u8 kind, u32 packed IP, u32 number of strings and the
+    strings themselves (u32 length + utf-8). A command record holds the path
+    of the terminal's directory followed by the command and its arguments.
+    Segments start with the magic b'HNWL' and a u16 version.
+
+    Records are written with group commit: a caller appending a record
+    blocks until the record is fsynced. The first caller to find no commit
+    in progress writes and fsyncs every waiting record at once, and the
+    records appended meanwhile wait for the next group.
+
+    The log is split in numbered segments. A checkpoint starts a new segment,
+    saves a snapshot of the internet named after that segment and deletes the
+    older segments and snapshots. Recovery loads the latest snapshot and
+    replays the segments written after it.
+
+    Attributes:
+        path: base path of the segment and snapshot files.
+        checkpoint_every: number of records after which a checkpoint is taken (never if None).
+    """
+
+    NEW = 0
+    CMD = 1
+    REMOVE = 2
+
+    MUTATING_COMMANDS = ('mkdir', 'touch', 'rm', 'mv', 'cp', 'write', 'replace')
+    MAX_RECORD = 64 << 20
+
+    def __init__(self, path, checkpoint_every=10000):
+        """Opens a new segment after the existing ones.
+
+        Arguments:
+            path -- base path of the segment and snapshot files.
+            checkpoint_every -- number of records after which a checkpoint is taken (never if None).
+        """
+
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.internet = None
+
+        self._buffer = []
+        self._appended = 0
+        self._durable = 0
+        self._committing = False
+        self._since_checkpoint = 0
+        self._lock = threading.Lock()
+        self._committed = threading.Condition(self._lock)
+        self._gate = threading.Condition()
+        self._mutations = 0
+        self._checkpointing = False
+
+        numbered = Journal.segments(path) + Journal.snapshots(path)
+        self._segment = max(number for number, _ in numbered) + 1 if numbered else 0
+        self._file = self._open_segment(self._segment)
+
+    def attach(self, internet):
+        """Starts logging the changes made to an internet."""
+
+        self.internet = internet
+        internet.journal = self
+
+    def append(self, kind, ip, strings=()):
+        """Logs a record and returns once it is fsynced."""
+
+        self.write(Journal.encode(kind, ip, strings))
+
+    @staticmethod
+    def encode(kind, ip, strings=()):
+        """Returns a record ready to be written.
+
+        Raises JournalError if the record is larger than MAX_RECORD, so that a
+        change can be refused before it is made.
+        """
+
+        payload = [_RECORD.pack(kind, IpRegistry.pack(ip), len(strings))]
+        size = _RECORD.size
+        for string in strings:
+            data = string.encode('utf-8')
+            size += _U32.size + len(data)
+            if size > Journal.MAX_RECORD:
+                raise exceptions.JournalError(f'Journal records cannot be larger than {Journal.MAX_RECORD} bytes.', size)
+            payload.append(_U32.pack(len(data)))
+            payload.append(data)
+        payload = b''.join(payload)
+        return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def write(self, record):
+        """Writes a record returned by encode and returns once it is fsynced, committing the waiting group if no commit is in progress."""
+
+        with self._lock:
+            self._buffer.append(record)
+            self._appended += 1
+            self._since_checkpoint += 1
+            ticket = self._appended
+            while self._durable < ticket:
+                if self._committing:
+                    self._committed.wait()
+                else:
+                    self._commit_group()
+
+    def mutating(self):
+        """Returns a context manager to hold while a command changes a system.
+
+        Checkpoints wait for every change in progress to be over, so that
+        a snapshot never holds half of a command.
+        """
+
+        return _Mutation(self)
+
+    def commit(self):
+        """Writes and fsyncs every waiting record."""
+
+        with self._lock:
+            self._commit()
+
+    def maybe_checkpoint(self):
+        """Takes a checkpoint if enough records were written since the last one."""
+
+        if self.checkpoint_every is not None and self._since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Saves a snapshot of the internet and drops the segments it makes useless."""
+
+        with self._gate:
+            while self._checkpointing:
+                self._gate.wait()
+            self._checkpointing = True
+            while self._mutations:
+                self._gate.wait()
+
+        try:
+            with self._lock:
+                self._commit()
+                self._file.close()
+                self._segment += 1
+                self._file = self._open_segment(self._segment)
+                self._since_checkpoint = 0
+            self.internet.snapshot(self._snapshot_path(self._segment))
+        finally:
+            with self._gate:
+                self._checkpointing = False
+                self._gate.notify_all()
+
+        for number, segment_path in Journal.segments(self.path):
+            if number < self._segment:
+                os.remove(segment_path)
+        for number, snapshot_path in Journal.snapshots(self.path):
+            if number < self._segment:
+                os.remove(snapshot_path)
+        logger.info('Checkpoint taken at segment %s.', self._segment)
+
+    def close(self):
+        """Commits the waiting records and closes the segment."""
+
+        with self._lock:
+            self._commit()
+            self._file.close()
+
+    @staticmethod
+    def recover(path, internet_class=None, **kwargs):
+        """Returns an internet rebuilt from the latest checkpoint and the segments written after it.
+
+        Replay stops at the first torn or corrupted record. The returned
+        internet logs to a new journal opened at path with the given options.
+        """
+
+        if internet_class is None:
+            from terminal_game.internet import Internet
+            internet_class = Internet
+
+        snapshots = Journal.snapshots(path)
+        if snapshots:
+            first_segment, snapshot_path = snapshots[-1]
+            internet = internet_class.restore(snapshot_path)
+        else:
+            first_segment, internet = 0, internet_class()
+
+        replayed = 0
+        for number, segment_path in Journal.segments(path):
+            if number < first_segment:
+                continue
+            for kind, ip, strings in Journal.records(segment_path):
+                Journal._replay(internet, kind, ip, strings)
+                replayed += 1
+        logger.info('Replayed %s journal records.', replayed)
+
+        Journal(path, **kwargs).attach(internet)
+        return internet
+
+    @staticmethod
+    def records(segment_path):
+        """Yields the (kind, ip, strings) records of a segment, stopping at the first torn one.
+
+        Raises JournalError if the segment does not start with the magic and
+        version of this format (an empty segment holds no records).
+        """
+
+        with open(segment_path, 'rb') as f:
+            data = f.read()
+        if not data:
+            return
+
+        pos = len(SEGMENT_MAGIC) + _VERSION.size
+        if not data.startswith(SEGMENT_MAGIC) or len(data) < pos:
+            raise exceptions.JournalError('Not a journal segment.', segment_path)
+        version = _VERSION.unpack_from(data, len(SEGMENT_MAGIC))[0]
+        if version != SEGMENT_VERSION:
+            raise exceptions.JournalError(f'Unsupported journal segment version {version}.', segment_path)
+        while pos + _HEADER.size <= len(data):
+            length, crc = _HEADER.unpack_from(data, pos)
+            payload = data[pos + _HEADER.size:pos + _HEADER.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                logger.warning('Torn record at offset %s of %s, ignoring the rest.', pos, segment_path)
+                return
+            pos += _HEADER.size + length
+
+            kind, ip, count = _RECORD.unpack_from(payload)
+            offset = _RECORD.size
+            strings = []
+            for _ in range(count):
+                length = _U32.unpack_from(payload, offset)[0]
+                offset += _U32.size
+                strings.append(payload[offset:offset + length].decode('utf-8'))
+                offset += length
+            yield kind, IpRegistry.unpack(ip), strings
+
+    @staticmethod
+    def segments(path):
+        """Returns the sorted (number, path) pairs of the segments of a journal."""
+
+        return Journal._numbered(path, '.wal')
+
+    @staticmethod
+    def snapshots(path):
+        """Returns the sorted (number, path) pairs of the checkpoint snapshots of a journal."""
+
+        return Journal._numbered(path, '.snap')
+
+    @staticmethod
+    def _numbered(path, extension):
+        numbered = []
+        for file_path in glob.glob(f'{glob.escape(path)}.*{extension}'):
+            number = file_path[len(path) + 1:-len(extension)]
+            if number.isdigit():
+                numbered.append((int(number), file_path))
+        return sorted(numbered)
+
+    @staticmethod
+    def _replay(internet, kind, ip, strings):
+        """Applies one record to an internet."""
+
+        if kind == Journal.NEW:
+            internet.add_os(strings[0], strings[1], ip)
+        elif kind == Journal.REMOVE:
+            internet.remove_os(ip)
+        elif kind == Journal.CMD:
+            from terminal_game.terminal import Terminal
+            try:
+                v_os = internet.get_os_by_ip(ip)
+            except exceptions.OSNotFound:
+                return
+            terminal = Terminal(v_os, v_os)
+            try:
+                terminal.current_dir = v_os.parse_path(strings[0])
+            except exceptions.OSInvalidPath:
+                return
+            try:
+                terminal.execute(strings[1], strings[2:])
+            except Exception:
+                logger.exception('Replayed command %s failed on %s.', strings[1], ip)
+
+    def _commit(self):
+        """Commits every waiting record, waiting for the commit in progress first. Called holding _lock."""
+
+        while self._committing:
+            self._committed.wait()
+        if self._buffer:
+            self._commit_group()
+
+    def _commit_group(self):
+        """Writes and fsyncs the waiting records as one group. Called holding _lock, which is released during the fsync."""
+
+        group, self._buffer = self._buffer, []
+        last = self._appended
+        self._committing = True
+        self._lock.release()
+        try:
+            self._file.write(b''.join(group))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except BaseException:
+            self._lock.acquire()
+            self._buffer[:0] = group
+            self._committing = False
+            self._committed.notify_all()
+            raise
+        self._lock.acquire()
+        self._durable = last
+        self._committing = False
+        self._committed.notify_all()
+
+    def _open_segment(self, number):
+        """Opens a segment for appending, writing its header if it is new."""
+
+        f = open(self._segment_path(number), 'ab')
+        if f.tell() == 0:
+            f.write(SEGMENT_MAGIC + _VERSION.pack(SEGMENT_VERSION))
+            f.flush()
+        return f
+
+    def _segment_path(self, number):
+        return f'{self.path}.{number:08d}.wal'
+
+    def _snapshot_path(self, number):
+        return f'{self.path}.{number:08d}.snap'
+
+
+class _Mutation(object):
+    """Context manager marking a change in progress, see Journal.mutating."""
+
+    def __init__(self, journal):
+        self.journal = journal
+
+    def __enter__(self):
+        gate = self.journal._gate
+        with gate:
+            while self.journal._checkpointing:
+                gate.wait()
+            self.journal._mutations += 1
+
+    def __exit__(self, *exc_info):
+        gate = self.journal._gate
+        with gate:
+            self.journal._mutations -= 1
+            gate.notify_all()
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+
+from utils import exceptions
+from utils.ip_registry import IpRegistry
+
+
+class SystemLocks(object):
+    """Per-system asyncio locks used to serialize the commands run on a system.
+
+    A request locks every system it may touch before it runs. A plain command
+    only touches the system it is sent to, but a terminal connected to another
+    system forwards its commands there, and connect/disconnect touch both ends.
+    Locks are always acquired in the order of the packed IP addresses, so two
+    requests locking the same pair of systems can never wait on each other.
+
+    The lock of a system is dropped when the system is removed from the
+    internet, or once the last request using it releases it if it was busy.
+
+    Attributes:
+        internet: Internet the locked systems belong to.
+    """
+
+    def __init__(self, internet):
+        """Initializes the locks for the systems of an internet."""
+
+        self.internet = internet
+        self._locks = {}
+        self._users = {}
+        self._forgotten = set()
+        self._guard = threading.Lock()
+        self.internet_lock = asyncio.Lock()
+        internet.on_remove(self.forget)
+
+    def lock(self, ip):
+        """Returns the lock of the system with the given IP."""
+
+        with self._guard:
+            lock = self._locks.get(ip)
+            if lock is None:
+                lock = self._locks[ip] = asyncio.Lock()
+            return lock
+
+    def systems_touched(self, ip, args=None):
+        """Returns the IPs of the systems a command sent to a system may touch, in lock order."""
+
+        try:
+            v_os = self.internet.get_os_by_ip(ip)
+        except exceptions.OSNotFound:
+            return []
+        return self._touched(v_os, args)
+
+    def is_current(self, ip, lock):
+        """Returns whether lock, as returned by lock, is still the lock of the system with the given IP (False once it was removed)."""
+
+        with self._guard:
+            return self._locks.get(ip) is lock and ip not in self._forgotten
+
+    async def acquire(self, ip, args=None):
+        """Acquires the locks of every system a command may touch. Returns the IPs that were locked.
+
+        The systems touched are computed again once the locks are held, in case
+        a connect or disconnect ran in the meantime, and the locks are taken
+        again until both agree.
+        """
+
+        return await self._acquire(lambda: self.systems_touched(ip, args))
+
+    async def acquire_system(self, v_os, lock, args=None):
+        """Same as acquire, for a system already looked up along with its lock (see lock).
+
+        Raises OSNotFound, holding no lock, if the system was removed since.
+        """
+
+        def touched():
+            if not self.is_current(v_os.IP, lock):
+                raise exceptions.OSNotFound('os not found.', v_os.IP)
+            return self._touched(v_os, args)
+
+        return await self._acquire(touched)
+
+    async def _acquire(self, touched):
+        while True:
+            ips = touched()
+            locks = self._use(ips)
+            acquired = []
+            try:
+                for lock in locks:
+                    await lock.acquire()
+                    acquired.append(lock)
+            except BaseException:
+                for lock in reversed(acquired):
+                    lock.release()
+                self._unuse(ips)
+                raise
+            try:
+                if touched() == ips:
+                    return ips
+            except BaseException:
+                self.release(ips)
+                raise
+            self.release(ips)
+
+    def release(self, ips):
+        """Releases locks acquired by acquire."""
+
+        for locked_ip in reversed(ips):
+            self._locks[locked_ip].release()
+        self._unuse(ips)
+
+    def forget(self, ip):
+        """Drops the lock of a system that was removed from the internet, once no request uses it."""
+
+        with self._guard:
+            if self._users.get(ip):
+                self._forgotten.add(ip)
+            else:
+                self._locks.pop(ip, None)
+
+    def _touched(self, v_os, args):
+        ips = {v_os.IP}
+        connected_to = v_os.main_terminal.connected_to
+        if connected_to:
+            ips.add(connected_to.os.IP)
+        elif args and args[0] == 'connect' and len(args) > 1 and args[1] in self.internet.ip_registry:
+            ips.add(args[1])
+        return sorted(ips, key=IpRegistry.pack)
+
+    def _use(self, ips):
+        """Returns the locks of the given systems, counting the request as one of their users."""
+
+        with self._guard:
+            locks = []
+            for ip in ips:
+                lock = self._locks.get(ip)
+                if lock is None:
+                    lock = self._locks[ip] = asyncio.Lock()
+                self._users[ip] = self._users.get(ip, 0) + 1
+                locks.append(lock)
+            return locks
+
+    def _unuse(self, ips):
+        """Stops counting a request as a user of the given systems, dropping the forgotten locks left unused."""
+
+        with self._guard:
+            for ip in ips:
+                self._users[ip] -= 1
+                if self._users[ip]:
+                    continue
+                del self._users[ip]
+                if ip in self._forgotten:
+                    self._forgotten.discard(ip)
+                    self._locks.pop(ip, None)
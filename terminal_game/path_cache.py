@@ -0,0 +1,68 @@
+from collections import OrderedDict
+
+
+class PathCache(object):
+    """Bounded LRU cache of resolved paths for System.parse_path.
+
+    Entries map (base directory, path, parent_dir) to the storage unit the
+    path resolved to. Each entry remembers every directory the walk looked
+    a name up in (or went up to with ..) and its generation (see
+    Directory.get_generation). A generation only changes when a storage unit
+    is added to, deleted from or renamed in the directory itself, so a hit
+    is served while none of the directories the path goes through changed,
+    whatever happens elsewhere in the system.
+
+    Attributes:
+        max_size: maximum number of entries kept.
+        hits: number of lookups served from the cache.
+        misses: number of lookups that had to walk the path.
+    """
+
+    def __init__(self, max_size=1024):
+        """Initializes an empty cache holding at most max_size entries."""
+
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Returns the cached storage unit for key, or None if there is no valid entry."""
+
+        entry = self._entries.get(key)
+        if entry is None or not PathCache._valid(entry[1]):
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, unit, visited):
+        """Caches the storage unit a path resolved to.
+
+        Arguments:
+            key -- (base directory, path, parent_dir) of the lookup.
+            unit -- storage unit the path resolved to.
+            visited -- list of the (directory, generation) pairs the path went through, each taken before it was used.
+        """
+
+        self._entries[key] = (unit, visited)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drops every entry."""
+
+        self._entries.clear()
+
+    @staticmethod
+    def _valid(visited):
+        """Returns True if none of the visited directories changed since their generation was taken."""
+
+        for directory, generation in visited:
+            if directory.get_generation() != generation:
+                return False
+        return True
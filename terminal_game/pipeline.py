@@ -0,0 +1,82 @@
+class Pipeline(object):
+    """Command line made of commands joined by |, optionally redirected to a file with > or >>.
+
+    Operators are separate arguments, as the command line is split on
+    spaces, and are only recognized outside of quotes. Redirection has to
+    come last.
+
+    Attributes:
+        stages: list of (command, args) in the order the output flows through them.
+        redirect: path of the file the output is written to (None to return it as stdout).
+        append: True to append to the file (>>), False to replace its contents (>).
+    """
+
+    NAME = '|'
+    OPERATORS = ('|', '>', '>>')
+
+    def __init__(self, stages, redirect=None, append=False):
+        self.stages = stages
+        self.redirect = redirect
+        self.append = append
+
+    @staticmethod
+    def is_pipeline(args):
+        """Returns True if a command line holds any pipe or redirection operator."""
+
+        return any(operator for operator, _ in Pipeline._tokens(args))
+
+    @staticmethod
+    def parse(args):
+        """Parses a command line. Returns a Pipeline and an error message (one of them is None)."""
+
+        stages = []
+        current = []
+        redirect = None
+        append = False
+        tokens = list(Pipeline._tokens(args))
+        while tokens:
+            operator, arg = tokens.pop(0)
+            if redirect is not None:
+                return None, 'Redirection needs to come last.'
+            if not operator:
+                if arg or current:
+                    current.append(arg)
+                continue
+            while current and not current[-1]:
+                current.pop()
+            if not current:
+                return None, f'Syntax error near {arg}.'
+            stages.append((current[0], current[1:]))
+            current = []
+            if arg != '|':
+                while tokens and not tokens[0][0] and not tokens[0][1]:
+                    tokens.pop(0)
+                if not tokens or tokens[0][0]:
+                    return None, f'{arg} needs a file path.'
+                redirect = tokens.pop(0)[1]
+                append = arg == '>>'
+                while tokens and not tokens[0][0] and not tokens[0][1]:
+                    tokens.pop(0)
+        if redirect is None:
+            while current and not current[-1]:
+                current.pop()
+            if not current:
+                return None, 'Syntax error near |.'
+            stages.append((current[0], current[1:]))
+        return Pipeline(stages, redirect, append), None
+
+    @staticmethod
+    def _tokens(args):
+        """Yields (is operator, arg) for the args of a command line, tracking quotes across args."""
+
+        quote = None
+        for arg in args:
+            if quote is None and arg in Pipeline.OPERATORS:
+                yield True, arg
+                continue
+            for char in arg:
+                if quote is None and char in '"\'':
+                    quote = char
+                elif char == quote:
+                    quote = None
+            yield False, arg
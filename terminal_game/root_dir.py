@@ -13,6 +13,8 @@ class RootDir(Directory):
     It has no name and no parent.
     """
 
+    __slots__ = ()
+
     def __init__(self, contents):
         """Initialized the root directory using contents."""
         
@@ -26,13 +28,13 @@ class RootDir(Directory):
     def _validate_name(self, name: str):
         """Raises exception if there is a name."""
 
-        logger.info(f'Validating name for {self.__class__.__name__} with id {self.SUID}')
+        logger.debug('Validating name for %s with id %s', self.__class__.__name__, self.SUID)
         if name != "":
             raise exceptions.RootDirException('Cannot assign a name to root directory.', name)
     
     def _validate_parent(self, parent):
         """Raises exception if there is a parent."""
         
-        logger.info(f'Validating parent for {self.__class__.__name__} with id {self.SUID}')
+        logger.debug('Validating parent for %s with id %s', self.__class__.__name__, self.SUID)
         if parent:
             raise exceptions.RootDirException('Cannot assign a parent to root directory.', parent)
\ No newline at end of file
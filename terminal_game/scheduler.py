@@ -0,0 +1,162 @@
+import time
+import threading
+from collections import deque
+
+from utils import exceptions
+from utils.my_logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class _Bucket(object):
+    """Token bucket of one system, allowed to go into debt."""
+
+    __slots__ = ('tokens', 'updated', 'running', 'waiting', 'removed')
+
+    def __init__(self, burst, now):
+        self.tokens = burst
+        self.updated = now
+        self.running = 0
+        self.waiting = deque()
+        self.removed = False
+
+
+class CommandScheduler(object):
+    """Admits the commands of every system to run, fairly and within a budget.
+
+    Each system has a token bucket refilled at rate tokens per second, up
+    to burst. A command is charged once it has run, 1 token plus node_cost
+    per storage unit it touched (as returned with its result, see
+    Terminal.run_counted), so a cp or tree
+    over a large subtree costs in proportion to its work and can leave the
+    bucket in debt. A command of a system in debt is rejected with
+    CommandThrottled instead of waiting for the refill, so a busy system
+    never holds the calling thread (typically one of an executor's) for
+    longer than the commands ahead of it take to run.
+
+    At most concurrency commands run at once, and at most one per system.
+    Free slots go round robin to the systems with waiting commands, so a
+    system sending many commands waits behind its own queue instead of
+    everybody else's. A command is also rejected right away when its
+    system already has max_queue commands waiting. The bucket of a removed
+    system is dropped (see forget).
+
+    Attributes:
+        rate: tokens added to each bucket per second.
+        burst: maximum number of tokens in a bucket.
+        node_cost: tokens charged per storage unit touched by a command.
+        concurrency: maximum number of commands running at once.
+        max_queue: maximum number of commands waiting per system.
+    """
+
+    def __init__(self, rate=50.0, burst=100.0, node_cost=0.01, concurrency=4, max_queue=8):
+        self.rate = rate
+        self.burst = burst
+        self.node_cost = node_cost
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._buckets = {}
+        self._ring = deque()
+        self._running = 0
+        self._cond = threading.Condition()
+
+    def run(self, ip, func):
+        """Runs func on the calling thread once the system with the given IP is granted a slot. Returns its result.
+
+        func returns its result along with the number of storage units the
+        command touched, which is what it gets charged for. Raises
+        CommandThrottled (with the number of seconds to wait before retrying
+        as info) if the command is rejected.
+        """
+
+        ticket = [None, 0.0]
+        with self._cond:
+            bucket = self._enqueue(ip, ticket)
+            self._dispatch()
+            while ticket[0] is None:
+                self._cond.wait()
+            if not ticket[0]:
+                self._drop_removed(ip, bucket)
+                raise exceptions.CommandThrottled('Command budget exceeded, slow down.', ticket[1])
+        nodes = 0
+        try:
+            result, nodes = func()
+            return result
+        finally:
+            with self._cond:
+                bucket.tokens -= 1 + nodes * self.node_cost
+                bucket.running -= 1
+                self._running -= 1
+                self._drop_removed(ip, bucket)
+                self._dispatch()
+                self._cond.notify_all()
+
+    def forget(self, ip):
+        """Drops the bucket of a removed system, once the commands it is running or waiting to run are done."""
+
+        with self._cond:
+            bucket = self._buckets.get(ip)
+            if bucket is not None:
+                bucket.removed = True
+                self._drop_removed(ip, bucket)
+
+    def _enqueue(self, ip, ticket):
+        now = time.monotonic()
+        bucket = self._buckets.get(ip)
+        if bucket is None:
+            bucket = self._buckets[ip] = _Bucket(self.burst, now)
+        bucket.removed = False
+        self._refill(bucket, now)
+
+        if len(bucket.waiting) >= self.max_queue:
+            raise exceptions.CommandThrottled('Too many commands waiting, slow down.', max(self._debt(bucket), 1 / self.rate))
+        if self._debt(bucket) > 0:
+            raise exceptions.CommandThrottled('Command budget exceeded, slow down.', self._debt(bucket))
+
+        if not bucket.waiting:
+            self._ring.append(ip)
+        bucket.waiting.append(ticket)
+        return bucket
+
+    def _dispatch(self):
+        """Grants free slots to the waiting commands, round robin over the systems.
+
+        The commands left waiting by a system that went into debt are
+        rejected rather than kept waiting for the refill.
+        """
+
+        now = time.monotonic()
+        for _ in range(len(self._ring)):
+            if self._running >= self.concurrency:
+                return
+            ip = self._ring.popleft()
+            bucket = self._buckets[ip]
+            self._refill(bucket, now)
+            if bucket.running == 0 and bucket.tokens < 0:
+                while bucket.waiting:
+                    ticket = bucket.waiting.popleft()
+                    ticket[0], ticket[1] = False, self._debt(bucket)
+                self._cond.notify_all()
+            elif bucket.running == 0:
+                bucket.waiting.popleft()[0] = True
+                bucket.running += 1
+                self._running += 1
+                self._cond.notify_all()
+            if bucket.waiting:
+                self._ring.append(ip)
+
+    def _drop_removed(self, ip, bucket):
+        """Drops the bucket of a removed system if it is idle. Called holding _cond."""
+
+        if bucket.removed and not bucket.running and not bucket.waiting:
+            del self._buckets[ip]
+
+    def _refill(self, bucket, now):
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+        bucket.updated = now
+
+    def _debt(self, bucket):
+        """Returns the number of seconds the bucket needs to get out of debt."""
+
+        return max(0.0, -bucket.tokens / self.rate)
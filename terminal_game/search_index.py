@@ -0,0 +1,211 @@
+import fnmatch
+
+from utils.blob_store import Blob
+from utils.content_pool import ContentPool
+from utils.metrics import Metrics
+from utils.my_logging import get_logger
+from terminal_game.directory import Directory
+from terminal_game.file import File
+
+
+logger = get_logger(__name__)
+
+
+class SearchIndex(object):
+    """Inverted index over the names and file contents of a system, serving find and grep.
+
+    Names map to the paths of every storage unit carrying them, and each
+    trigram of text contents maps to the paths of the files containing it,
+    so a search only looks at the units that can match instead of walking
+    the whole tree. Searches for a substring shorter than a trigram, and
+    files too large or holding bytes, fall back to scanning the candidates.
+
+    The index is built on the first search and then kept up to date by the
+    terminal commands changing the file system (touch, mkdir, write,
+    replace, mv, cp, rm and redirections), which report what they changed.
+    It is rebuilt if the tree changed in some other way before a search
+    (see Topology.changes). Layered directories are read through
+    peek_contents, so building the index does not materialize them.
+
+    For each indexed file the index only keeps a ContentPool reference to
+    the contents it indexed, not the file itself nor its trigrams: the
+    trigrams to drop are computed again from those contents when the file
+    changes or goes away. Files that are not indexed are looked up by path
+    when grep needs them. Call clear to give the references back when the
+    index is dropped.
+
+    Attributes:
+        root: root directory of the indexed system.
+    """
+
+    GRAM = 3
+    MAX_INDEXED_SIZE = 1 << 20
+
+    def __init__(self, root):
+        """Initializes an index over the tree under root, built on first use."""
+
+        self.root = root
+        self._built = False
+        self._generation = -1
+        self._names = {}
+        self._grams = {}
+        self._files = {}
+        self._unindexed = set()
+
+    def find(self, pattern, directory):
+        """Returns the sorted paths of the storage units below a directory whose name matches a name or glob pattern."""
+
+        self._ensure_built()
+        if any(char in pattern for char in '*?['):
+            names = fnmatch.filter(self._names, pattern)
+        else:
+            names = [pattern] if pattern in self._names else []
+        prefix = directory.get_path()
+        paths = [path for name in names for path in self._names[name] if path.startswith(prefix) and path != prefix]
+        Metrics.touch(len(paths))
+        return sorted(paths)
+
+    def grep(self, pattern, directory):
+        """Yields (path, line) for every line containing pattern in the text files below a directory, in path order."""
+
+        self._ensure_built()
+        prefix = directory.get_path()
+        candidates = [path for path in self._candidates(pattern) if path.startswith(prefix)]
+        Metrics.touch(len(candidates))
+        for path in sorted(candidates):
+            contents = self._files[path]
+            if contents is None:
+                contents = self._lookup(path).get_stored()
+            for line in File.lines(contents):
+                if pattern in line:
+                    yield path, line
+
+    def added(self, unit):
+        """Indexes a storage unit just added to the tree, and everything inside it."""
+
+        if self._built:
+            for path, child in SearchIndex._walk(unit, unit.get_path()):
+                self._add(path, child)
+            self._synced()
+
+    def removed(self, unit, path):
+        """Drops a storage unit just removed from path, and everything inside it, from the index."""
+
+        if self._built:
+            for child_path, _ in SearchIndex._walk(unit, path):
+                self._remove(child_path)
+            self._synced()
+
+    def moved(self, unit, old_path):
+        """Moves the entries of a storage unit just renamed or moved from old_path, and of everything inside it."""
+
+        if self._built:
+            self.removed(unit, old_path)
+            self.added(unit)
+
+    def changed(self, fl):
+        """Indexes the new contents of a file."""
+
+        if self._built:
+            path = fl.get_path()
+            self._remove(path)
+            self._add(path, fl)
+            self._synced()
+
+    def clear(self):
+        """Empties the index, releasing the contents it holds. It is built again on the next search."""
+
+        for contents in self._files.values():
+            ContentPool.release(contents)
+        self._names = {}
+        self._grams = {}
+        self._files = {}
+        self._unindexed = set()
+        self._built = False
+
+    def _ensure_built(self):
+        if self._built and self.root.get_topology().changes == self._generation:
+            return
+        self.clear()
+        count = 0
+        for path, unit in SearchIndex._walk(self.root, '/'):
+            if unit is not self.root:
+                self._add(path, unit)
+                count += 1
+        Metrics.touch(count)
+        self._built = True
+        self._synced()
+        logger.debug('Indexed %s storage units and %s trigrams.', count, len(self._grams))
+
+    def _synced(self):
+        self._generation = self.root.get_topology().changes
+
+    def _candidates(self, pattern):
+        """Returns the paths of the files that may contain pattern."""
+
+        if len(pattern) < SearchIndex.GRAM:
+            return list(self._files)
+        postings = []
+        for gram in SearchIndex._trigrams(pattern):
+            posting = self._grams.get(gram)
+            if not posting:
+                return list(self._unindexed)
+            postings.append(posting)
+        postings.sort(key=len)
+        return list(set.intersection(*postings) | self._unindexed)
+
+    def _add(self, path, unit):
+        self._names.setdefault(unit.get_name(), set()).add(path)
+        if not isinstance(unit, File):
+            return
+        if unit.is_text() and unit.get_size() <= SearchIndex.MAX_INDEXED_SIZE:
+            for gram in SearchIndex._trigrams(unit.get_contents()):
+                self._grams.setdefault(gram, set()).add(path)
+            self._files[path] = ContentPool.intern(unit.get_stored())
+        else:
+            self._unindexed.add(path)
+            self._files[path] = None
+
+    def _remove(self, path):
+        name = path.rstrip('/').rsplit('/', 1)[-1]
+        paths = self._names.get(name)
+        if paths is not None:
+            paths.discard(path)
+            if not paths:
+                del self._names[name]
+        if path not in self._files:
+            return
+        contents = self._files.pop(path)
+        if contents is None:
+            self._unindexed.discard(path)
+            return
+        for gram in SearchIndex._trigrams(contents.materialize() if isinstance(contents, Blob) else contents):
+            posting = self._grams[gram]
+            posting.discard(path)
+            if not posting:
+                del self._grams[gram]
+        ContentPool.release(contents)
+
+    def _lookup(self, path):
+        """Returns the storage unit at an indexed path, without materializing layered directories."""
+
+        unit = self.root
+        for name in path.strip('/').split('/'):
+            unit = unit.peek_su(name)
+        return unit
+
+    @staticmethod
+    def _trigrams(text):
+        return {text[i:i + SearchIndex.GRAM] for i in range(len(text) - SearchIndex.GRAM + 1)}
+
+    @staticmethod
+    def _walk(unit, path):
+        """Yields (path, unit) for a unit and everything inside it, without materializing layered directories."""
+
+        stack = [(path, unit)]
+        while stack:
+            path, unit = stack.pop()
+            yield path, unit
+            if isinstance(unit, Directory):
+                children, _ = unit.peek_contents()
+                stack.extend((path + child._path_segment(), child) for child in children)
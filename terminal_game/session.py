@@ -0,0 +1,316 @@
+import math
+import struct
+import asyncio
+
+from utils import exceptions
+from utils.my_logging import get_logger
+from terminal_game.locks import SystemLocks
+
+
+logger = get_logger(__name__)
+
+_HEADER = struct.Struct('>IB')
+_RESULT = struct.Struct('>iII')
+_NONE = 0xFFFFFFFF
+
+
+class SessionProtocol(object):
+    """Length-prefixed binary frames of the session protocol.
+
+    Every frame is a u32 payload length and a u8 kind, followed by the
+    payload. Text payloads are plain utf-8. A result payload is the i32 exit
+    code and the u32 lengths of stdout and stderr (0xFFFFFFFF for None),
+    followed by both strings.
+
+    Client frames: ATTACH (ip of the system to bind the session to), NEW
+    (username and password separated by a null byte, creates a system and
+    binds to it), CMD (command line) and PROMPT (asks for the prompt again).
+    Server frames: ATTACHED (ip the session is bound to), RESULT (result of
+    a command), LINE (prompt, pushed after ATTACHED and after every RESULT)
+    and ERROR (message).
+
+    No frame is longer than MAX_FRAME, on either side. A result too long for
+    one frame is split: its payload is sent as PART frames of MAX_FRAME bytes
+    followed by a RESULT frame holding the rest, and read back as one.
+    """
+
+    ATTACH = 1
+    NEW = 2
+    CMD = 3
+    PROMPT = 4
+
+    ATTACHED = 16
+    RESULT = 17
+    LINE = 18
+    ERROR = 19
+    PART = 20
+
+    MAX_FRAME = 1 << 20
+
+    @staticmethod
+    def frame(kind, payload=b''):
+        """Returns a frame holding payload (bytes or str). Raises ValueError if it is longer than MAX_FRAME."""
+
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        if len(payload) > SessionProtocol.MAX_FRAME:
+            raise ValueError(f'Frame of {len(payload)} bytes is too long.')
+        return _HEADER.pack(len(payload), kind) + payload
+
+    @staticmethod
+    async def read(reader):
+        """Reads a frame from an asyncio stream. Returns its kind and payload.
+
+        Raises asyncio.IncompleteReadError when the stream ends and ValueError
+        for a frame longer than MAX_FRAME.
+        """
+
+        length, kind = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+        if length > SessionProtocol.MAX_FRAME:
+            raise ValueError(f'Frame of {length} bytes is too long.')
+        return kind, await reader.readexactly(length)
+
+    @staticmethod
+    def result(response):
+        """Returns the frames of a command response: PART frames if it does not fit in one, then a RESULT frame."""
+
+        stdout, stderr = (None if value is None else str(value).encode('utf-8') for value in (response['stdout'], response['stderr']))
+        header = _RESULT.pack(response['exit_code'], _NONE if stdout is None else len(stdout), _NONE if stderr is None else len(stderr))
+        payload = b''.join([header, stdout or b'', stderr or b''])
+        step = SessionProtocol.MAX_FRAME
+        last = (len(payload) - 1) // step * step
+        frames = [SessionProtocol.frame(SessionProtocol.PART, payload[start:start + step]) for start in range(0, last, step)]
+        frames.append(SessionProtocol.frame(SessionProtocol.RESULT, payload[last:]))
+        return b''.join(frames)
+
+    @staticmethod
+    def parse_result(payload):
+        """Returns the command response held by the payload of a RESULT frame."""
+
+        exit_code, stdout_length, stderr_length = _RESULT.unpack_from(payload)
+        pos = _RESULT.size
+        values = []
+        for length in (stdout_length, stderr_length):
+            if length == _NONE:
+                values.append(None)
+                continue
+            values.append(payload[pos:pos + length].decode('utf-8'))
+            pos += length
+        return {'exit_code': exit_code, 'stdout': values[0], 'stderr': values[1]}
+
+
+class _Session(object):
+    """System a session is attached to, with its main terminal and its lock."""
+
+    __slots__ = ('os', 'terminal', 'lock')
+
+    def __init__(self, v_os, lock):
+        self.os = v_os
+        self.terminal = v_os.main_terminal
+        self.lock = lock
+
+
+class SessionServer(object):
+    """Serves long-lived sessions over TCP, each bound to the main terminal of one system.
+
+    The system and its lock are looked up once, when the session attaches,
+    and every command then goes straight to its terminal. A command sent
+    after the system was removed is answered with an ERROR frame and
+    detaches the session. Commands run in the default
+    thread pool under the same SystemLocks and CommandScheduler as the HTTP
+    API, so both can serve the same internet. A throttled command is
+    answered with an ERROR frame instead of a result.
+
+    Attributes:
+        internet: Internet the sessions are served from.
+        locks: per-system locks shared with the other front-ends.
+        scheduler: CommandScheduler shared with the other front-ends (None to run commands right away).
+    """
+
+    def __init__(self, internet, locks=None, scheduler=None):
+        """Initializes the server using an internet, the locks of its systems (new ones by default) and an optional scheduler."""
+
+        self.internet = internet
+        self.locks = locks if locks else SystemLocks(internet)
+        self.scheduler = scheduler
+        self._server = None
+
+    async def start(self, host='127.0.0.1', port=5556):
+        """Starts listening for sessions."""
+
+        self._server = await asyncio.start_server(self._serve, host, port)
+        logger.info('Serving sessions on %s:%s.', host, port)
+
+    async def close(self):
+        """Stops listening. Sessions already open are left to end on their own."""
+
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader, writer):
+        session = None
+        try:
+            while True:
+                kind, payload = await SessionProtocol.read(reader)
+                try:
+                    if kind == SessionProtocol.ATTACH:
+                        session = await self._attach(writer, payload.decode('utf-8'))
+                    elif kind == SessionProtocol.NEW:
+                        session = await self._new(writer, payload.decode('utf-8'))
+                    elif session is None:
+                        writer.write(SessionProtocol.frame(SessionProtocol.ERROR, 'Session is not attached to a system.'))
+                    elif kind == SessionProtocol.CMD:
+                        await self._command(writer, session, payload.decode('utf-8'))
+                    elif kind == SessionProtocol.PROMPT:
+                        writer.write(SessionProtocol.frame(SessionProtocol.LINE, await self._locked(session, None, session.terminal.new_line)))
+                    else:
+                        writer.write(SessionProtocol.frame(SessionProtocol.ERROR, f'Unknown frame kind {kind}.'))
+                except exceptions.OSNotFound as e:
+                    session = None
+                    writer.write(SessionProtocol.frame(SessionProtocol.ERROR, f'System {e.info[0]} was removed.'))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except (ValueError, UnicodeDecodeError) as e:
+            logger.warning('Closing session after a malformed frame: %s', e)
+        finally:
+            writer.close()
+
+    async def _attach(self, writer, ip):
+        """Binds the session to the main terminal of a system. Returns the _Session (None if there is no such system)."""
+
+        try:
+            v_os = self.internet.get_os_by_ip(ip)
+            lock = self.locks.lock(v_os.IP)
+            # The system may have been removed, and its IP reused, before its lock was taken.
+            if self.internet.get_os_by_ip(ip) is not v_os:
+                raise exceptions.OSNotFound('os not found.', ip)
+        except exceptions.OSNotFound as e:
+            writer.write(SessionProtocol.frame(SessionProtocol.ERROR, e.message))
+            return None
+        session = _Session(v_os, lock)
+        prompt = await self._locked(session, None, session.terminal.new_line)
+        writer.write(SessionProtocol.frame(SessionProtocol.ATTACHED, v_os.IP))
+        writer.write(SessionProtocol.frame(SessionProtocol.LINE, prompt))
+        return session
+
+    async def _new(self, writer, payload):
+        """Creates a system and binds the session to it. Returns the _Session (None if it could not be created)."""
+
+        username, _, password = payload.partition('\0')
+        loop = asyncio.get_running_loop()
+        try:
+            async with self.locks.internet_lock:
+                v_os = await loop.run_in_executor(None, self.internet.add_os, username, password)
+        except Exception as e:
+            writer.write(SessionProtocol.frame(SessionProtocol.ERROR, getattr(e, 'message', str(e))))
+            return None
+        return await self._attach(writer, v_os.IP)
+
+    async def _command(self, writer, session, line):
+        """Runs a command line on the terminal of a session and pushes its result and the new prompt (or an ERROR frame if it is throttled)."""
+
+        args = [arg.strip() for arg in line.split(' ')]
+        terminal = session.terminal
+
+        def run():
+            if not self.scheduler:
+                return terminal.run_command(list(args)), terminal.new_line()
+            return self.scheduler.run(session.os.IP, lambda: terminal.run_counted(list(args))), terminal.new_line()
+
+        try:
+            response, prompt = await self._locked(session, args, run)
+        except exceptions.CommandThrottled as e:
+            writer.write(SessionProtocol.frame(SessionProtocol.ERROR, f'{e.message} Retry in {math.ceil(e.info[0])} seconds.'))
+            return
+        writer.write(SessionProtocol.result(response))
+        writer.write(SessionProtocol.frame(SessionProtocol.LINE, prompt))
+
+    async def _locked(self, session, args, func):
+        """Runs func in the thread pool, holding the locks of every system a command sent in the session may touch.
+
+        Raises OSNotFound if the system of the session was removed.
+        """
+
+        ips = await self.locks.acquire_system(session.os, session.lock, args)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, func)
+        finally:
+            self.locks.release(ips)
+
+
+class SessionClient(object):
+    """Client side of a session.
+
+    Attributes:
+        ip: IP of the system the session is attached to (None until attached).
+        prompt: last prompt pushed by the server.
+    """
+
+    def __init__(self, reader, writer):
+        self.ip = None
+        self.prompt = None
+        self._reader = reader
+        self._writer = writer
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=5556):
+        """Opens a session with a session server."""
+
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def attach(self, ip):
+        """Binds the session to the system with the given IP."""
+
+        return await self._attach(SessionProtocol.ATTACH, ip)
+
+    async def new(self, username, password):
+        """Creates a system and binds the session to it. Returns its IP."""
+
+        return await self._attach(SessionProtocol.NEW, f'{username}\0{password}')
+
+    async def run(self, line):
+        """Runs a command line and returns its response. The new prompt is kept in prompt.
+
+        Raises SessionError, without sending anything, if the line does not fit in a frame.
+        """
+
+        try:
+            frame = SessionProtocol.frame(SessionProtocol.CMD, line)
+        except ValueError as e:
+            raise exceptions.SessionError(str(e))
+        self._writer.write(frame)
+        response = SessionProtocol.parse_result(await self._expect(SessionProtocol.RESULT))
+        self.prompt = (await self._expect(SessionProtocol.LINE)).decode('utf-8')
+        return response
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+
+    async def _attach(self, kind, payload):
+        self._writer.write(SessionProtocol.frame(kind, payload))
+        self.ip = (await self._expect(SessionProtocol.ATTACHED)).decode('utf-8')
+        self.prompt = (await self._expect(SessionProtocol.LINE)).decode('utf-8')
+        return self.ip
+
+    async def _expect(self, expected):
+        """Reads the next frame, joining the PART frames before it. Returns its payload, raising SessionError if it is an ERROR or not of the expected kind."""
+
+        await self._writer.drain()
+        parts = []
+        kind, payload = await SessionProtocol.read(self._reader)
+        while kind == SessionProtocol.PART:
+            parts.append(payload)
+            kind, payload = await SessionProtocol.read(self._reader)
+        if kind == SessionProtocol.ERROR:
+            raise exceptions.SessionError(payload.decode('utf-8'))
+        if kind != expected:
+            raise exceptions.SessionError(f'Expected a frame of kind {expected}, got {kind}.')
+        if parts:
+            parts.append(payload)
+            return b''.join(parts)
+        return payload
@@ -0,0 +1,544 @@
+import os
+import atexit
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from types import SimpleNamespace
+from multiprocessing.connection import Listener, Client
+
+from utils import exceptions
+from utils.metrics import CommandMetrics, Metrics
+from utils.ip_registry import IpRegistry
+from utils.id_generator import IdGenerator
+from utils.my_logging import get_logger
+from terminal_game.internet import Internet
+from terminal_game.journal import Journal
+
+
+logger = get_logger(__name__)
+
+
+def shard_of(ip, shards):
+    """Returns the index of the shard owning an IP address. Raises ValueError if it is not valid."""
+
+    return ((IpRegistry.pack(ip) * 0x9E3779B1) & 0xFFFFFFFF) % shards
+
+
+class ShardConnection(object):
+    """Connection to a shard worker, opened on first use.
+
+    Requests are tuples starting with the name of the operation, replies are
+    ('ok', value) or ('error', (exception class name, message)). Errors are
+    raised again on this side as the matching class of utils.exceptions.
+
+    Attributes:
+        address: path of the unix socket the worker listens on.
+    """
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self._authkey = authkey
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def call(self, *request):
+        """Sends a request to the worker and returns the value it replied with."""
+
+        with self._lock:
+            if self._conn is None:
+                self._conn = Client(self.address, family='AF_UNIX', authkey=self._authkey)
+            self._conn.send(request)
+            status, value = self._conn.recv()
+        if status == 'error':
+            raise ShardConnection.exception(*value)
+        return value
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def exception(name, message):
+        """Returns the exception to raise for an error replied by a worker."""
+
+        exception_class = getattr(exceptions, name, None)
+        if not (isinstance(exception_class, type) and issubclass(exception_class, Exception)):
+            exception_class = Exception
+        return exception_class(message)
+
+
+class RemoteSystem(object):
+    """Proxy of a system living in another process.
+
+    It has just enough of the System interface for the gateway (main_terminal)
+    and for Terminal._connect (IP, get_terminal).
+
+    Attributes:
+        internet: internet of this process, used to reach the shard.
+        shard: index of the shard owning the system.
+        IP: IP address of the system.
+    """
+
+    def __init__(self, internet, shard, ip):
+        self.internet = internet
+        self.shard = shard
+        self.IP = ip
+        self.main_terminal = RemoteTerminal(self, None, self)
+
+    def get_terminal(self, opened_by):
+        """Opens a terminal on the system for a system of this process. Returns a proxy of it."""
+
+        handle = self.internet.call(self.shard, 'open', self.IP, opened_by.IP)
+        return RemoteTerminal(self, handle, opened_by)
+
+
+class RemoteTerminal(object):
+    """Proxy of a terminal living in another process.
+
+    The shard replies to every command with the number of storage units it
+    touched (counted in the worker, for the CommandScheduler) and whether
+    the terminal got closed (e.g. by a disconnect, or because its system was
+    corrupted or removed), in which case the terminal of opened_by
+    connected to it is disconnected.
+
+    Attributes:
+        os: RemoteSystem the terminal belongs to.
+        handle: id of the terminal in its shard (None for the main terminal).
+        opened_by: system that opened the terminal.
+        connected_to: always None, a proxied terminal forwards everything to its shard.
+    """
+
+    def __init__(self, os, handle, opened_by):
+        self.os = os
+        self.handle = handle
+        self.opened_by = opened_by
+        self.connected_to = None
+
+    def run_command(self, args):
+        return self.run_counted(args)[0]
+
+    def run_counted(self, args):
+        response, nodes, closed = self._call('run', args)
+        if closed:
+            self._detach()
+        return response, nodes
+
+    def new_line(self):
+        line, closed = self._call('new_line')
+        if closed:
+            self._detach()
+            return self.opened_by.main_terminal.new_line()
+        return line
+
+    def stream_tree(self, args):
+        yield from self.collect_tree(args)[0]
+
+    def collect_tree(self, args):
+        lines, nodes, closed = self._call('tree', args)
+        if closed:
+            self._detach()
+        return lines, nodes
+
+    def _disconnect(self, _):
+        self._call('close')
+        self._detach()
+        return {'exit_code': 0, 'stdout': f'Disconnect from {self.os.IP}.', 'stderr': None}
+
+    def _call(self, op, *args):
+        return self.os.internet.call(self.os.shard, op, self.os.IP, self.handle, *args)
+
+    def _detach(self):
+        if self.opened_by.main_terminal.connected_to is self:
+            self.opened_by.main_terminal.connected_to = None
+
+
+class ShardInternet(Internet):
+    """Internet of a shard worker, holding the systems whose IP hashes to it.
+
+    Systems of the other shards are reached through RemoteSystem proxies, so
+    connect works across shards. Requests are served one at a time under
+    lock, which is released while waiting on another shard, so two shards
+    calling each other cannot deadlock. Requests on the same system are
+    still kept in order by the system locks of the ShardWorker.
+
+    Attributes:
+        shard: index of this shard (None until join is called).
+        lock: lock held while serving a request.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.shard = None
+        self.lock = threading.Lock()
+        self._peers = {}
+
+    def join(self, shard, addresses, authkey):
+        """Makes this internet the shard with the given index among the workers listening on addresses."""
+
+        self.shard = shard
+        self._peers = {index: ShardConnection(address, authkey) for index, address in enumerate(addresses) if index != shard}
+
+    def get_os_by_ip(self, ip):
+        try:
+            return self.ip_registry.lookup(ip)
+        except exceptions.OSNotFound:
+            if not self._peers:
+                raise
+        try:
+            shard = shard_of(ip, len(self._peers) + 1)
+        except (ValueError, AttributeError):
+            raise exceptions.OSNotFound('os not found.', ip)
+        if shard == self.shard:
+            raise exceptions.OSNotFound('os not found.', ip)
+        self.call(shard, 'lookup', ip)
+        return RemoteSystem(self, shard, ip)
+
+    def call(self, shard, *request):
+        """Sends a request to another shard, letting this one serve requests while waiting."""
+
+        self.lock.release()
+        try:
+            return self._peers[shard].call(*request)
+        finally:
+            self.lock.acquire()
+
+
+class ShardWorker(object):
+    """Serves the requests sent to a shard, one thread per connection.
+
+    Terminals opened by systems of other shards are kept under integer
+    handles. Their opened_by is a stand-in holding the IP of the remote
+    system, which is all a terminal needs from it.
+
+    Requests creating or removing a system, or using its main terminal, hold
+    the lock of that system (taken before the shard lock) for their whole
+    run, so they stay serialized even while the shard lock is released to
+    wait on another shard. Requests of other shards on the terminals they
+    opened only take the shard lock: they are sent from within a command
+    holding the lock of the remote system, and two systems connected to
+    each other would otherwise wait on each other.
+
+    Each worker keeps its generated ids in its own files, named after the
+    files of the id allocator with a .shard<n> suffix, and its own command
+    metrics, which the router collects with the metrics request.
+
+    Attributes:
+        internet: ShardInternet of the worker.
+        listener: listener accepting the connections of the router and the other shards.
+    """
+
+    def __init__(self, internet, listener):
+        self.internet = internet
+        self.listener = listener
+        self._terminals = {}
+        self._next_handle = 0
+        self._system_locks = {}
+        self._system_locks_guard = threading.Lock()
+        self._stopped = threading.Event()
+        internet.on_remove(self._forget_system)
+        self.ops = {
+            'new': self._new,
+            'remove': self._remove,
+            'lookup': self._lookup,
+            'ips': self._ips,
+            'open': self._open,
+            'run': self._run,
+            'new_line': self._new_line,
+            'tree': self._tree,
+            'close': self._close,
+            'metrics': self._metrics,
+            'shutdown': self._shutdown,
+        }
+
+    @staticmethod
+    def run(shard, addresses, authkey, journal_path, ready):
+        """Entry point of a worker process: loads the shard, reports on ready and serves until shut down."""
+
+        Metrics.registry = CommandMetrics()
+        allocator = IdGenerator.allocator
+        allocator.use_files(ShardWorker.shard_path(allocator.ids_path, shard), ShardWorker.shard_path(allocator.journal_path, shard))
+        if journal_path:
+            internet = Journal.recover(journal_path, ShardInternet)
+        else:
+            internet = ShardInternet()
+        internet.join(shard, addresses, authkey)
+        listener = Listener(addresses[shard], family='AF_UNIX', authkey=authkey)
+        logger.info('Shard %s serving %s systems on %s.', shard, len(internet.ip_registry), addresses[shard])
+        ready.send(shard)
+        ready.close()
+        ShardWorker(internet, listener).serve()
+
+    def serve(self):
+        """Accepts connections until a shutdown request, then closes the journal."""
+
+        threading.Thread(target=self._accept, daemon=True).start()
+        self._stopped.wait()
+        self.listener.close()
+        with self.internet.lock:
+            if self.internet.journal:
+                self.internet.journal.close()
+            IdGenerator.allocator.flush()
+
+    @staticmethod
+    def shard_path(path, shard):
+        """Returns the path of the file of a shard standing for a file shared by the whole internet."""
+
+        root, extension = os.path.splitext(path)
+        return f'{root}.shard{shard}{extension}'
+
+    def _accept(self):
+        while not self._stopped.is_set():
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn):
+        while True:
+            try:
+                op, *args = conn.recv()
+            except (EOFError, OSError):
+                break
+            system_lock = self._system_lock(op, args)
+            if system_lock:
+                system_lock.acquire()
+            try:
+                with self.internet.lock:
+                    try:
+                        reply = ('ok', self.ops[op](*args))
+                    except Exception as e:
+                        reply = ('error', (type(e).__name__, getattr(e, 'message', None) or str(e)))
+            finally:
+                if system_lock:
+                    system_lock.release()
+            try:
+                conn.send(reply)
+            except OSError:
+                break
+        conn.close()
+
+    def _system_lock(self, op, args):
+        """Returns the lock of the system a request must hold, or None for the requests of other shards."""
+
+        if op == 'new':
+            ip = args[2]
+        elif op == 'remove' or (op in ('run', 'new_line', 'tree', 'close') and args[1] is None):
+            ip = args[0]
+        else:
+            return None
+        with self._system_locks_guard:
+            lock = self._system_locks.get(ip)
+            if lock is None:
+                lock = self._system_locks[ip] = threading.Lock()
+            return lock
+
+    def _forget_system(self, ip):
+        """Drops the lock of a removed system. The request removing it still holds and releases it."""
+
+        with self._system_locks_guard:
+            self._system_locks.pop(ip, None)
+
+    def _new(self, username, password, ip):
+        return self.internet.add_os(username, password, ip).IP
+
+    def _remove(self, ip):
+        self.internet.remove_os(ip)
+
+    def _lookup(self, ip):
+        self.internet.ip_registry.lookup(ip)
+        return True
+
+    def _ips(self):
+        return [v_os.IP for v_os in self.internet.operating_systems]
+
+    def _open(self, ip, opener_ip):
+        opened_by = SimpleNamespace(IP=opener_ip, main_terminal=SimpleNamespace(connected_to=None))
+        terminal = self.internet.ip_registry.lookup(ip).get_terminal(opened_by)
+        self._next_handle += 1
+        self._terminals[self._next_handle] = terminal
+        return self._next_handle
+
+    def _run(self, ip, handle, args):
+        terminal = self._terminal(ip, handle)
+        if terminal is None:
+            return {'exit_code': 1, 'stdout': None, 'stderr': f'Connection to {ip} was lost.'}, 0, True
+        response, nodes = terminal.run_counted(args)
+        return response, nodes, self._closed(handle)
+
+    def _new_line(self, ip, handle):
+        terminal = self._terminal(ip, handle)
+        if terminal is None:
+            return None, True
+        return terminal.new_line(), False
+
+    def _tree(self, ip, handle, args):
+        terminal = self._terminal(ip, handle)
+        if terminal is None:
+            return [f'Connection to {ip} was lost.'], 0, True
+        lines, nodes = terminal.collect_tree(args)
+        return lines, nodes, self._closed(handle)
+
+    def _close(self, ip, handle):
+        terminal = self._terminal(ip, handle)
+        if terminal is not None and handle is not None:
+            terminal._disconnect([])
+        self._terminals.pop(handle, None)
+
+    def _metrics(self):
+        return Metrics.registry.export()
+
+    def _shutdown(self):
+        self._stopped.set()
+
+    def _terminal(self, ip, handle):
+        """Returns the terminal of a handle (the main terminal of ip for None), or None if it was closed."""
+
+        if handle is None:
+            return self.internet.ip_registry.lookup(ip).main_terminal
+        terminal = self._terminals.get(handle)
+        if terminal is None or self._closed(handle):
+            return None
+        return terminal
+
+    def _closed(self, handle):
+        """Returns True (and forgets the handle) if the terminal of a handle was closed or its system removed."""
+
+        if handle is None:
+            return False
+        terminal = self._terminals[handle]
+        if terminal in terminal.os.terminals and terminal.os.IP in self.internet.ip_registry:
+            return False
+        del self._terminals[handle]
+        return True
+
+
+class ShardedInternet(object):
+    """Internet whose systems are partitioned across worker processes by IP hash.
+
+    This process only routes: it allocates the IP addresses, so that they
+    stay unique across shards, and hands out RemoteSystem proxies that
+    forward every terminal call to the worker owning the system. It can be
+    used in place of an Internet by the Gateway.
+
+    Each worker keeps its own journal at <journal_path>.shard<n>, and the
+    systems it recovers are registered here when it starts.
+
+    Attributes:
+        shards: number of worker processes.
+        ip_registry: registry of every IP address in use, bound to the proxies.
+        journal: always None, journaling happens in the workers.
+    """
+
+    def __init__(self, shards=2, journal_path=None):
+        """Starts the worker processes and waits until all of them are serving.
+
+        Arguments:
+            shards -- number of worker processes.
+            journal_path -- base path of the journals of the workers (no journal if None).
+        """
+
+        self.shards = shards
+        self.ip_registry = IpRegistry()
+        self.journal = None
+        self._removal_hooks = []
+        self._directory = tempfile.mkdtemp(prefix='hacknet-shards-')
+        authkey = os.urandom(16)
+        addresses = [os.path.join(self._directory, f'shard{index}.sock') for index in range(shards)]
+
+        context = multiprocessing.get_context('fork')
+        self.processes = []
+        waiting = []
+        for index in range(shards):
+            reader, writer = context.Pipe(duplex=False)
+            shard_journal = f'{journal_path}.shard{index}' if journal_path else None
+            process = context.Process(target=ShardWorker.run, args=(index, addresses, authkey, shard_journal, writer), name=f'hacknet-shard-{index}', daemon=True)
+            process.start()
+            writer.close()
+            self.processes.append(process)
+            waiting.append(reader)
+        for index, reader in enumerate(waiting):
+            try:
+                reader.recv()
+            except EOFError:
+                self.close()
+                raise RuntimeError(f'Shard {index} failed to start.')
+            reader.close()
+
+        self._connections = [ShardConnection(address, authkey) for address in addresses]
+        for index in range(shards):
+            for ip in self.call(index, 'ips'):
+                self.ip_registry.claim(ip)
+                self.ip_registry.register(ip, RemoteSystem(self, index, ip))
+        atexit.register(self.close)
+        logger.info('Started %s shards with %s systems.', shards, len(self.ip_registry))
+
+    @property
+    def operating_systems(self):
+        return list(self.ip_registry.systems())
+
+    def add_os(self, username, password, ip=None):
+        """Creates a system in the shard owning its IP (a free one unless given). Returns its proxy."""
+
+        ip = self.ip_registry.claim(ip) if ip else self.ip_registry.allocate()
+        shard = shard_of(ip, self.shards)
+        try:
+            self.call(shard, 'new', username, password, ip)
+        except Exception:
+            self.ip_registry.release(ip)
+            raise
+        v_os = RemoteSystem(self, shard, ip)
+        self.ip_registry.register(ip, v_os)
+        return v_os
+
+    def remove_os(self, ip):
+        """Tears down the system with the given IP in its shard and releases its address."""
+
+        v_os = self.get_os_by_ip(ip)
+        self.call(v_os.shard, 'remove', ip)
+        self.ip_registry.release(ip)
+        for hook in self._removal_hooks:
+            hook(ip)
+        return v_os
+
+    def on_remove(self, hook):
+        """Registers a function called with the IP of every system removed from the internet."""
+
+        self._removal_hooks.append(hook)
+
+    def get_os_by_ip(self, ip):
+        return self.ip_registry.lookup(ip)
+
+    def metrics(self):
+        """Returns the command metrics of every worker merged into one CommandMetrics."""
+
+        merged = CommandMetrics(Metrics.registry.buckets, Metrics.registry.top_systems)
+        for shard in range(self.shards):
+            merged.merge(self.call(shard, 'metrics'))
+        return merged
+
+    def call(self, shard, *request):
+        """Sends a request to a shard and returns the value it replied with."""
+
+        return self._connections[shard].call(*request)
+
+    def close(self):
+        """Shuts the workers down, letting them close their journals."""
+
+        if not self.processes:
+            return
+        for connection in getattr(self, '_connections', []):
+            try:
+                connection.call('shutdown')
+            except (OSError, EOFError):
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        shutil.rmtree(self._directory, ignore_errors=True)
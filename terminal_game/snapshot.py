@@ -0,0 +1,391 @@
+import os
+import struct
+
+from utils import exceptions
+from utils.id_generator import IdGenerator
+from utils.content_pool import ContentPool
+from utils.ip_registry import IpRegistry
+from utils.my_logging import get_logger
+from terminal_game.storage_unit import StorageUnit
+from terminal_game.directory import Directory
+from terminal_game.root_dir import RootDir
+from terminal_game.file import File
+from terminal_game.system import System
+from terminal_game.terminal import Terminal
+
+
+logger = get_logger(__name__)
+
+MAGIC = b'HNSN'
+VERSION = 1
+
+DIRECTORY = 0
+TEXT_FILE = 1
+BYTES_FILE = 2
+
+_U8 = struct.Struct('<B')
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+_UNIT = struct.Struct('<BIB')
+
+LAYERED = 0xFFFFFFFF
+
+
+def save(internet, path):
+    """Writes every system of an internet to a snapshot file.
+
+    The file is written next to path first and then moved over it, so an
+    interrupted save never leaves a broken snapshot behind.
+    """
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        SnapshotWriter(f).write_internet(internet)
+    os.replace(tmp_path, path)
+    logger.info('Saved snapshot of %s systems to %s.', len(internet.ip_registry), path)
+
+
+def load(path, internet):
+    """Loads every system of a snapshot file into an empty internet and returns it."""
+
+    with open(path, 'rb') as f:
+        SnapshotReader(f).read_internet(internet)
+    logger.info('Loaded snapshot of %s systems from %s.', len(internet.ip_registry), path)
+    return internet
+
+
+class SnapshotWriter(object):
+    """Writes an internet to a compact binary snapshot.
+
+    Layout (all integers little endian):
+        header -- magic b'HNSN', u16 version, u32 number of systems.
+        system -- u32 packed IP, username, password, root directory, terminal state.
+        directory -- u8 id length + id, u32 number of children, then every child.
+        layered directory -- u8 id length + id, u32 0xFFFFFFFF, u32 index of its base directory.
+        child -- u8 kind, u32 name index, u8 id length, the name (first use only), the id, then the children (directory) or u32 length + contents (file).
+        terminal state -- path of the main terminal's directory, u32 packed IP of the connected system (0 if none), path of the connected terminal's directory.
+        base layer -- u32 number of base trees, then every base tree as a root directory.
+    Strings are u32 length + utf-8. Names are interned: a name is written as
+    its index in the name table, and its u16 length and utf-8 bytes only
+    follow the first time it appears.
+
+    Directories still backed by the shared base layer are written as a
+    reference to their base directory, and the base layer is written once
+    at the end of the file, with empty ids. Base directories are numbered in
+    the order they are written, across every base tree. Materialized
+    directories list their own children, so a system only stores what it
+    overrides.
+    """
+
+    def __init__(self, f):
+        """Initializes the writer using a file opened in binary mode."""
+
+        self.f = f
+        self.names = {}
+        self.bases = {}
+        self.base_roots = []
+
+    def write_internet(self, internet):
+        systems = list(internet.ip_registry.systems())
+        self.f.write(MAGIC)
+        self.f.write(_U16.pack(VERSION))
+        self.f.write(_U32.pack(len(systems)))
+        for v_os in systems:
+            self.write_system(v_os)
+        self.write_base_layer()
+
+    def write_base_layer(self):
+        """Writes every base tree referenced by the systems, once."""
+
+        self.f.write(_U32.pack(len(self.base_roots)))
+        for root in self.base_roots:
+            self._tree(root, True)
+
+    def write_system(self, v_os):
+        self.f.write(_U32.pack(IpRegistry.pack(v_os.IP)))
+        self._string(v_os.username)
+        self._string(v_os.password)
+        self._tree(v_os.root)
+
+        main_terminal = v_os.main_terminal
+        self._string(main_terminal.current_dir.get_path())
+        if isinstance(main_terminal.connected_to, Terminal):
+            self.f.write(_U32.pack(IpRegistry.pack(main_terminal.connected_to.os.IP)))
+            self._string(main_terminal.connected_to.current_dir.get_path())
+        else:
+            self.f.write(_U32.pack(0))
+            self._string('')
+
+    def _tree(self, root, base=False):
+        """Writes a directory and everything inside it, depth first, without recursion.
+
+        Arguments:
+            root -- root directory to write.
+            base -- True when writing a tree of the base layer, whose units are written in full and without ids.
+        """
+
+        write = self.f.write
+        self._suid('' if base else root.get_id())
+        layer = None if base else root._base
+        if layer is not None:
+            write(_U32.pack(LAYERED))
+            write(_U32.pack(self._base_ref(layer)))
+            return
+        children, shared = root.peek_contents()
+        write(_U32.pack(len(children)))
+
+        stack = [(iter(children), base or shared)]
+        while stack:
+            children, shared = stack[-1]
+            unit = next(children, None)
+            if unit is None:
+                stack.pop()
+                continue
+
+            if isinstance(unit, Directory):
+                self._unit(DIRECTORY, unit, shared)
+                layer = None if shared else unit._base
+                if layer is not None:
+                    write(_U32.pack(LAYERED))
+                    write(_U32.pack(self._base_ref(layer)))
+                    continue
+                grandchildren, grandchildren_shared = unit.peek_contents()
+                write(_U32.pack(len(grandchildren)))
+                stack.append((iter(grandchildren), shared or grandchildren_shared))
+            else:
+                self._unit(TEXT_FILE if unit.is_text() else BYTES_FILE, unit, shared)
+                contents = unit.get_view()
+                write(_U32.pack(len(contents)))
+                write(contents)
+
+    def _base_ref(self, directory):
+        """Returns the index of a base directory, numbering the directories of its base tree on first use."""
+
+        ref = self.bases.get(id(directory))
+        if ref is not None:
+            return ref
+
+        root = directory
+        while root.get_parent() is not None:
+            root = root.get_parent()
+        self.base_roots.append(root)
+        self.bases[id(root)] = len(self.bases)
+        stack = [iter(root.peek_contents()[0])]
+        while stack:
+            unit = next(stack[-1], None)
+            if unit is None:
+                stack.pop()
+            elif isinstance(unit, Directory):
+                self.bases[id(unit)] = len(self.bases)
+                stack.append(iter(unit.peek_contents()[0]))
+        return self.bases[id(directory)]
+
+    def _unit(self, kind, unit, shared):
+        """Writes the kind, name and id of a storage unit."""
+
+        name = unit.get_name()
+        suid = b'' if shared else unit.get_id().split('-', 1)[-1].encode('ascii')
+        ref = self.names.get(name)
+        if ref is not None:
+            self.f.write(_UNIT.pack(kind, ref, len(suid)))
+        else:
+            ref = self.names[name] = len(self.names)
+            data = name.encode('utf-8')
+            self.f.write(_UNIT.pack(kind, ref, len(suid)))
+            self.f.write(_U16.pack(len(data)))
+            self.f.write(data)
+        self.f.write(suid)
+
+    def _suid(self, suid):
+        data = suid.split('-', 1)[-1].encode('ascii') if suid else b''
+        self.f.write(_U8.pack(len(data)))
+        self.f.write(data)
+
+    def _string(self, string):
+        data = string.encode('utf-8')
+        self.f.write(_U32.pack(len(data)))
+        self.f.write(data)
+
+
+class SnapshotReader(object):
+    """Streaming reader for the snapshots written by SnapshotWriter.
+
+    The file is read in large chunks and decoded in place, and storage units
+    are linked directly through the trusted constructors instead of going
+    through System.__init__ and the validating setters.
+    """
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, f):
+        """Initializes the reader using a file opened in binary mode."""
+
+        self.f = f
+        self.names = []
+        self.suids = []
+        self.pending = []
+        self.layered = []
+        self.bases = []
+        self._buf = b''
+        self._pos = 0
+
+    def read_internet(self, internet):
+        if self._read(4) != MAGIC:
+            raise exceptions.SnapshotError('Not a snapshot file.')
+        version = self._u16()
+        if version != VERSION:
+            raise exceptions.SnapshotError(f'Unsupported snapshot version {version}.', version)
+
+        systems = []
+        for _ in range(self._u32()):
+            systems.append(self.read_system(internet))
+        self.read_base_layer()
+
+        IdGenerator.claim(self.suids)
+        IdGenerator.reserve(len(self.pending), StorageUnit.ID_LENGTH)
+        for unit in self.pending:
+            unit.SUID = unit.generate_suid()
+        for v_os, path, _ in systems:
+            v_os.main_terminal.current_dir = self._directory(v_os, path)
+        for v_os, _, connection in systems:
+            if not connection:
+                continue
+            ip, path = connection
+            try:
+                remote_os = internet.get_os_by_ip(ip)
+            except exceptions.OSNotFound:
+                continue
+            remote_terminal = Terminal(remote_os, v_os)
+            remote_os.terminals.append(remote_terminal)
+            remote_terminal.current_dir = self._directory(remote_os, path)
+            v_os.main_terminal.connected_to = remote_terminal
+        return internet
+
+    def read_system(self, internet):
+        """Reads one system and registers it.
+
+        Returns the system, the path of its main terminal's directory and its
+        (ip, path) connection, if any. The paths are only resolved once the
+        base layer is read.
+        """
+
+        ip = IpRegistry.unpack(self._u32())
+        username = self._string()
+        password = self._string()
+        root = self._tree()
+
+        internet.ip_registry.claim(ip)
+        v_os = System.restore(internet, ip, username, password, root)
+        internet.ip_registry.register(ip, v_os)
+
+        path = self._string()
+        connected_ip = self._u32()
+        connected_path = self._string()
+        return v_os, path, (IpRegistry.unpack(connected_ip), connected_path) if connected_ip else None
+
+    def read_base_layer(self):
+        """Reads the base trees and links every layered directory to its base directory."""
+
+        for _ in range(self._u32()):
+            self._tree(self.bases)
+        for directory, ref in self.layered:
+            if ref >= len(self.bases):
+                raise exceptions.SnapshotError('Unknown base directory.', ref)
+            directory._base = self.bases[ref]
+
+    def _tree(self, directories=None):
+        """Reads a root directory and everything inside it, without recursion.
+
+        Arguments:
+            directories -- (optional) list every directory read is appended to, in order.
+        """
+
+        root = self._pending(RootDir.new_trusted('', {}, None, self._suid('DIR')))
+        if directories is not None:
+            directories.append(root)
+        stack = [(root, self._children(root))]
+        while stack:
+            parent, remaining = stack[-1]
+            if remaining == 0:
+                stack.pop()
+                continue
+            stack[-1] = (parent, remaining - 1)
+
+            kind, ref, suid_length = _UNIT.unpack(self._read(_UNIT.size))
+            if ref == len(self.names):
+                self.names.append(self._read(self._u16()).decode('utf-8'))
+            elif ref > len(self.names):
+                raise exceptions.SnapshotError('Name used before being defined.', ref)
+            name = self.names[ref]
+
+            if kind == DIRECTORY:
+                unit = self._pending(Directory.new_trusted(name, {}, parent, self._suid('DIR', suid_length)))
+                if directories is not None:
+                    directories.append(unit)
+                stack.append((unit, self._children(unit)))
+            elif kind in (TEXT_FILE, BYTES_FILE):
+                suid = self._suid('FIL', suid_length)
+                contents = ContentPool.load(self._read(self._u32()), kind == TEXT_FILE)
+                unit = self._pending(File.new_trusted(name, contents, parent, suid))
+                ContentPool.release(contents)
+            else:
+                raise exceptions.SnapshotError(f'Unknown storage unit kind {kind}.', kind)
+            parent.contents[name] = unit
+        return root
+
+    def _children(self, directory):
+        """Reads the number of children of a directory, or the reference to its base directory."""
+
+        count = self._u32()
+        if count != LAYERED:
+            return count
+        self.layered.append((directory, self._u32()))
+        return 0
+
+    def _directory(self, v_os, path):
+        """Returns the directory at a saved path, or the root if it does not exist anymore."""
+
+        try:
+            directory = v_os.parse_path(path)
+        except exceptions.OSInvalidPath:
+            return v_os.root
+        return directory if isinstance(directory, Directory) else v_os.root
+
+    def _pending(self, unit):
+        """Remembers a storage unit saved without an id, so that it gets one once every saved id is claimed."""
+
+        if unit.SUID.endswith('-'):
+            self.pending.append(unit)
+        return unit
+
+    def _suid(self, prefix, length=None):
+        data = self._read(self._u8() if length is None else length)
+        if not data:
+            return f'{prefix}-'
+        suid = data.decode('ascii')
+        self.suids.append(suid)
+        return f'{prefix}-{suid}'
+
+    def _string(self):
+        return self._read(self._u32()).decode('utf-8')
+
+    def _u8(self):
+        return _U8.unpack(self._read(1))[0]
+
+    def _u16(self):
+        return _U16.unpack(self._read(2))[0]
+
+    def _u32(self):
+        return _U32.unpack(self._read(4))[0]
+
+    def _read(self, n):
+        end = self._pos + n
+        if end > len(self._buf):
+            self._buf = self._buf[self._pos:] + self.f.read(max(n, self.CHUNK_SIZE))
+            self._pos = 0
+            end = n
+            if end > len(self._buf):
+                raise exceptions.SnapshotError('Snapshot file is truncated.')
+        data = self._buf[self._pos:end]
+        self._pos = end
+        return data
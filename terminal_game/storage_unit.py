@@ -1,3 +1,6 @@
+import sys
+import threading
+
 from utils import exceptions
 from utils.my_logging import get_logger
 from utils.id_generator import IdGenerator
@@ -6,6 +9,39 @@ from utils.id_generator import IdGenerator
 logger = get_logger(__name__)
 
 
+class Topology(object):
+    """Version of the shape of one file system, shared by all its storage units.
+
+    The counters are bumped under a lock whenever a storage unit of the
+    file system is renamed or moved (version), or added, deleted or renamed
+    (changes), so they are safe to use from the threads of every front-end.
+
+    Attributes:
+        version: number of renames and moves so far.
+        changes: number of storage units added, deleted or renamed so far.
+    """
+
+    __slots__ = ('version', 'changes', '_lock')
+
+    def __init__(self):
+        self.version = 0
+        self.changes = 0
+        self._lock = threading.Lock()
+
+    def bump(self):
+        """Counts a rename or move. Returns the new version."""
+
+        with self._lock:
+            self.version += 1
+            return self.version
+
+    def changed(self):
+        """Counts a storage unit added, deleted or renamed."""
+
+        with self._lock:
+            self.changes += 1
+
+
 class StorageUnit(object):
     """Storage unit of a file system.
 
@@ -13,12 +49,22 @@ class StorageUnit(object):
     This class cannot be used on it's own.
     It can be used either as a File or a Directory.
 
+    Storage units use __slots__ to keep millions of them cheap: the id is
+    kept as an integer code and only formatted by SUID, and names are interned.
+    Slots cannot have class-level defaults, so they are set by _init_slots.
+
     Attributes:
         name: string representing the name of the storage unit.
         contents: stores the contents of the storage unit. 
         parent: Directory which the storage unit belongs to.       
+        SUID: id of the storage unit, e.g. 'FIL-ABCD' (stored as an integer code).
     """
 
+    __slots__ = ('_id', 'name', 'contents', 'parent', '_watchers', '_path', '_path_version', '_topology')
+
+    ID_PREFIX = 'SU'
+    ID_LENGTH = 4
+
     def __init__(self, suid, name: str, contents, parent):
         """Inits StorageUnit using name, contents and a parent.
         
@@ -28,8 +74,9 @@ class StorageUnit(object):
             parent -- Directory which the storage unity belongs to.
         """
 
+        self._init_slots()
         self.SUID = suid
-        logger.info(f'Initializing {self.__class__.__name__} with id {self.SUID}.')
+        logger.debug('Initializing %s with id %s.', self.__class__.__name__, self.SUID)
 
         self.set_parent(parent)
         self.set_name(name)
@@ -39,22 +86,107 @@ class StorageUnit(object):
         """Sets the self.name attribute to name."""
 
         self._validate_name(name)
-        self.name = name
-        logger.info(f'Setting name for {self.__class__.__name__} with id {self.SUID} to "{name}".')
+        old_name = self.get_name() if self._has_name() else None
+        self._store_name(name)
+        if old_name is not None:
+            self._path_moved()
+            if self.get_parent():
+                self.get_parent().rename_su(self, old_name)
+        self._changed()
+        logger.debug('Setting name for %s with id %s to "%s".', self.__class__.__name__, self.SUID, name)
 
     def set_contents(self, contents):
         """Sets the self.contents attribute to contents."""
 
         self._validate_contents(contents)
         self.contents = contents
-        logger.info(f'Setting contents for {self.__class__.__name__} with id {self.SUID}.')
+        self._changed()
+        logger.debug('Setting contents for %s with id %s.', self.__class__.__name__, self.SUID)
 
     def set_parent(self, parent):
         """Sets the self.parent attribute to parent"""
 
         self._validate_parent(parent)
+        moved = getattr(self, 'parent', None) not in (None, parent)
         self.parent = parent
-        logger.info(f'Setting parent for {self.__class__.__name__} with id {self.SUID}.')
+        if parent is None:
+            if self._topology is None:
+                self._topology = Topology()
+        elif parent._topology is not self._topology:
+            self._set_topology(parent._topology)
+        if moved:
+            self._path_moved()
+        self._changed()
+        logger.debug('Setting parent for %s with id %s.', self.__class__.__name__, self.SUID)
+
+    @classmethod
+    def new_trusted(cls, name: str, contents, parent, suid=None):
+        """Creates a storage unit from values already known to be valid.
+
+        Skips validation and logging, and does not add the unit to the parent.
+        Only meant for copying trees that have been validated before.
+        A new id is generated unless one is given.
+        """
+
+        unit = cls.__new__(cls)
+        unit._init_slots()
+        unit.SUID = suid if suid else cls.generate_suid()
+        unit.parent = parent
+        unit._topology = parent._topology if parent is not None else Topology()
+        unit._store_name(name)
+        unit.contents = contents
+        return unit
+
+    @classmethod
+    def generate_suid(cls):
+        """Returns the integer code of a new id for a storage unit of this class."""
+
+        return IdGenerator.generate_code(cls.ID_LENGTH)
+
+    @property
+    def SUID(self):
+        """Returns the id of the storage unit, e.g. 'FIL-ABCD' ('FIL-' if it has none yet)."""
+
+        if self._id is None:
+            return f'{self.ID_PREFIX}-'
+        return f'{self.ID_PREFIX}-{IdGenerator.format_id(self._id, self.ID_LENGTH)}'
+
+    @SUID.setter
+    def SUID(self, suid):
+        """Sets the id from its integer code or from its formatted form."""
+
+        if isinstance(suid, str):
+            suid = suid.split('-', 1)[-1]
+            suid = IdGenerator.parse_id(suid) if suid else None
+        self._id = suid
+
+    def _init_slots(self):
+        """Gives the slots that have a default value their default."""
+
+        self._watchers = None
+        self._path = None
+        self._path_version = -1
+        self._topology = None
+
+    def add_watcher(self, guard):
+        """Makes the storage unit notify an IntegrityGuard whenever it changes."""
+
+        if self._watchers is None:
+            self._watchers = []
+        self._watchers.append(guard)
+
+    def remove_watcher(self, guard):
+        """Stops notifying an IntegrityGuard."""
+
+        if self._watchers and guard in self._watchers:
+            self._watchers.remove(guard)
+
+    def _changed(self):
+        """Notifies the guards watching the storage unit that it changed."""
+
+        if self._watchers:
+            for guard in self._watchers:
+                guard.changed()
 
     def get_id(self):
         """Returns the id of the storage unit."""
@@ -76,19 +208,84 @@ class StorageUnit(object):
 
         return self.parent
 
+    def get_topology(self):
+        """Returns the Topology of the file system the storage unit belongs to."""
+
+        return self._topology
+
     def get_path(self):
-        """Returns the absolute path of the storage unit."""
+        """Returns the absolute path of the storage unit.
+
+        Paths are memoized on every unit they are built for, with the
+        version of the file system's Topology they were built at. A hit only
+        compares that stamp with the current version. After a rename or move,
+        a path is built again from the nearest parent whose path is already
+        up to date, which stamps every unit on the way.
+        """
+
+        version = self._topology.version
+        if self._path_version == version:
+            return self._path
+
+        chain = []
+        node = self
+        while node is not None and node._path_version != version:
+            chain.append(node)
+            node = node.parent
+        path = '' if node is None else node._path
+        for node in reversed(chain):
+            path += node._path_segment()
+            node._path = path
+            node._path_version = version
+        return path
+
+    def _path_segment(self):
+        """Returns what the storage unit adds to the path of its parent."""
+
+        return self.get_name()
 
-        return f'{self.get_parent().get_path()}{self.get_name()}'
+    def _path_moved(self):
+        """Bumps the version of the file system after the storage unit was renamed or moved, invalidating the cached paths."""
+
+        self._topology.bump()
+
+    def _set_topology(self, topology):
+        """Makes the storage unit part of the file system a Topology belongs to."""
+
+        self._topology = topology
+
+    @classmethod
+    def normalize_name(cls, name: str):
+        """Returns the name a storage unit of this class stores for a valid name."""
+
+        return name
+
+    def _store_name(self, name: str):
+        """Stores an already validated name, interned so that equal names share one string."""
+
+        self.name = sys.intern(self.normalize_name(name))
+
+    def _has_name(self):
+        """Returns True once a name has been stored."""
+
+        return hasattr(self, 'name')
 
     def _validate_name(self, name: str):
         """Raises appropriate exception if a name is not of valid format."""
 
-        logger.info(f'Validating name for {self.__class__.__name__} with id {self.SUID}.')
+        logger.debug('Validating name for %s with id %s.', self.__class__.__name__, self.SUID)
         if not isinstance(name, str):
             raise exceptions.SUNameError('Name has to be of type string.', name)
-        if name in [unit.get_name() for unit in self.get_parent().get_contents()]:
+        if self.get_parent().has_su(name):
             raise exceptions.SUNameError('Another storage unit with this name already exists in the parent directory.', name)
+        StorageUnit.check_name(name)
+
+    @staticmethod
+    def check_name(name):
+        """Raises SUNameError if a name is not of valid format (whatever directory it goes in)."""
+
+        if not isinstance(name, str):
+            raise exceptions.SUNameError('Name has to be of type string.', name)
         if len(name) < 1:
             raise exceptions.SUNameError('Name cannot be empty.', name)
         if len(name) > 50:
@@ -100,14 +297,14 @@ class StorageUnit(object):
     def _validate_contents(self, contents):
         """Raises appropriate exception if contents are not of valid format."""
 
-        logger.info(f'Validating contents for storage unit with id {self.SUID}.')
+        logger.debug('Validating contents for storage unit with id %s.', self.SUID)
         if not (isinstance(contents, str) or isinstance(contents, bytes) or isinstance(contents, list)):
             raise exceptions.SUInvalidContents(f'Contents cannot be of type {type(contents)}', contents)
 
     def _validate_parent(self, parent):
         """Raises appropriate exception if parent is not of valid type."""
         
-        logger.info(f'Validating parent for {self.__class__.__name__} with id {self.SUID}.')
+        logger.debug('Validating parent for %s with id %s.', self.__class__.__name__, self.SUID)
         from terminal_game.directory import Directory
         if not isinstance(parent, Directory):
             raise exceptions.SUInvalidParent('Parent needs to be of type Directory', parent)
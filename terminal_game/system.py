@@ -5,11 +5,15 @@ from logging import log
 
 from typing import Type
 from utils.parser import Parser
-from utils.ip_generator import IpGenerator
 from utils import exceptions
+from utils.metrics import Metrics
 from utils.my_logging import get_logger
 from terminal_game import directory, root_dir, file, storage_unit
 from terminal_game import terminal
+from terminal_game.integrity import IntegrityGuard
+from terminal_game.path_cache import PathCache
+from terminal_game.search_index import SearchIndex
+from terminal_game.tree_builder import TreeBuilder
 
 
 logger = get_logger(__name__)
@@ -27,45 +31,75 @@ class System(object):
         password: password of the owner of the operating system.
     """
 
-    def __init__(self, internet, username, password):
-        """Initializes the System class using internet, username and password.
+    def __init__(self, internet, username, password, ip):
+        """Initializes the System class using internet, username, password and ip.
         
         Arguments:
             internet -- an instance of the Internet class storing all operating systems.
             username -- string representing the username of the owner.
             password -- string representing the password of the owner.
+            ip -- IP address allocated to the system by the internet's IP registry.
         """
 
-        self.IP = IpGenerator.generate_ip()
-        logger.info(f'Initializing OS with IP {self.IP}.')
+        self.IP = ip
+        logger.debug('Initializing OS with IP %s.', self.IP)
 
         self.set_internet(internet)
         self.set_username(username)
         self.set_password(password)
 
-        with open('res/os_root.json', 'r') as f:
-            self.root = Parser.parse_root(json.load(f))
-        logger.info(f'Setting root directory for OS with ip {self.IP}.')
+        self.root = Parser.clone_root(Parser.load_template('res/os_root.json', System.install_system_files))
+        logger.debug('Setting root directory for OS with ip %s.', self.IP)
+        logger.debug('Initialization complete for OS with ip %s.', self.IP)
+
+        self.integrity = IntegrityGuard()
+        self.path_cache = PathCache()
+        self.search_index = SearchIndex(self.root)
+        self.terminals = []
+        self.main_terminal = self.get_terminal(self)
+
+    @classmethod
+    def restore(cls, internet, ip, username, password, root):
+        """Rebuilds an operating system from saved state (e.g. a snapshot) without going through __init__.
+
+        The main terminal is created directly, so that a system saved with
+        corrupted system files is restored as it was.
+        """
+
+        v_os = cls.__new__(cls)
+        v_os.IP = ip
+        v_os.internet = internet
+        v_os.username = username
+        v_os.password = password
+        v_os.root = root
+        v_os.integrity = IntegrityGuard()
+        v_os.path_cache = PathCache()
+        v_os.search_index = SearchIndex(root)
+        v_os.terminals = [terminal.Terminal(v_os, v_os)]
+        v_os.main_terminal = v_os.terminals[0]
+        return v_os
+
+    @staticmethod
+    def install_system_files(root):
+        """Makes sure a root directory has system/system.dat holding the terminal class."""
+
         try:
-            system_dr = self.root.get_su_by_name('system')
+            system_dr = root.get_su_by_name('system')
         except exceptions.SUNotFound:
-            system_dr = self.make_dir('system', [], self.root)
+            system_dr = directory.Directory('system', [], root)
+            root.add(system_dr)
         try:
             system_data = system_dr.get_su_by_name('system.dat')
         except exceptions.SUNotFound:
-            system_data = self.make_file('system.dat', "", system_dr)
+            system_data = file.File('system.dat', "", system_dr)
+            system_dr.add(system_data)
         system_data.set_contents(pickle.dumps(terminal.Terminal))
-        logger.info(f'Initialization complete for OS with ip {self.IP}.')
-
-        self.terminals = []
-        self.main_terminal = self.get_terminal(self)
 
     def get_terminal(self, opened_by):
         """Tries to get a terminal, stored in the system files. Raises exception if data is corrupt or file not found."""
 
         self.verify_system_integrity()
-        terminal_class = pickle.loads(self.root.get_su_by_name('system').get_su_by_name('system.dat').get_contents())
-        term = terminal_class(self, opened_by)
+        term = self.integrity.terminal_class(self, opened_by)
         self.terminals.append(term)
         return term
 
@@ -79,48 +113,58 @@ class System(object):
         
         self._validate_internet(internet)
         self.internet = internet
-        logger.info(f'Setting internet for OS with ip {self.IP}.')
+        logger.debug('Setting internet for OS with ip %s.', self.IP)
 
     def set_username(self, username):
         """Sets the username for the operating system."""
 
         self._validate_username(username)
         self.username = username
-        logger.info(f'Setting username for OS with ip {self.IP}.')
+        logger.debug('Setting username for OS with ip %s.', self.IP)
 
     def set_password(self, password):
         """Sets the password for the operating system."""
 
         self._validate_password(password)
         self.password = password
-        logger.info(f'Setting password for OS with ip {self.IP}.')
+        logger.debug('Setting password for OS with ip %s.', self.IP)
 
     def make_dir(self, name, contents, parent):
-        """Makes a directory using name, contents and parent and adds it to the parent."""
+        """Makes a directory holding copies of the storage units in contents and adds it to the parent."""
 
-        dr = directory.Directory(name, [], parent)
-        for content in contents:
-            if isinstance(content, directory.Directory):
-                self.make_dir(content.get_name(), content.get_contents(), dr)
-            else:
-                self.make_file(content.get_name(), content.get_contents(), dr)
-        parent.add(dr)
-        return dr
+        return TreeBuilder.make_dir(name, contents, parent)
+
+    def copy(self, storage_unit, name, parent):
+        """Copies a storage unit and everything inside it to the parent under a new name. Returns the copy."""
+
+        return TreeBuilder.copy(storage_unit, name, parent)
 
     def make_file(self, name, contents, parent):
         """Makes a file using name, contents and parent and adds it to the parent."""
 
         fl = file.File(name, contents, parent)
         parent.add(fl)
+        Metrics.touch()
         return fl
 
     def parse_path(self, path, relative_to=None, parent_dir=False):
-        """Parses a given path and returns the SU found. Raises SUNotFound exception if no SU found."""
+        """Parses a given path and returns the SU found. Raises SUNotFound exception if no SU found.
+
+        Successful lookups are kept in the system's PathCache, so resolving
+        the same path again only compares the generations of the directories
+        it went through, until one of them changes.
+        """
 
         check_type = None
         path = path.strip()
         if path in ['', '/']:
             return self.root
+        key = (None if path[0] == '/' else relative_to, path, parent_dir)
+        cached = self.path_cache.get(key)
+        if cached is not None:
+            Metrics.touch()
+            return cached
+
         path = path.split('/')
         if path[-1] == '':
             path.pop()
@@ -135,15 +179,20 @@ class System(object):
         
         if parent_dir:
             path = path[:-1]
-        
+        Metrics.touch(len(path))
+
+        visited = []
         for part in path:
             if part == '..':
                 if current == self.root:
                     raise exceptions.OSInvalidPath('Cannot go futher back than the root directory.')
                 current = current.get_parent()
+                visited.append((current, current.get_generation()))
             elif part == '.':
                 continue
             else:
+                if isinstance(current, directory.Directory):
+                    visited.append((current, current.get_generation()))
                 try:
                     current = current.get_su_by_name(part)
                 except exceptions.SUNotFound:
@@ -154,11 +203,23 @@ class System(object):
         if check_type:
             if not isinstance(current, check_type):
                 raise exceptions.OSInvalidPath('Path not found.')
+        self.path_cache.put(key, current, visited)
         return current
 
     def verify_system_integrity(self):
+        """Raises OSCorrupted if the system files are missing or corrupted.
+
+        The system files are only loaded again after they changed since the
+        last successful verification.
+        """
+
+        if self.integrity.is_verified():
+            return
+
+        self.integrity.invalidate()
         try:
-            system_data = self.root.get_su_by_name('system').get_su_by_name('system.dat')
+            system_dr = self.root.get_su_by_name('system')
+            system_data = system_dr.get_su_by_name('system.dat')
         except Exception as e:
             raise exceptions.OSCorrupted('system files not found.')
 
@@ -170,10 +231,12 @@ class System(object):
         if terminal_class != terminal.Terminal:
             raise exceptions.OSCorrupted('system files are either not safe or corrupted.')
 
+        self.integrity.verified([system_dr, system_data], terminal_class)
+
     def _validate_internet(self, internet):
         """Raises exception if internet is not of valid type."""
 
-        logger.info(f'Validating internet for OS with ip {self.IP}.')
+        logger.debug('Validating internet for OS with ip %s.', self.IP)
         from terminal_game.internet import Internet
         if not isinstance(internet, Internet):
             raise exceptions.OSInvalidInternet('internet variable needs to be of type Internet.', internet)
@@ -181,7 +244,7 @@ class System(object):
     def _validate_username(self, username):
         """Raises exception if username is not of valid format."""
 
-        logger.info(f'Validating username for OS with ip {self.IP}.')
+        logger.debug('Validating username for OS with ip %s.', self.IP)
         if not isinstance(username, str):
             raise exceptions.OSInvalidUsername('username needs to be of type str.', username)
         elif len(username) < 3:
@@ -192,7 +255,7 @@ class System(object):
     def _validate_password(self, password):
         """Raises exception if password is of invalid format."""
 
-        logger.info(f'Validating password for OS with ip {self.IP}.')
+        logger.debug('Validating password for OS with ip %s.', self.IP)
         if not isinstance(password, str):
             raise exceptions.OSInvalidPassword('password needs to be of type str.', password)
         elif len(password) < 8:
@@ -4,6 +4,10 @@ from terminal_game.root_dir import RootDir
 from terminal_game import directory
 from terminal_game.directory import Directory
 from terminal_game.file import File
+from terminal_game.storage_unit import StorageUnit
+from terminal_game.tree import TreeRenderer
+from terminal_game.pipeline import Pipeline
+from utils.metrics import Metrics
 from utils.my_logging import get_logger
 from utils import exceptions
 
@@ -23,8 +27,11 @@ class Terminal(object):
         opened_by -- The operating system that opened the terminal (may differ from the OS the terminal belongs to).
         connected_to -- An operating system's terminal that the current terminal is connected to.
         commands -- dictionary with all the commands available.
+        streams -- commands that can run as a pipeline stage, yielding their output line by line.
     """
 
+    TREE_MAX_ENTRIES = 10000
+
     def __init__(self, os, opened_by):
         """Initializes the terminal using os and opened_by.
         
@@ -56,6 +63,15 @@ class Terminal(object):
             'write': self._write,
             'replace': self._replace,
             'pwd': self._pwd,
+            'grep': self._grep,
+            'find': self._find,
+        }
+        self.streams = {
+            'cat': self._stream_cat,
+            'grep': self._stream_grep,
+            'echo': self._stream_echo,
+            'ls': self._stream_ls,
+            'tree': self._stream_tree,
         }
 
     def new_line(self):
@@ -68,26 +84,141 @@ class Terminal(object):
 
     def run_command(self, args):
         """Runs a command if it is supported in the terminal. Returns the result of the command."""
+
+        return self.run_counted(args)[0]
+
+    def run_counted(self, args):
+        """Runs a command like run_command. Returns its result and the number of storage units it touched."""
     
-        try:
-            self.os.verify_system_integrity()
-        except exceptions.OSCorrupted as e:
-            if self.opened_by != self.os:
-                self._disconnect(args)
-            return self._response(1, None, e.message)
+        error = self._check_integrity(args)
+        if error:
+            return error, 0
 
         if self.connected_to:
-            return self.connected_to.run_command(args)
+            return self.connected_to.run_counted(args)
 
         # if self.sub_command:
         #     self.sub_command(args)
             
-        command = args.pop(0)
+        command = Pipeline.NAME if Pipeline.is_pipeline(args) else args.pop(0)
+        started = Metrics.start()
+        response = self._dispatch(command, args)
+        if command == Pipeline.NAME:
+            label = 'pipeline'
+        else:
+            label = command if command in self.commands else 'unknown'
+        return response, Metrics.record(self.os.IP, label, started, response)
+
+    def stream_tree(self, args):
+        """Yields the output of the tree command line by line, without building it in memory.
+
+        Goes through the same checks as run_command, is forwarded the same
+        way to a connected terminal and is capped at TREE_MAX_ENTRIES like tree.
+        """
+
+        error = self._check_integrity(args)
+        if error:
+            yield error['stderr']
+            return
+
+        if self.connected_to:
+            yield from self.connected_to.stream_tree(args)
+            return
+
+        started = Metrics.start()
+        lines, error = self._stream_tree(args, None)
+        if error:
+            Metrics.record(self.os.IP, 'tree', started, self._response(1, None, error))
+            yield error
+            return
+        try:
+            yield from lines
+        finally:
+            Metrics.record(self.os.IP, 'tree', started, self._response(0, None, None))
+
+    def collect_tree(self, args):
+        """Returns the output lines of the tree command as a list and the number of storage units it touched.
+
+        Used where the output has to be produced at once, e.g. under the
+        CommandScheduler; it is capped at TREE_MAX_ENTRIES like stream_tree.
+        """
+
+        error = self._check_integrity(args)
+        if error:
+            return [error['stderr']], 0
+
+        if self.connected_to:
+            return self.connected_to.collect_tree(args)
+
+        started = Metrics.start()
+        lines, error = self._stream_tree(args, None)
+        lines = [error] if error else list(lines)
+        return lines, Metrics.record(self.os.IP, 'tree', started, self._response(1 if error else 0, None, error))
+
+    def execute(self, command, args):
+        """Runs a command (a whole pipeline for Pipeline.NAME) without going through the journal."""
+
+        if command == Pipeline.NAME:
+            return self._pipeline(args)
         try:
             return self.commands[command](args)
         except KeyError:
             return self._response(1, None, 'command not found.')
 
+    def _dispatch(self, command, args):
+        """Runs a command of this terminal, through the journal if it changes the filesystem."""
+
+        journal = self.os.internet.journal
+        if journal and self._mutates(journal, command, args):
+            return self._run_journaled(journal, command, args)
+        return self.execute(command, args)
+
+    def _mutates(self, journal, command, args):
+        """Returns True if a command (or pipeline) may change the filesystem."""
+
+        if command != Pipeline.NAME:
+            return command in journal.MUTATING_COMMANDS
+        pipeline, _ = Pipeline.parse(args)
+        if pipeline is None:
+            return False
+        return pipeline.redirect is not None or any(stage in journal.MUTATING_COMMANDS for stage, _ in pipeline.stages)
+
+    def _run_journaled(self, journal, command, args):
+        """Runs a command changing the filesystem and logs it to the journal.
+
+        The record is encoded before the command runs, so that a command too
+        large to be logged is refused without changing anything. It is logged
+        whatever the exit code, since a failing command may still have changed
+        part of the tree and replays to the same result, and the response is
+        only returned once the record is fsynced.
+        """
+
+        with journal.mutating():
+            try:
+                record = journal.encode(journal.CMD, self.os.IP, [self.current_dir.get_path(), command] + args)
+            except exceptions.JournalError as e:
+                return self._response(1, None, e.message)
+            try:
+                response = self.execute(command, args)
+            finally:
+                journal.write(record)
+        journal.maybe_checkpoint()
+        return response
+
+    def _check_integrity(self, args):
+        """Verifies the system files before running a command. Returns the response to give instead if they are corrupted (None otherwise).
+
+        A guest terminal is disconnected from a corrupted system.
+        """
+
+        try:
+            self.os.verify_system_integrity()
+        except exceptions.OSCorrupted as e:
+            if self.opened_by != self.os:
+                self._disconnect(args)
+            return self._response(1, None, e.message)
+        return None
+
     def _pwd(self, _):
         return self._response(0, self.current_dir.get_path(), None)
 
@@ -103,7 +234,7 @@ class Terminal(object):
             return self._response(1, None, f'No system found with IP {args[0]}.')
 
         self.connected_to = os.get_terminal(self.os)
-        logger.info(f'connected to {args[0]}')
+        logger.info('connected to %s', args[0])
         return self._response(0, None, None)
 
     def _disconnect(self, _):
@@ -119,11 +250,57 @@ class Terminal(object):
     def _ip(self, _):
         return self._response(0, self.os.IP, None)
 
-    def _tree(self, _):
-        return self._response(0, self.current_dir.bfs(), None)
+    def _tree(self, args):
+        renderer, error = self._tree_renderer(args)
+        if error:
+            return self._response(1, None, error)
+        if renderer.max_entries is None:
+            renderer.max_entries = self.TREE_MAX_ENTRIES
+        stdout = ''.join(f'{line}\n' for line in renderer.lines())
+        if renderer.truncated or renderer.show_summary:
+            stdout += renderer.summary()
+        return self._response(0, stdout, None)
+
+    def _tree_renderer(self, args):
+        """Parses the arguments of the tree command. Returns a renderer and an error message (one of them is None)."""
+
+        syntax = 'Syntax: tree [-L <depth>] [-n <max entries>] [-s] [path]'
+        path = None
+        max_depth = None
+        max_entries = None
+        show_summary = False
+        args = [arg for arg in args if arg]
+        while args:
+            arg = args.pop(0)
+            if arg in ['-L', '-n']:
+                if not args or not args[0].isdigit() or int(args[0]) < 1:
+                    return None, f'{arg} needs a positive number.\n{syntax}'
+                if arg == '-L':
+                    max_depth = int(args.pop(0))
+                else:
+                    max_entries = int(args.pop(0))
+            elif arg == '-s':
+                show_summary = True
+            elif path is None:
+                path = arg
+            else:
+                return None, f'Too many arguments.\n{syntax}'
+
+        directory = self.current_dir
+        if path is not None:
+            try:
+                directory = self.os.parse_path(path, relative_to=self.current_dir)
+            except exceptions.OSInvalidPath as e:
+                return None, e.message
+            if not isinstance(directory, Directory):
+                return None, 'Argument must be a directory.'
+
+        return TreeRenderer(directory, max_depth, max_entries, show_summary), None
 
     def _ls(self, _):
-        return self._response(0, '\n'.join([content.get_name() for content in self.current_dir.get_contents()]), None)
+        contents = self.current_dir.peek_contents()[0]
+        Metrics.touch(len(contents))
+        return self._response(0, '\n'.join([content.get_name() for content in contents]), None)
 
     def _cat(self, args):
         if len(args) < 1: return self._response(1, None, 'Too few arguments.\n Syntax: cat <path>')
@@ -145,7 +322,10 @@ class Terminal(object):
         except exceptions.OSInvalidPath as e:
             return self._response(1, None, e.message)
 
+        path = target.get_path()
         target.get_parent().delete(target.get_name())
+        self.os.search_index.removed(target, path)
+        target.discard()
         return self._response(0, None, None)
 
     def _mkdir(self, args):
@@ -163,9 +343,10 @@ class Terminal(object):
         else:
             destination = self.current_dir
         try:
-            self.os.make_dir(name, [], destination)
+            dr = self.os.make_dir(name, [], destination)
         except Exception as e:
             return self._response(1, None, e.message)
+        self.os.search_index.added(dr)
         return self._response(0, None, None)
 
     def _touch(self, args):
@@ -183,9 +364,10 @@ class Terminal(object):
         else:
             destination = self.current_dir
         try:
-            self.os.make_file(name, '', destination)
+            fl = self.os.make_file(name, '', destination)
         except Exception as e:
             return self._response(1, None, e.message)
+        self.os.search_index.added(fl)
         return self._response(0, None, None)
 
     def _cd(self, args):
@@ -212,8 +394,10 @@ class Terminal(object):
                 raise exceptions.OSInvalidPath()
         except exceptions.OSInvalidPath:
             file_to_write.set_contents(' '.join(args[1:]))
+            self.os.search_index.changed(file_to_write)
             return self._response(0, None, None)
-        file_to_write.set_contents(file_to_read.get_contents())
+        file_to_write.set_contents(file_to_read.get_stored())
+        self.os.search_index.changed(file_to_write)
         return self._response(0, None, None)
 
     def _replace(self, args):
@@ -232,15 +416,17 @@ class Terminal(object):
             return self._response(1, None, e.message)
         try:
             file_to_read = self.os.parse_path(new, self.current_dir)
-            if (not isinstance(file_to_read, File)) or (not isinstance(file_to_read.get_contents(), str)):
+            if (not isinstance(file_to_read, File)) or (not file_to_read.is_text()):
                 raise exceptions.OSInvalidPath()
         except exceptions.OSInvalidPath:
             file_to_write.replace(old, new, count)
+            self.os.search_index.changed(file_to_write)
             return self._response(0, None, None)
         try:
             file_to_write.replace(old, file_to_read.get_contents(), count)
         except TypeError as e:
             return self._response(1, None, e.message)
+        self.os.search_index.changed(file_to_write)
         return self._response(0, None, None)
 
     def _mv(self, args):
@@ -261,6 +447,7 @@ class Terminal(object):
             old = self.os.parse_path(old, relative_to=self.current_dir)
         except exceptions.OSInvalidPath as e:
             return self._response(1, None, e.message)
+        old_path = old.get_path()
         
         try:
             new = self.os.parse_path(new, relative_to=self.current_dir)
@@ -281,6 +468,7 @@ class Terminal(object):
                 return self._response(1, None, e.message)
             old.get_parent().delete(old.get_name())
             new_dir.add(old)
+            self.os.search_index.moved(old, old_path)
             return self._response(0, None, None)
         else:
             if not isinstance(new, Directory):
@@ -291,6 +479,7 @@ class Terminal(object):
                         return self._response(1,'Cannot move a directory to a subdirectory of itself.' ,None)
                 old.get_parent().delete(old.get_name())
                 new.add(old)
+                self.os.search_index.moved(old, old_path)
                 return self._response(0, None, None)
 
     def _cp(self, args):
@@ -324,24 +513,195 @@ class Terminal(object):
             if check_type:
                 if not isinstance(old, Directory):
                     return self._response(1, None, 'Cannot put a file as a directory.')
+            if isinstance(old, Directory):
+                if old.is_sub_su(new_dir) or old == new_dir:
+                    return self._response(1, None, 'Cannot copy a directory to a subdirectory of itself.')
             try:
                 if isinstance(old, File):
-                    self.os.make_file(new.split('/')[-1], old.get_contents(), new_dir)
+                    copy = self.os.make_file(new.split('/')[-1], old.get_stored(), new_dir)
                 else:
-                    self.os.make_dir(new.split('/')[-1], old.get_contents(), new_dir)
+                    copy = self.os.copy(old, new.split('/')[-1], new_dir)
             except exceptions.SUNameError as e:
                 return self._response(1, None, e.message)
+            self.os.search_index.added(copy)
             return self._response(0, None, None)
         else:
             if not isinstance(new, Directory):
                 return self._response(1, None, f'A {new.__class__.__name__} with that name already exists in the destination path.')
             else:
-                if isinstance(old, File):
-                    self.os.make_file(old.get_name(), old.get_contents(), new)
-                else:
-                    self.os.make_dir(old.get_name(), old.get_contents(), new)
+                if isinstance(old, Directory) and (old.is_sub_su(new) or old == new):
+                    return self._response(1, None, 'Cannot copy a directory to a subdirectory of itself.')
+                try:
+                    if isinstance(old, File):
+                        copy = self.os.make_file(old.get_name(), old.get_stored(), new)
+                    else:
+                        copy = self.os.copy(old, old.get_name(), new)
+                except exceptions.SUNameError as e:
+                    return self._response(1, None, e.message)
+                self.os.search_index.added(copy)
                 return self._response(0, None, None)
 
+    def _grep(self, args):
+        lines, error = self._stream_grep(args, None)
+        if error:
+            return self._response(1, None, error)
+        return self._response(0, '\n'.join(lines), None)
+
+    def _pipeline(self, args):
+        """Runs a pipeline, streaming the lines of each stage through the next one."""
+
+        pipeline, error = Pipeline.parse(args)
+        if error:
+            return self._response(1, None, error)
+
+        if pipeline.redirect is not None:
+            _, error = self._redirect_target(pipeline.redirect, create=False)
+            if error:
+                return self._response(1, None, error)
+
+        lines = None
+        for command, stage_args in pipeline.stages:
+            lines, error = self._stage(command, list(stage_args), lines)
+            if error:
+                return self._response(1, None, error)
+
+        if pipeline.redirect is None:
+            return self._response(0, '\n'.join(lines), None)
+        target, error = self._redirect_target(pipeline.redirect)
+        if error:
+            return self._response(1, None, error)
+        try:
+            with target.appender(truncate=not pipeline.append) as out:
+                for line in lines:
+                    out.write(f'{line}\n')
+        except TypeError as e:
+            return self._response(1, None, str(e))
+        self.os.search_index.changed(target)
+        return self._response(0, None, None)
+
+    def _stage(self, command, args, stdin):
+        """Sets up a stage of a pipeline. Returns an iterator over its output lines and an error message (one of them is None).
+
+        Commands without a streaming version are run right away and their
+        stdout split in lines; they ignore their input.
+        """
+
+        stream = self.streams.get(command)
+        if stream:
+            return stream(args, stdin)
+        if command not in self.commands:
+            return None, f'{command}: command not found.'
+        response = self.commands[command](args)
+        if response['exit_code'] != 0:
+            return None, response['stderr']
+        return iter(str(response['stdout']).splitlines() if response['stdout'] is not None else ()), None
+
+    def _redirect_target(self, path, create=True):
+        """Returns the file output is redirected to, creating it if needed, and an error message (one of them is None).
+
+        With create False, a missing file is only checked to be creatable and
+        the file returned is None, so that nothing is created before every
+        stage of the pipeline is set up.
+        """
+
+        try:
+            target = self.os.parse_path(path, relative_to=self.current_dir)
+        except exceptions.OSInvalidPath:
+            target = None
+        if target is None:
+            parts = path.split('/')
+            name = parts.pop()
+            if name == '':
+                return None, 'You need to provide a file name.'
+            destination = self.current_dir
+            if parts:
+                try:
+                    destination = self.os.parse_path('/'.join(parts), relative_to=self.current_dir)
+                except exceptions.OSInvalidPath as e:
+                    return None, e.message
+                if not isinstance(destination, Directory):
+                    return None, 'Cannot add file to a file.'
+            if not create:
+                try:
+                    StorageUnit.check_name(name)
+                except exceptions.SUNameError as e:
+                    return None, e.message
+                return None, None
+            try:
+                target = self.os.make_file(name, '', destination)
+            except Exception as e:
+                return None, e.message
+            self.os.search_index.added(target)
+        if not isinstance(target, File):
+            return None, 'Cannot redirect output to a directory.'
+        return target, None
+
+    def _stream_cat(self, args, stdin):
+        if len(args) < 1:
+            if stdin is None:
+                return None, 'Too few arguments.\n Syntax: cat <path>'
+            return stdin, None
+        try:
+            su = self.os.parse_path(args[0], self.current_dir)
+        except exceptions.OSInvalidPath as e:
+            return None, e.message
+        if not isinstance(su, File):
+            return None, 'Argument must be a file.'
+        return su.iter_lines(), None
+
+    def _stream_grep(self, args, stdin):
+        """Filters the lines of stdin, of a file, or of every file below a directory (the current one by default)."""
+
+        if len(args) < 1:
+            return None, 'Too few arguments.\nSyntax: grep <pattern> [path]'
+        pattern = args[0]
+        if len(args) < 2 and stdin is not None:
+            return (line for line in stdin if pattern in line), None
+
+        target = self.current_dir
+        if len(args) > 1:
+            try:
+                target = self.os.parse_path(args[1], self.current_dir)
+            except exceptions.OSInvalidPath as e:
+                return None, e.message
+        if isinstance(target, File):
+            return (line for line in target.iter_lines() if pattern in line), None
+        return (f'{path}:{line}' for path, line in self.os.search_index.grep(pattern, target)), None
+
+    def _find(self, args):
+        if len(args) < 1: return self._response(1, None, 'Too few arguments.\nSyntax: find <name or glob> [path]')
+
+        directory = self.current_dir
+        if len(args) > 1 and args[1]:
+            try:
+                directory = self.os.parse_path(args[1], relative_to=self.current_dir)
+            except exceptions.OSInvalidPath as e:
+                return self._response(1, None, e.message)
+            if not isinstance(directory, Directory):
+                return self._response(1, None, 'Argument must be a directory.')
+        return self._response(0, '\n'.join(self.os.search_index.find(args[0], directory)), None)
+
+    def _stream_echo(self, args, _):
+        return iter([' '.join(args)]), None
+
+    def _stream_ls(self, args, _):
+        contents = self.current_dir.peek_contents()[0]
+        Metrics.touch(len(contents))
+        return (content.get_name() for content in contents), None
+
+    def _stream_tree(self, args, _):
+        renderer, error = self._tree_renderer(args)
+        if error:
+            return None, error
+        if renderer.max_entries is None:
+            renderer.max_entries = self.TREE_MAX_ENTRIES
+        return self._tree_lines(renderer), None
+
+    def _tree_lines(self, renderer):
+        yield from renderer.lines()
+        if renderer.truncated or renderer.show_summary:
+            yield renderer.summary()
+
     def _response(self, exit_code, stdout, stderr):
         return {
             'exit_code': exit_code,
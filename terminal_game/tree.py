@@ -0,0 +1,74 @@
+from utils.metrics import Metrics
+from terminal_game.directory import Directory
+
+
+class TreeRenderer(object):
+    """Renders the contents of a directory in tree format.
+
+    The directory is walked iteratively, depth first, and the lines are
+    yielded one at a time, so the output never has to be built in memory and
+    deep trees do not hit the recursion limit. Directories are read through
+    peek_contents, so rendering does not materialize the shared base layer.
+
+    Attributes:
+        directory: directory whose contents get rendered.
+        max_depth: number of levels to render (all of them if None).
+        max_entries: number of entries after which rendering stops (no limit if None).
+        show_summary: whether the summary line should be shown after the tree.
+        directories: number of directories rendered so far.
+        files: number of files rendered so far.
+        size: total size in bytes of the files rendered so far.
+        truncated: True if rendering stopped because max_entries was reached.
+    """
+
+    def __init__(self, directory, max_depth=None, max_entries=None, show_summary=False):
+        """Initializes the renderer.
+
+        Arguments:
+            directory -- directory whose contents get rendered.
+            max_depth -- (optional) number of levels to render.
+            max_entries -- (optional) number of entries after which rendering stops.
+            show_summary -- (optional) whether the summary line should be shown after the tree.
+        """
+
+        self.directory = directory
+        self.max_depth = max_depth
+        self.max_entries = max_entries
+        self.show_summary = show_summary
+        self.directories = 0
+        self.files = 0
+        self.size = 0
+        self.truncated = False
+
+    def lines(self):
+        """Yields the lines of the tree, without line endings."""
+
+        visited = self.directories + self.files
+        try:
+            stack = [iter(self.directory.peek_contents()[0])]
+            while stack:
+                content = next(stack[-1], None)
+                if content is None:
+                    stack.pop()
+                    continue
+                if self.max_entries is not None and self.directories + self.files >= self.max_entries:
+                    self.truncated = True
+                    return
+
+                depth = len(stack) - 1
+                yield f"{'|    ' * depth}| -- {content.get_name()}"
+                if isinstance(content, Directory):
+                    self.directories += 1
+                    if self.max_depth is None or depth + 1 < self.max_depth:
+                        stack.append(iter(content.peek_contents()[0]))
+                else:
+                    self.files += 1
+                    self.size += content.get_size()
+        finally:
+            Metrics.touch(self.directories + self.files - visited)
+
+    def summary(self):
+        """Returns a line summarizing what has been rendered."""
+
+        truncated = ' (truncated)' if self.truncated else ''
+        return f'{self.directories} directories, {self.files} files, {self.size} bytes{truncated}'
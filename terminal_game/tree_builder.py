@@ -0,0 +1,180 @@
+from utils import exceptions
+from utils.id_generator import IdGenerator
+from utils.metrics import Metrics
+from utils.my_logging import get_logger
+from terminal_game.storage_unit import StorageUnit
+from terminal_game.directory import Directory
+from terminal_game.file import File
+
+
+logger = get_logger(__name__)
+
+
+class TreeBuilder(object):
+    """Builds whole trees of storage units at once.
+
+    A tree is validated in a single pass up front (names, clashes between
+    siblings, types of the contents), then its units are linked directly
+    through the trusted constructors, with one id reservation for the whole
+    tree and one validated Directory.add at the top, instead of going
+    through the validating setters for every unit. Both passes are
+    iterative, so deep trees cannot overflow the stack.
+    """
+
+    @staticmethod
+    def build(contents, parent):
+        """Creates the units described by a list of json dicts inside a directory. Returns the top-level units.
+
+        Arguments:
+            contents -- list of {'name': ..., 'contents': ...} dicts (a list of dicts for a directory, str or bytes for a file).
+            parent -- directory the units are created in.
+        """
+
+        count = TreeBuilder.validate(contents)
+        for content in contents:
+            name = TreeBuilder._unit_class(content['contents']).normalize_name(content['name'])
+            if parent.has_su(name):
+                raise exceptions.SUNameError('Another storage unit with this name already exists in the parent directory.', name)
+
+        IdGenerator.reserve(count, StorageUnit.ID_LENGTH)
+        Metrics.touch(count)
+        index = parent._index()
+        units = []
+        for content in contents:
+            unit = TreeBuilder._link(content, parent)
+            index[unit.get_name()] = unit
+            units.append(unit)
+        parent._bump_generation()
+        logger.debug('Built %s storage units in %s with id %s.', count, parent.__class__.__name__, parent.SUID)
+        return units
+
+    @staticmethod
+    def build_dir(name, contents, parent):
+        """Returns a new directory holding the units described by a list of json dicts.
+
+        The directory points to parent but is not added to it.
+        """
+
+        StorageUnit.check_name(name)
+        dr = Directory.new_trusted(name, {}, parent)
+        TreeBuilder.build(contents, dr)
+        return dr
+
+    @staticmethod
+    def validate(contents):
+        """Raises SUNameError or SUInvalidContents unless a list of json dicts describes a valid tree. Returns its number of units."""
+
+        if not isinstance(contents, list):
+            raise exceptions.SUInvalidContents('Directory contents need to be of type list.', contents)
+
+        count = 0
+        stack = [contents]
+        while stack:
+            names = set()
+            for content in stack.pop():
+                if not isinstance(content, dict) or 'name' not in content or 'contents' not in content:
+                    raise exceptions.SUInvalidContents('Storage units need a name and contents.', content)
+                StorageUnit.check_name(content['name'])
+                name = TreeBuilder._unit_class(content['contents']).normalize_name(content['name'])
+                if name in names:
+                    raise exceptions.SUNameError('Another storage unit with this name already exists in the parent directory.', name)
+                names.add(name)
+                if isinstance(content['contents'], list):
+                    stack.append(content['contents'])
+                count += 1
+        return count
+
+    @staticmethod
+    def copy(unit, name, parent):
+        """Copies a storage unit and everything inside it into a directory under a new name. Returns the copy.
+
+        File contents are shared through the ContentPool. A directory that
+        still only mirrors the shared base layer is copied as another
+        directory backed by the same base, without visiting its subtree.
+        """
+
+        StorageUnit.check_name(name)
+        if parent.has_su(unit.normalize_name(name)):
+            raise exceptions.SUNameError('Another storage unit with this name already exists in the parent directory.', name)
+
+        count = TreeBuilder._count_copied(unit)
+        IdGenerator.reserve(count, StorageUnit.ID_LENGTH)
+        Metrics.touch(count)
+        top = TreeBuilder._copy_unit(unit, name, parent)
+        stack = [(unit, top)] if isinstance(top, Directory) and top._base is None else []
+        while stack:
+            source, copy = stack.pop()
+            for child in source.contents.values():
+                child_copy = TreeBuilder._copy_unit(child, child.get_name(), copy)
+                copy.contents[child_copy.get_name()] = child_copy
+                if isinstance(child_copy, Directory) and child_copy._base is None:
+                    stack.append((child, child_copy))
+        parent.add(top)
+        return top
+
+    @staticmethod
+    def make_dir(name, units, parent):
+        """Creates a directory holding copies of storage units and adds it to parent. Returns it."""
+
+        StorageUnit.check_name(name)
+        if parent.has_su(name):
+            raise exceptions.SUNameError('Another storage unit with this name already exists in the parent directory.', name)
+
+        IdGenerator.reserve(1 + sum(TreeBuilder._count_copied(unit) for unit in units), StorageUnit.ID_LENGTH)
+        dr = Directory.new_trusted(name, {}, parent)
+        Metrics.touch()
+        for unit in units:
+            TreeBuilder.copy(unit, unit.get_name(), dr)
+        parent.add(dr)
+        return dr
+
+    @staticmethod
+    def _link(content, parent):
+        """Creates the unit described by a validated json dict and everything inside it. Returns it."""
+
+        if not isinstance(content['contents'], list):
+            return File.new_trusted(content['name'], content['contents'], parent)
+
+        top = Directory.new_trusted(content['name'], {}, parent)
+        stack = [(content['contents'], top)]
+        while stack:
+            children, dr = stack.pop()
+            for child in children:
+                if isinstance(child['contents'], list):
+                    unit = Directory.new_trusted(child['name'], {}, dr)
+                    stack.append((child['contents'], unit))
+                else:
+                    unit = File.new_trusted(child['name'], child['contents'], dr)
+                dr.contents[unit.get_name()] = unit
+        return top
+
+    @staticmethod
+    def _copy_unit(unit, name, parent):
+        """Returns a copy of a single unit (without the children of a directory)."""
+
+        if isinstance(unit, File):
+            return File.new_trusted(name, unit.get_stored(), parent)
+        if unit._base is not None:
+            return Directory.new_layered(name, unit._base, parent)
+        return Directory.new_trusted(name, {}, parent)
+
+    @staticmethod
+    def _count_copied(unit):
+        """Returns the number of units copy creates for a unit."""
+
+        count = 0
+        stack = [unit]
+        while stack:
+            unit = stack.pop()
+            count += 1
+            if isinstance(unit, Directory) and unit._base is None:
+                stack.extend(unit.contents.values())
+        return count
+
+    @staticmethod
+    def _unit_class(contents):
+        if isinstance(contents, list):
+            return Directory
+        if isinstance(contents, (str, bytes)):
+            return File
+        raise exceptions.SUInvalidContents(f'Contents cannot be of type {type(contents)}', contents)
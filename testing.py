@@ -8,8 +8,7 @@ from terminal_game import internet
 def clean():
     with open('data/generated_ids.json', 'w') as f:
         json.dump([], f, indent=4)
-    with open('data/generated_ips.json', 'w') as f:
-        json.dump([], f, indent=4)
+    open('data/generated_ids.journal', 'w').close()
 
 
 def main():
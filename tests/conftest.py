@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# logging.conf and res/os_root.json are loaded relative to the main directory.
+os.chdir(ROOT)
+os.makedirs('data', exist_ok=True)
+sys.path.insert(0, ROOT)
+
+from utils.id_generator import IdGenerator
+
+IdGenerator.configure('none')
+
+
+@pytest.fixture
+def run():
+    """Returns a function running a command line on the main terminal of a system."""
+
+    def run(v_os, line):
+        return v_os.main_terminal.run_command(line.split(' '))
+    return run
+
+
+@pytest.fixture
+def references():
+    """Returns a function counting the references the content pool holds to a string."""
+
+    from utils.content_pool import ContentPool
+
+    def references(contents):
+        entry = ContentPool._entries.get(contents)
+        return entry[1] if entry else 0
+    return references
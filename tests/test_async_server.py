@@ -0,0 +1,70 @@
+import json
+import asyncio
+from urllib.parse import urlencode
+
+from terminal_game.internet import Internet
+from async_server import AsyncServer
+
+
+async def call(app, path, body=b'', content_type=b'application/x-www-form-urlencoded', method='POST'):
+    """Sends a request to an ASGI app. Returns the status and json body of its response."""
+
+    sent = []
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app({'type': 'http', 'method': method, 'path': path, 'headers': [(b'content-type', content_type)]}, receive, send)
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+
+def form(func, info):
+    return urlencode({'func': func, 'info': json.dumps(info)}).encode()
+
+
+def test_commands_are_served_as_forms_and_json():
+    async def scenario():
+        app = AsyncServer(Internet())
+        status, response = await call(app, '/commands', form('new', {'temp_id': 0, 'username': 'someone', 'password': 'password1'}))
+        assert status == 200
+        ip = response['response']
+
+        payload = json.dumps({'func': 'cmd', 'info': {'id': ip, 'input': 'mkdir notes'}}).encode()
+        status, response = await call(app, '/commands', payload, b'application/json')
+        assert status == 200 and response['response']['exit_code'] == 0
+
+        operations = [{'func': 'cmd', 'info': {'id': ip, 'input': 'ls'}}, {'func': 'new_line', 'info': {'id': ip}}]
+        status, response = await call(app, '/commands/batch', json.dumps(operations).encode(), b'application/json')
+        assert status == 200
+        assert 'notes' in response['results'][0]['response']['stdout']
+
+        assert (await call(app, '/commands', b'garbage'))[0] == 400
+        assert (await call(app, '/elsewhere'))[0] == 404
+
+    asyncio.run(scenario())
+
+
+def test_crossing_connects_run_concurrently_without_deadlocking():
+    async def scenario():
+        app = AsyncServer(Internet())
+        ips = []
+        for temp_id in range(4):
+            response = (await call(app, '/commands', form('new', {'temp_id': temp_id, 'username': 'someone', 'password': 'password1'})))[1]
+            ips.append(response['response'])
+
+        async def script(ip, other):
+            codes = []
+            for line in ['mkdir a', 'cd a', 'touch f.txt', f'connect {other}', 'ls', 'disconnect', 'pwd']:
+                response = (await call(app, '/commands', form('cmd', {'id': ip, 'input': line})))[1]
+                codes.append(response['response']['exit_code'])
+            return codes
+
+        scripts = [script(ip, ips[(i + 1) % len(ips)]) for i, ip in enumerate(ips)]
+        results = await asyncio.wait_for(asyncio.gather(*scripts), timeout=10)
+        assert results == [[0] * 7] * len(ips)
+
+    asyncio.run(scenario())
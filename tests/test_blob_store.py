@@ -0,0 +1,80 @@
+import pytest
+
+from terminal_game.internet import Internet
+from terminal_game.file import FileAppender
+from utils.blob_store import Blob, BlobStore
+from utils.content_pool import ContentPool
+
+
+@pytest.fixture
+def blob_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(BlobStore, 'arena', None)
+    monkeypatch.setattr(BlobStore, 'threshold', BlobStore.threshold)
+    BlobStore.configure(64, str(tmp_path))
+    return BlobStore
+
+
+def test_threshold_counts_encoded_bytes(blob_store):
+    assert not BlobStore.wants('a' * 63)
+    assert BlobStore.wants('é' * 32)
+    assert BlobStore.wants('a' * 64)
+    assert not BlobStore.wants('é' * 15)
+
+
+def test_blobs_are_released_on_replace_and_rm(blob_store, run):
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    run(v_os, 'touch a.txt')
+    run(v_os, 'write a.txt ' + 'é' * 40)
+    blob = v_os.root.get_su_by_name('a.txt').get_stored()
+    assert isinstance(blob, Blob)
+    run(v_os, 'cp a.txt b.txt')
+    assert v_os.root.get_su_by_name('b.txt').get_stored() is blob
+
+    run(v_os, 'write a.txt small')
+    assert blob.key in ContentPool._entries
+    run(v_os, 'rm b.txt')
+    assert blob.key not in ContentPool._entries
+
+
+def test_appends_grow_the_blob_of_the_file(blob_store, monkeypatch, run):
+    monkeypatch.setattr(FileAppender, 'CHUNK_SIZE', 16)
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    run(v_os, 'touch a.txt')
+    run(v_os, 'write a.txt ' + 'a' * 100)
+    blob = v_os.root.get_su_by_name('a.txt').get_stored()
+
+    for i in range(20):
+        assert run(v_os, f'echo line{i} >> a.txt')['exit_code'] == 0
+    expected = 'a' * 100 + ''.join(f'line{i}\n' for i in range(20))
+    assert v_os.root.get_su_by_name('a.txt').get_stored() is blob
+    assert run(v_os, 'cat a.txt')['stdout'] == expected
+
+    run(v_os, 'cp a.txt b.txt')
+    assert run(v_os, 'cat a.txt >> a.txt')['exit_code'] == 0
+    assert run(v_os, 'cat a.txt')['stdout'] == expected + expected.rstrip('\n') + '\n'
+    assert run(v_os, 'cat b.txt')['stdout'] == expected
+    assert v_os.root.get_su_by_name('b.txt').get_stored() is blob
+
+    assert run(v_os, 'echo small > a.txt')['exit_code'] == 0
+    assert v_os.root.get_su_by_name('a.txt').get_stored() == 'small\n'
+
+
+def test_failed_appends_leave_the_file_unchanged(blob_store, monkeypatch, run):
+    monkeypatch.setattr(FileAppender, 'CHUNK_SIZE', 16)
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    run(v_os, 'touch a.txt')
+    run(v_os, 'write a.txt ' + 'a' * 100)
+    file = v_os.root.get_su_by_name('a.txt')
+    blob = file.get_stored()
+
+    with pytest.raises(RuntimeError):
+        with file.appender() as out:
+            for _ in range(50):
+                out.write('more text\n')
+            raise RuntimeError()
+    assert file.get_stored() is blob
+    assert file.get_contents() == 'a' * 100
+    assert blob.key in ContentPool._entries
@@ -0,0 +1,36 @@
+from terminal_game.internet import Internet
+from terminal_game.directory import Directory
+
+
+def test_contents_are_released_when_replaced_or_removed(run, references):
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    run(v_os, 'mkdir notes')
+    run(v_os, 'touch notes/a.txt')
+    run(v_os, 'write notes/a.txt pool-test-one')
+    run(v_os, 'cp notes/a.txt b.txt')
+    assert references('pool-test-one') == 2
+
+    run(v_os, 'write b.txt pool-test-two')
+    assert references('pool-test-one') == 1
+    run(v_os, 'rm notes')
+    assert references('pool-test-one') == 0
+
+    web.remove_os(v_os.IP)
+    assert references('pool-test-two') == 0
+
+
+def test_directory_set_contents_discards_the_units_left_out(run, references):
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    run(v_os, 'mkdir notes')
+    run(v_os, 'touch notes/kept.txt')
+    run(v_os, 'touch notes/dropped.txt')
+    run(v_os, 'write notes/kept.txt pool-test-kept')
+    run(v_os, 'write notes/dropped.txt pool-test-dropped')
+
+    notes = v_os.root.get_su_by_name('notes')
+    assert isinstance(notes, Directory)
+    notes.set_contents([notes.get_su_by_name('kept.txt')])
+    assert references('pool-test-kept') == 1
+    assert references('pool-test-dropped') == 0
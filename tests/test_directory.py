@@ -0,0 +1,16 @@
+from terminal_game.internet import Internet
+
+
+def test_containment_walks_up_once(run):
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    for line in ['mkdir a', 'mkdir a/b', 'touch a/b/f.txt', 'mkdir c']:
+        run(v_os, line)
+    a, c = v_os.parse_path('/a'), v_os.parse_path('/c')
+    unit = v_os.parse_path('/a/b/f.txt')
+
+    assert a.is_sub_su(unit) and v_os.root.is_sub_su(unit)
+    assert not c.is_sub_su(unit)
+    assert not unit.get_parent().is_sub_su(a)
+    assert not a.is_sub_su(a)
+    assert run(v_os, 'mv a a/b/')['exit_code'] == 1
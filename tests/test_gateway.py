@@ -0,0 +1,53 @@
+from terminal_game.internet import Internet
+from terminal_game.gateway import Gateway
+
+
+def cmd(ip, line):
+    return {'func': 'cmd', 'info': {'id': ip, 'input': line}}
+
+
+def test_stop_only_skips_the_failed_system():
+    web = Internet()
+    first = web.add_os('first', 'password1')
+    second = web.add_os('second', 'password2')
+    gateway = Gateway(web)
+
+    batch = gateway.batch([
+        cmd(first.IP, 'cat missing.txt'),
+        cmd(second.IP, 'mkdir a'),
+        cmd(first.IP, 'mkdir a'),
+        cmd(second.IP, 'mkdir b'),
+    ])
+
+    types = [result['response_type'] for result in batch['results']]
+    assert types == ['success', 'success', 'skipped', 'success']
+    assert batch['results'][2]['id'] == first.IP
+    assert batch['response_type'] == 'error'
+    assert first.root.has_su('a') is False
+    assert second.root.has_su('a') and second.root.has_su('b')
+
+
+def test_continue_runs_everything():
+    web = Internet()
+    v_os = web.add_os('first', 'password1')
+    gateway = Gateway(web)
+
+    batch = gateway.batch([cmd(v_os.IP, 'cat missing.txt'), cmd(v_os.IP, 'mkdir a')], on_error='continue')
+
+    assert [result['response_type'] for result in batch['results']] == ['success', 'success']
+    assert batch['response'] == '1 operations failed.'
+    assert v_os.root.has_su('a')
+
+
+def test_failed_new_does_not_stop_commands():
+    web = Internet()
+    v_os = web.add_os('first', 'password1')
+    gateway = Gateway(web)
+
+    batch = gateway.batch([
+        {'func': 'new', 'info': {'temp_id': 1, 'username': 'x', 'password': 'short'}},
+        cmd(v_os.IP, 'mkdir a'),
+        {'func': 'new', 'info': {'temp_id': 2, 'username': 'valid', 'password': 'password2'}},
+    ])
+
+    assert [result['response_type'] for result in batch['results']] == ['error', 'success', 'skipped']
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from utils import exceptions
+from utils.id_generator import IdAllocator
+
+
+def test_allocate_returns_unique_ids():
+    allocator = IdAllocator('none')
+    ids = [allocator.allocate(2) for _ in range(26 ** 2)]
+
+    assert len(set(ids)) == 26 ** 2
+    assert all(len(gen) == 2 and gen.isupper() for gen in ids)
+    with pytest.raises(exceptions.IdAllocatorError):
+        allocator.allocate(2)
+
+
+def test_reserve_hands_out_reserved_ids():
+    allocator = IdAllocator('none')
+    allocator.reserve(10, 4)
+    reserved = list(allocator._pools[4])
+
+    assert sorted(allocator.allocate(4) for _ in range(10)) == sorted(reserved)
+    assert all(allocator.is_taken(gen) for gen in reserved)
+
+
+def test_claim_marks_ids_as_taken():
+    allocator = IdAllocator('none')
+    allocator.claim(['AB', 'CD'])
+
+    assert allocator.is_taken('AB') and allocator.is_taken('CD')
+    assert not allocator.is_taken('EF')
+    assert {allocator.allocate(2) for _ in range(26 ** 2 - 2)}.isdisjoint({'AB', 'CD'})
+
+
+def test_periodic_flush_round_trip(tmp_path):
+    ids_path = str(tmp_path / 'ids.json')
+    allocator = IdAllocator('periodic', ids_path=ids_path, flush_interval=3600)
+    ids = [allocator.allocate(4) for _ in range(20)]
+    allocator.flush()
+
+    with open(ids_path) as f:
+        assert sorted(json.load(f)) == sorted(ids)
+    reloaded = IdAllocator('periodic', ids_path=ids_path)
+    assert all(reloaded.is_taken(gen) for gen in ids)
+
+
+def test_journal_round_trip_and_compaction(tmp_path):
+    ids_path = str(tmp_path / 'ids.json')
+    journal_path = str(tmp_path / 'ids.journal')
+    allocator = IdAllocator('journal', ids_path=ids_path, journal_path=journal_path)
+    allocator.reserve(5, 4)
+    ids = [allocator.allocate(4) for _ in range(8)]
+
+    reloaded = IdAllocator('journal', ids_path=ids_path, journal_path=journal_path)
+    assert all(reloaded.is_taken(gen) for gen in ids)
+
+    reloaded.compact()
+    with open(journal_path) as f:
+        assert f.read() == ''
+    compacted = IdAllocator('journal', ids_path=ids_path, journal_path=journal_path)
+    assert all(compacted.is_taken(gen) for gen in ids)
+
+
+def test_use_files_keeps_known_ids_and_loads_the_new_files(tmp_path):
+    shared_path = str(tmp_path / 'ids.json')
+    shard_path = str(tmp_path / 'ids.shard0.json')
+    with open(shared_path, 'w') as f:
+        json.dump(['AAAA'], f)
+    with open(shard_path, 'w') as f:
+        json.dump(['BBBB'], f)
+
+    allocator = IdAllocator('periodic', ids_path=shared_path, flush_interval=3600)
+    allocator.use_files(shard_path, str(tmp_path / 'ids.shard0.journal'))
+    assert allocator.is_taken('AAAA') and allocator.is_taken('BBBB')
+    gen = allocator.allocate(4)
+    allocator.flush()
+
+    with open(shard_path) as f:
+        assert sorted(json.load(f)) == sorted(['AAAA', 'BBBB', gen])
+    with open(shared_path) as f:
+        assert json.load(f) == ['AAAA']
+
+
+def test_unknown_durability_mode():
+    with pytest.raises(exceptions.IdAllocatorError):
+        IdAllocator('sometimes')
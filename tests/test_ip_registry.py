@@ -0,0 +1,47 @@
+import pytest
+
+from utils import exceptions
+from utils.ip_registry import IpRegistry
+
+
+def test_allocate_register_lookup_release():
+    registry = IpRegistry()
+    ip = registry.allocate()
+    system = object()
+    registry.register(ip, system)
+
+    assert registry.lookup(ip) is system
+    assert ip in registry
+    registry.release(ip)
+    assert ip not in registry
+    with pytest.raises(exceptions.OSNotFound):
+        registry.lookup(ip)
+
+
+def test_pack_round_trip():
+    assert IpRegistry.unpack(IpRegistry.pack('1.2.3.255')) == '1.2.3.255'
+    for ip in ['1.2.3', '0.1.2.3', '1.2.3.256', 'a.b.c.d']:
+        with pytest.raises(ValueError):
+            IpRegistry.pack(ip)
+
+
+def test_exhaustion_is_not_a_lookup_miss(monkeypatch):
+    monkeypatch.setattr(IpRegistry, 'SPACE', 3)
+    registry = IpRegistry()
+    ips = {registry.allocate() for _ in range(3)}
+
+    assert len(ips) == 3
+    with pytest.raises(exceptions.IPExhausted):
+        registry.allocate()
+
+
+def test_taken_addresses_are_not_lookup_misses():
+    registry = IpRegistry()
+    ip = registry.claim('10.20.30.40')
+
+    with pytest.raises(exceptions.IPTaken):
+        registry.claim(ip)
+    with pytest.raises(exceptions.IPNotAllocated):
+        registry.register('10.20.30.41', object())
+    registry.release(ip)
+    assert registry.claim(ip) == ip
@@ -0,0 +1,106 @@
+import threading
+
+import pytest
+
+from utils import exceptions
+from terminal_game.journal import Journal
+from terminal_game.internet import Internet
+
+
+def recover(path):
+    internet = Journal.recover(path, checkpoint_every=None)
+    internet.journal.close()
+    return internet
+
+
+def test_journal_round_trip(tmp_path, run):
+    path = str(tmp_path / 'journal')
+    web = Journal.recover(path, checkpoint_every=None)
+    first = web.add_os('first', 'password1')
+    second = web.add_os('second', 'password2')
+    run(first, 'mkdir notes')
+    run(first, 'cd notes')
+    run(first, 'touch a.txt')
+    run(first, 'write a.txt ' + 'x' * 70000)
+    run(first, 'cp a.txt b.txt')
+    run(second, 'touch gone.txt')
+    run(second, 'rm gone.txt')
+    third = web.add_os('third', 'password3')
+    web.remove_os(third.IP)
+    web.journal.close()
+
+    restored = recover(path)
+    assert sorted(v_os.IP for v_os in restored.operating_systems) == sorted([first.IP, second.IP])
+    for v_os in (first, second):
+        assert restored.get_os_by_ip(v_os.IP).root.bfs() == v_os.root.bfs()
+    restored_first = restored.get_os_by_ip(first.IP)
+    assert run(restored_first, 'cat notes/b.txt')['stdout'] == 'x' * 70000
+
+
+def test_checkpoint_then_replay(tmp_path, run):
+    path = str(tmp_path / 'journal')
+    web = Journal.recover(path, checkpoint_every=None)
+    v_os = web.add_os('someone', 'password1')
+    run(v_os, 'touch before.txt')
+    web.journal.checkpoint()
+    run(v_os, 'touch after.txt')
+    web.journal.close()
+
+    assert len(Journal.snapshots(path)) == 1
+    restored = recover(path).get_os_by_ip(v_os.IP)
+    assert restored.root.has_su('before.txt') and restored.root.has_su('after.txt')
+
+
+def test_oversized_command_changes_nothing(tmp_path, monkeypatch, run):
+    path = str(tmp_path / 'journal')
+    web = Journal.recover(path, checkpoint_every=None)
+    v_os = web.add_os('someone', 'password1')
+    run(v_os, 'touch a.txt')
+    monkeypatch.setattr(Journal, 'MAX_RECORD', 1000)
+
+    response = run(v_os, 'write a.txt ' + 'x' * 2000)
+    assert response['exit_code'] == 1
+    assert run(v_os, 'cat a.txt')['stdout'] == ''
+    web.journal.close()
+
+
+def test_failing_commands_are_journaled(tmp_path, run):
+    path = str(tmp_path / 'journal')
+    web = Journal.recover(path, checkpoint_every=None)
+    v_os = web.add_os('someone', 'password1')
+    run(v_os, 'touch a.txt')
+    assert run(v_os, 'rm nothere.txt')['exit_code'] == 1
+    web.journal.close()
+
+    (_, segment_path), = Journal.segments(path)
+    commands = [strings[1] for kind, _, strings in Journal.records(segment_path) if kind == Journal.CMD]
+    assert commands == ['touch', 'rm']
+    assert recover(path).get_os_by_ip(v_os.IP).root.bfs() == v_os.root.bfs()
+
+
+def test_concurrent_appends_are_all_durable(tmp_path):
+    path = str(tmp_path / 'journal')
+    journal = Journal(path, checkpoint_every=None)
+
+    def append(index):
+        for i in range(50):
+            journal.append(Journal.NEW, '1.2.3.4', [f'user{index}-{i}', 'password'])
+
+    threads = [threading.Thread(target=append, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert journal._durable == journal._appended == 400
+
+    (_, segment_path), = Journal.segments(path)
+    assert len(list(Journal.records(segment_path))) == 400
+    journal.close()
+
+
+def test_segments_without_the_magic_are_rejected(tmp_path):
+    path = tmp_path / 'journal.00000000.wal'
+    path.write_bytes(b'\x05\x00\x00\x00' + b'\x00' * 9)
+
+    with pytest.raises(exceptions.JournalError):
+        list(Journal.records(str(path)))
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from utils import exceptions
+from terminal_game.internet import Internet
+from terminal_game.locks import SystemLocks
+
+
+def test_removed_systems_drop_their_locks():
+    web = Internet()
+    locks = SystemLocks(web)
+    first = web.add_os('first', 'password1')
+    second = web.add_os('second', 'password2')
+
+    async def scenario():
+        ips = await locks.acquire(first.IP, ['ls'])
+        locks.release(ips)
+        assert first.IP in locks._locks
+
+        web.remove_os(first.IP)
+        assert first.IP not in locks._locks
+
+        ips = await locks.acquire(second.IP, ['ls'])
+        web.remove_os(second.IP)
+        assert second.IP in locks._locks
+        locks.release(ips)
+        assert second.IP not in locks._locks
+
+    asyncio.run(scenario())
+
+
+def test_locks_taken_before_a_removal_are_no_longer_current():
+    web = Internet()
+    locks = SystemLocks(web)
+    v_os = web.add_os('someone', 'password1')
+    lock = locks.lock(v_os.IP)
+
+    async def scenario():
+        locks.release(await locks.acquire_system(v_os, lock, ['ls']))
+        web.remove_os(v_os.IP)
+        assert not locks.is_current(v_os.IP, lock)
+        with pytest.raises(exceptions.OSNotFound):
+            await locks.acquire_system(v_os, lock, ['ls'])
+        assert locks._users == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,60 @@
+from utils.metrics import CommandMetrics, Metrics
+from terminal_game.internet import Internet
+
+
+def samples(text):
+    """Returns the samples of a Prometheus text exposition as a dict of line prefix to value."""
+
+    values = {}
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            values[name] = float(value)
+    return values
+
+
+def test_counters_errors_nodes_and_histogram():
+    metrics = CommandMetrics(buckets=(0.01, 0.1))
+    metrics.record('1.1.1.1', 'ls', 0.005, False, 3)
+    metrics.record('1.1.1.1', 'ls', 0.05, True, 4)
+    metrics.record('2.2.2.2', 'cat', 0.5, False, 1)
+
+    text = metrics.render()
+    values = samples(text)
+    assert '# TYPE hacknet_commands_total counter' in text
+    assert '# TYPE hacknet_command_duration_seconds histogram' in text
+    assert values['hacknet_commands_total{command="ls"}'] == 2
+    assert values['hacknet_command_errors_total{command="ls"}'] == 1
+    assert values['hacknet_command_errors_total{command="cat"}'] == 0
+    assert values['hacknet_command_nodes_total{command="ls"}'] == 7
+    assert values['hacknet_command_duration_seconds_bucket{command="ls",le="0.01"}'] == 1
+    assert values['hacknet_command_duration_seconds_bucket{command="ls",le="0.1"}'] == 2
+    assert values['hacknet_command_duration_seconds_bucket{command="ls",le="+Inf"}'] == 2
+    assert values['hacknet_command_duration_seconds_count{command="cat"}'] == 1
+    assert values['hacknet_system_nodes_total{ip="1.1.1.1"}'] == 7
+
+
+def test_only_the_busiest_systems_are_labelled():
+    metrics = CommandMetrics(top_systems=2)
+    for i in range(1, 6):
+        metrics.record(f'10.0.0.{i}', 'ls', i / 100, False, 1)
+
+    labelled = [name for name in samples(metrics.render()) if name.startswith('hacknet_system_commands_total')]
+    assert sorted(labelled) == ['hacknet_system_commands_total{ip="10.0.0.4"}', 'hacknet_system_commands_total{ip="10.0.0.5"}']
+
+    metrics.forget('10.0.0.5')
+    assert 'ip="10.0.0.5"' not in metrics.render()
+
+
+def test_terminal_commands_are_recorded(monkeypatch):
+    monkeypatch.setattr(Metrics, 'registry', CommandMetrics())
+    v_os = Internet().add_os('someone', 'password1')
+    v_os.main_terminal.run_command(['ls'])
+    v_os.main_terminal.run_command(['cat', 'missing.txt'])
+    v_os.main_terminal.run_command(['nonsense'])
+
+    values = samples(Metrics.render())
+    assert values['hacknet_commands_total{command="ls"}'] == 1
+    assert values['hacknet_command_errors_total{command="cat"}'] == 1
+    assert values['hacknet_commands_total{command="unknown"}'] == 1
+    assert values[f'hacknet_system_commands_total{{ip="{v_os.IP}"}}'] == 3
@@ -0,0 +1,66 @@
+import pytest
+
+from utils import exceptions
+from terminal_game.internet import Internet
+from terminal_game.path_cache import PathCache
+
+
+@pytest.fixture
+def v_os(run):
+    v_os = Internet().add_os('someone', 'password1')
+    for line in ['mkdir a', 'mkdir a/b', 'touch a/b/f.txt', 'mkdir other']:
+        assert run(v_os, line)['exit_code'] == 0
+    return v_os
+
+
+def test_repeated_lookups_hit(v_os):
+    cache = v_os.path_cache
+    unit = v_os.parse_path('/a/b/f.txt')
+    base = v_os.parse_path('/a')
+    v_os.parse_path('b/f.txt', relative_to=base)
+    hits = cache.hits
+
+    assert v_os.parse_path('/a/b/f.txt') is unit
+    assert v_os.parse_path('b/f.txt', relative_to=base) is unit
+    assert cache.hits == hits + 2
+
+
+def test_writes_elsewhere_keep_entries(v_os, run):
+    cache = v_os.path_cache
+    unit = v_os.parse_path('/a/b/f.txt')
+    for line in ['touch other/g.txt', 'mkdir other/deeper', 'rm other/g.txt']:
+        run(v_os, line)
+    hits = cache.hits
+
+    assert v_os.parse_path('/a/b/f.txt') is unit
+    assert cache.hits == hits + 1
+
+
+@pytest.mark.parametrize('line', ['mv a/b/f.txt a/b/g.txt', 'rm a/b/f.txt', 'mv a other/', 'mv a/b renamed'])
+def test_changes_on_the_path_invalidate_entries(v_os, line, run):
+    v_os.parse_path('/a/b/f.txt')
+    assert run(v_os, line)['exit_code'] == 0
+
+    with pytest.raises(exceptions.OSInvalidPath):
+        v_os.parse_path('/a/b/f.txt')
+
+
+def test_parent_steps_follow_moves(v_os, run):
+    inner = v_os.parse_path('/a/b')
+    assert v_os.parse_path('../..', relative_to=inner) is v_os.root
+    run(v_os, 'mv a/b other/')
+
+    assert v_os.parse_path('../..', relative_to=inner) is v_os.root
+    assert v_os.parse_path('..', relative_to=inner) is v_os.parse_path('/other')
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = PathCache(max_size=2)
+    for name in ['x', 'y', 'z']:
+        cache.put(name, name, [])
+    assert cache.get('x') is None
+    assert cache.get('y') == 'y'
+    cache.put('w', 'w', [])
+
+    assert cache.get('z') is None
+    assert cache.get('y') == 'y' and cache.get('w') == 'w'
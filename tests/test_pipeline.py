@@ -0,0 +1,21 @@
+from terminal_game.internet import Internet
+
+
+def test_redirect_creates_and_appends(run):
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    assert run(v_os, 'echo hello > out.txt')['exit_code'] == 0
+    assert run(v_os, 'echo world >> out.txt')['exit_code'] == 0
+    assert run(v_os, 'cat out.txt')['stdout'] == 'hello\nworld\n'
+    assert run(v_os, 'cat out.txt | grep wor > out.txt')['exit_code'] == 0
+    assert run(v_os, 'cat out.txt')['stdout'] == 'world\n'
+
+
+def test_failed_pipeline_leaves_no_target_behind(run):
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    assert run(v_os, 'cat nothere > zz.txt')['exit_code'] == 1
+    assert not v_os.root.has_su('zz.txt')
+    assert run(v_os, 'find zz.txt')['stdout'] == ''
+    assert run(v_os, 'cat zz.txt')['exit_code'] == 1
+    assert run(v_os, 'echo hi > bad|name')['exit_code'] == 1
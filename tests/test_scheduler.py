@@ -0,0 +1,105 @@
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import exceptions
+from terminal_game.internet import Internet
+from terminal_game.gateway import Gateway
+from terminal_game.scheduler import CommandScheduler
+from terminal_game.session import SessionClient, SessionServer
+
+
+def strict():
+    """Returns a scheduler rejecting every command of a system in debt."""
+
+    return CommandScheduler(rate=0.001, burst=1.0, node_cost=1.0)
+
+
+def test_commands_are_charged_the_nodes_returned_with_their_result():
+    scheduler = CommandScheduler(rate=0.001, burst=100.0, node_cost=0.5)
+
+    assert scheduler.run('1.2.3.4', lambda: ('done', 10)) == 'done'
+    assert scheduler._buckets['1.2.3.4'].tokens == pytest.approx(94.0, abs=0.01)
+
+
+def test_a_system_in_debt_does_not_hold_the_executor():
+    scheduler = strict()
+    scheduler.run('1.1.1.1', lambda: ('done', 10))
+
+    def hot():
+        try:
+            return scheduler.run('1.1.1.1', lambda: ('done', 0))
+        except exceptions.CommandThrottled as e:
+            return e.info[0]
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        started = time.monotonic()
+        retries = [pool.submit(hot) for _ in range(4)]
+        cold = pool.submit(scheduler.run, '2.2.2.2', lambda: ('done', 0))
+        assert cold.result(timeout=1) == 'done'
+        assert time.monotonic() - started < 1
+        assert all(retry.result() > 0 for retry in retries)
+
+
+def test_waiting_commands_are_rejected_when_their_system_goes_into_debt():
+    scheduler = strict()
+    started = []
+
+    def slow():
+        started.append(True)
+        time.sleep(0.2)
+        return 'done', 10
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(scheduler.run, '1.1.1.1', slow)
+        while not started:
+            time.sleep(0.01)
+        second = pool.submit(scheduler.run, '1.1.1.1', lambda: ('done', 0))
+        assert first.result() == 'done'
+        with pytest.raises(exceptions.CommandThrottled):
+            second.result(timeout=1)
+    assert scheduler._ring == deque()
+
+
+def test_removed_systems_lose_their_bucket():
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    gateway = Gateway(web, CommandScheduler())
+
+    gateway.dispatch('cmd', {'id': v_os.IP, 'input': 'ls'})
+    assert v_os.IP in gateway.scheduler._buckets
+    web.remove_os(v_os.IP)
+    assert gateway.scheduler._buckets == {}
+
+
+def test_stream_goes_through_the_scheduler():
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    gateway = Gateway(web, strict())
+
+    streamed = gateway.stream({'id': v_os.IP, 'input': 'tree /'})
+    assert streamed['response_type'] == 'success'
+    assert '| -- home' in streamed['response']
+    throttled = gateway.stream({'id': v_os.IP, 'input': 'tree /'})
+    assert throttled['retry_after'] > 0
+
+
+def test_throttled_session_commands_get_an_error():
+    async def scenario():
+        server = SessionServer(Internet(), scheduler=strict())
+        await server.start(port=0)
+        port = server._server.sockets[0].getsockname()[1]
+        client = await SessionClient.connect(port=port)
+        try:
+            await client.new('someone', 'password1')
+            assert (await client.run('ls'))['exit_code'] == 0
+            with pytest.raises(exceptions.SessionError):
+                await client.run('ls')
+        finally:
+            await client.close()
+            await server.close()
+
+    asyncio.run(scenario())
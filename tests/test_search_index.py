@@ -0,0 +1,47 @@
+from terminal_game.internet import Internet
+from terminal_game.file import File
+from terminal_game.search_index import SearchIndex
+
+
+def test_index_follows_changes_without_keeping_files(monkeypatch, run, references):
+    monkeypatch.setattr(SearchIndex, 'MAX_INDEXED_SIZE', 20)
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    run(v_os, 'mkdir notes')
+    run(v_os, 'touch notes/a.txt')
+    run(v_os, 'touch notes/big.txt')
+    run(v_os, 'write notes/a.txt index-test-alpha')
+    run(v_os, 'write notes/big.txt index-test-needle-in-a-large-file')
+
+    assert run(v_os, 'grep needle')['stdout'] == '/notes/big.txt:index-test-needle-in-a-large-file'
+    assert run(v_os, 'grep alpha')['stdout'] == '/notes/a.txt:index-test-alpha'
+    index = v_os.search_index
+    assert index._files['/notes/a.txt'] == 'index-test-alpha'
+    assert index._files['/notes/big.txt'] is None
+    assert references('index-test-alpha') == 2
+
+    run(v_os, 'write notes/a.txt index-test-beta')
+    assert run(v_os, 'grep alpha')['stdout'] == ''
+    assert references('index-test-alpha') == 0
+    assert 'alp' not in index._grams
+
+    run(v_os, 'mv notes/a.txt b.txt')
+    assert run(v_os, 'grep beta')['stdout'] == '/b.txt:index-test-beta'
+    run(v_os, 'rm b.txt')
+    assert references('index-test-beta') == 0
+    assert 'bet' not in index._grams
+
+    web.remove_os(v_os.IP)
+    assert index._files == {}
+
+
+def test_changes_made_outside_the_terminal_rebuild_the_index(run):
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    run(v_os, 'mkdir a')
+    run(v_os, 'mkdir a/b')
+    assert run(v_os, 'find hidden.txt')['stdout'] == ''
+
+    deep = v_os.parse_path('/a/b')
+    deep.add(File('hidden.txt', 'out of band', deep))
+    assert run(v_os, 'find hidden.txt')['stdout'] == '/a/b/hidden.txt'
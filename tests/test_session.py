@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from utils import exceptions
+from terminal_game.internet import Internet
+from terminal_game.session import SessionClient, SessionProtocol, SessionServer
+
+
+def test_large_results_are_split_into_frames(monkeypatch):
+    monkeypatch.setattr(SessionProtocol, 'MAX_FRAME', 64)
+
+    async def scenario():
+        server = SessionServer(Internet())
+        await server.start(port=0)
+        port = server._server.sockets[0].getsockname()[1]
+        client = await SessionClient.connect(port=port)
+        try:
+            await client.new('someone', 'password1')
+            await client.run('touch big.txt')
+            await client.run('write big.txt ' + 'x' * 50)
+            for _ in range(3):
+                await client.run('replace big.txt x xx')
+            response = await client.run('cat big.txt')
+            assert response['stdout'] == 'x' * 400
+            assert client.prompt
+
+            with pytest.raises(exceptions.SessionError):
+                await client.run('write big.txt ' + 'y' * 100)
+            assert (await client.run('pwd'))['stdout'] == '/'
+        finally:
+            await client.close()
+            await server.close()
+
+    asyncio.run(scenario())
+
+
+def test_frames_longer_than_max_frame_are_refused(monkeypatch):
+    monkeypatch.setattr(SessionProtocol, 'MAX_FRAME', 8)
+    SessionProtocol.frame(SessionProtocol.LINE, 'x' * 8)
+    with pytest.raises(ValueError):
+        SessionProtocol.frame(SessionProtocol.LINE, 'x' * 9)
+
+
+def test_commands_use_the_system_looked_up_on_attach():
+    async def scenario():
+        web = Internet()
+        server = SessionServer(web)
+        await server.start(port=0)
+        port = server._server.sockets[0].getsockname()[1]
+        client = await SessionClient.connect(port=port)
+        try:
+            ip = await client.new('someone', 'password1')
+            lookups = []
+            get_os_by_ip = web.get_os_by_ip
+            web.get_os_by_ip = lambda ip: lookups.append(ip) or get_os_by_ip(ip)
+            assert (await client.run('pwd'))['stdout'] == '/'
+            assert lookups == []
+
+            web.remove_os(ip)
+            with pytest.raises(exceptions.SessionError, match='removed'):
+                await client.run('touch ghost.txt')
+            with pytest.raises(exceptions.SessionError, match='not attached'):
+                await client.run('pwd')
+            assert ip not in server.locks._locks
+        finally:
+            await client.close()
+            await server.close()
+
+    asyncio.run(scenario())
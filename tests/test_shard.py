@@ -0,0 +1,73 @@
+import pytest
+
+from utils import exceptions
+from terminal_game.gateway import Gateway
+from terminal_game.shard import ShardedInternet, shard_of
+
+
+SHARDS = 3
+
+
+@pytest.fixture(scope='module')
+def web():
+    web = ShardedInternet(SHARDS)
+    yield web
+    web.close()
+
+
+@pytest.fixture(scope='module')
+def gateway(web):
+    return Gateway(web)
+
+
+def cmd(gateway, ip, line):
+    return gateway.dispatch('cmd', {'id': ip, 'input': line})['response']
+
+
+def test_systems_are_routed_by_ip_hash(web):
+    systems = [web.add_os(f'user{i}', 'password1') for i in range(9)]
+
+    for v_os in systems:
+        assert v_os.shard == shard_of(v_os.IP, SHARDS)
+    for shard in range(SHARDS):
+        owned = set(web.call(shard, 'ips'))
+        assert {v_os.IP for v_os in systems if v_os.shard == shard} <= owned
+        assert all(shard_of(ip, SHARDS) == shard for ip in owned)
+
+
+def test_connect_across_shards(web, gateway):
+    first = web.add_os('first', 'password1')
+    second = web.add_os('second', 'password2')
+    while second.shard == first.shard:
+        second = web.add_os('second', 'password2')
+
+    assert cmd(gateway, first.IP, f'connect {second.IP}')['exit_code'] == 0
+    assert cmd(gateway, first.IP, 'ip')['stdout'] == second.IP
+    assert cmd(gateway, first.IP, 'mkdir remote')['exit_code'] == 0
+    assert 'remote' in cmd(gateway, second.IP, 'ls')['stdout'].split('\n')
+    assert cmd(gateway, first.IP, 'disconnect')['exit_code'] == 0
+    assert cmd(gateway, first.IP, 'ip')['stdout'] == first.IP
+
+
+def test_removed_systems_are_gone_from_every_process(web, gateway):
+    first = web.add_os('first', 'password1')
+    second = web.add_os('second', 'password2')
+    web.remove_os(second.IP)
+
+    with pytest.raises(exceptions.OSNotFound):
+        web.get_os_by_ip(second.IP)
+    assert second.IP not in web.call(second.shard, 'ips')
+    assert cmd(gateway, first.IP, f'connect {second.IP}')['exit_code'] == 1
+
+
+def test_metrics_are_merged_from_every_worker(web, gateway):
+    systems = [web.add_os(f'metrics{i}', 'password1') for i in range(6)]
+    while len({v_os.shard for v_os in systems}) < 2:
+        systems.append(web.add_os(f'metrics{len(systems)}', 'password1'))
+    before = web.metrics().export()[0].get('pwd', [None, 0, 0])[2]
+    for v_os in systems:
+        cmd(gateway, v_os.IP, 'pwd')
+
+    text = web.metrics().render()
+    assert f'hacknet_commands_total{{command="pwd"}} {before + len(systems)}' in text
+    assert 'hacknet_system_commands_total{ip=' in text
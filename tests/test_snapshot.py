@@ -0,0 +1,59 @@
+import io
+
+import pytest
+
+from utils import exceptions
+from terminal_game.internet import Internet
+from terminal_game.directory import Directory
+from terminal_game.snapshot import MAGIC, VERSION, SnapshotReader, SnapshotWriter
+
+
+def test_snapshot_round_trip(tmp_path, run):
+    web = Internet()
+    first = web.add_os('first', 'password1')
+    second = web.add_os('second', 'password2')
+    run(first, 'mkdir notes')
+    run(first, 'touch notes/a.txt')
+    run(first, 'write notes/a.txt hello')
+    run(first, 'cd notes')
+    run(second, f'connect {first.IP}')
+
+    path = tmp_path / 'web.snap'
+    web.snapshot(path)
+    restored = Internet.restore(path)
+
+    assert sorted(v_os.IP for v_os in restored.operating_systems) == sorted([first.IP, second.IP])
+    for v_os in (first, second):
+        copy = restored.get_os_by_ip(v_os.IP)
+        assert copy.username == v_os.username
+        assert copy.root.bfs() == v_os.root.bfs()
+    restored_first = restored.get_os_by_ip(first.IP)
+    assert run(restored_first, 'cat a.txt')['stdout'] == 'hello'
+    assert restored.get_os_by_ip(second.IP).main_terminal.connected_to.os is restored_first
+
+
+def test_snapshot_writes_the_base_layer_once(tmp_path, run):
+    web = Internet()
+    systems = [web.add_os(f'user{i}', 'password1') for i in range(10)]
+    run(systems[0], 'touch home/mine.txt')
+
+    writer = SnapshotWriter(io.BytesIO())
+    writer.write_internet(web)
+    assert len(writer.base_roots) == 1
+
+    path = tmp_path / 'web.snap'
+    web.snapshot(path)
+    restored = Internet.restore(path)
+    homes = [restored.get_os_by_ip(v_os.IP).root.get_su_by_name('home') for v_os in systems]
+    assert homes[1]._base is not None
+    assert homes[1]._base is homes[2]._base
+    assert isinstance(homes[1]._base, Directory)
+    assert homes[0].has_su('mine.txt') and not homes[1].has_su('mine.txt')
+    assert homes[1].bfs() == systems[1].root.get_su_by_name('home').bfs()
+
+
+def test_other_versions_are_rejected():
+    data = MAGIC + (VERSION + 1).to_bytes(2, 'little') + bytes(4)
+
+    with pytest.raises(exceptions.SnapshotError):
+        SnapshotReader(io.BytesIO(data)).read_internet(Internet())
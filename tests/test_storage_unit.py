@@ -0,0 +1,58 @@
+import threading
+
+from terminal_game.internet import Internet
+
+
+def test_paths_follow_renames_and_moves(run):
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    for line in ['mkdir a', 'mkdir a/inner', 'touch a/inner/f.txt', 'mkdir b', 'touch b/g.txt', 'mkdir c']:
+        assert run(v_os, line)['exit_code'] == 0
+
+    moved = v_os.parse_path('/a/inner/f.txt')
+    untouched = v_os.parse_path('/b/g.txt')
+    assert moved.get_path() == '/a/inner/f.txt'
+    assert untouched.get_path() == '/b/g.txt'
+
+    assert run(v_os, 'mv a c/')['exit_code'] == 0
+    assert moved.get_path() == '/c/a/inner/f.txt'
+    assert moved.get_parent().get_depth() == 3
+    assert untouched.get_path() == '/b/g.txt'
+
+    assert run(v_os, 'mv c/a/inner c/a/renamed')['exit_code'] == 0
+    assert moved.get_path() == '/c/a/renamed/f.txt'
+    assert v_os.parse_path('/c/a').get_path() == '/c/a/'
+
+
+def test_cached_paths_only_check_their_own_system(run):
+    web = Internet()
+    first = web.add_os('first', 'password1')
+    second = web.add_os('second', 'password2')
+    run(first, 'mkdir a')
+    run(first, 'touch a/f.txt')
+    run(second, 'mkdir x')
+    unit = first.parse_path('/a/f.txt')
+    assert unit.get_path() == '/a/f.txt'
+
+    run(second, 'mv x y')
+    unit.get_parent()._path = 'not walked'
+    assert unit.get_path() == '/a/f.txt'
+    assert first.root._topology is not second.root._topology
+
+
+def test_concurrent_moves_are_all_counted():
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    topology = v_os.root._topology
+    start = topology.version
+
+    def bump():
+        for _ in range(10000):
+            topology.bump()
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert topology.version == start + 40000
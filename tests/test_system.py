@@ -0,0 +1,79 @@
+from terminal_game.internet import Internet
+from terminal_game.directory import Directory
+from terminal_game.file import File
+from utils.parser import Parser
+from utils.id_generator import IdGenerator
+
+
+def test_systems_are_cloned_from_one_template():
+    web = Internet()
+    first = web.add_os('first', 'password1')
+    second = web.add_os('second', 'password2')
+    template = Parser.load_template('res/os_root.json')
+
+    first_home = first.root.get_su_by_name('home')
+    second_home = second.root.get_su_by_name('home')
+    assert first_home is not second_home
+    assert first_home._base is template.get_su_by_name('home')
+    assert second_home._base is first_home._base
+    assert Parser.load_template('res/os_root.json') is template
+
+
+def test_clones_are_independent(run):
+    web = Internet()
+    first = web.add_os('first', 'password1')
+    second = web.add_os('second', 'password2')
+
+    assert run(first, 'mkdir notes')['exit_code'] == 0
+    assert run(first, 'touch notes/a.txt')['exit_code'] == 0
+    assert run(first, 'write notes/a.txt hello')['exit_code'] == 0
+
+    assert run(first, 'cat notes/a.txt')['stdout'] == 'hello'
+    assert run(second, 'cat notes/a.txt')['exit_code'] == 1
+    assert 'notes' not in run(second, 'ls')['stdout'].split('\n')
+
+
+def test_generated_ids_are_unique(run):
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    for i in range(50):
+        run(v_os, f'touch f{i}.txt')
+        run(v_os, f'mkdir d{i}')
+
+    units = v_os.root.get_contents()
+    ids = [unit.get_id() for unit in units]
+    assert len(set(ids)) == len(ids)
+    assert all(unit.get_id().startswith('FIL-') for unit in units if isinstance(unit, File))
+    assert all(unit.get_id().startswith('DIR-') for unit in units if isinstance(unit, Directory))
+
+
+def test_materializing_never_shows_an_empty_directory(monkeypatch):
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    home = v_os.root.get_su_by_name('home')
+    seen = []
+    reserve = IdGenerator.reserve
+
+    def peek_while_copying(n, length=6):
+        seen.append([unit.get_name() for unit in home.peek_contents()[0]])
+        reserve(n, length)
+
+    monkeypatch.setattr(IdGenerator, 'reserve', peek_while_copying)
+    assert [unit.get_name() for unit in home.get_contents()] == ['colleges.txt']
+    assert seen == [['colleges.txt']]
+    assert home._base is None
+
+
+def test_reading_does_not_materialize_the_base_layer(run):
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    home = v_os.root.get_su_by_name('home')
+
+    assert 'colleges.txt' in run(v_os, 'tree')['stdout']
+    assert run(v_os, 'cd home')['exit_code'] == 0
+    assert run(v_os, 'ls')['stdout'] == 'colleges.txt'
+    assert home._base is not None
+
+    assert run(v_os, 'touch notes.txt')['exit_code'] == 0
+    assert home._base is None
+    assert run(v_os, 'ls')['stdout'] == 'colleges.txt\nnotes.txt'
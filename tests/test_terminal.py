@@ -0,0 +1,31 @@
+from terminal_game.internet import Internet
+from terminal_game.terminal import Terminal
+
+
+def test_stream_tree_matches_tree_and_is_capped(monkeypatch, run):
+    web = Internet()
+    v_os = web.add_os('someone', 'password1')
+    for i in range(20):
+        run(v_os, f'touch f{i}.txt')
+
+    streamed = list(v_os.main_terminal.stream_tree([]))
+    assert '\n'.join(streamed) + '\n' == run(v_os, 'tree')['stdout']
+
+    monkeypatch.setattr(Terminal, 'TREE_MAX_ENTRIES', 5)
+    streamed = list(v_os.main_terminal.stream_tree([]))
+    assert len(streamed) == 6
+    assert streamed[-1].endswith('(truncated)')
+
+
+def test_stream_tree_follows_connections_and_integrity(run):
+    web = Internet()
+    first = web.add_os('first', 'password1')
+    second = web.add_os('second', 'password2')
+    run(second, 'touch only_here.txt')
+
+    assert run(first, f'connect {second.IP}')['exit_code'] == 0
+    assert any('only_here.txt' in line for line in first.main_terminal.stream_tree([]))
+
+    run(second, 'rm system/system.dat')
+    assert list(first.main_terminal.stream_tree([])) == ['system files not found.']
+    assert first.main_terminal.connected_to is None
@@ -0,0 +1,65 @@
+import pytest
+
+from utils import exceptions
+from terminal_game.internet import Internet
+from terminal_game.directory import Directory
+from terminal_game.tree_builder import TreeBuilder
+
+
+def chain(depth):
+    """Returns the json contents of a chain of directories depth levels deep, with a file at the bottom."""
+
+    contents = [{'name': 'leaf.txt', 'contents': 'bottom'}]
+    for level in range(depth):
+        contents = [{'name': f'd{level}', 'contents': contents}]
+    return contents
+
+
+def test_trees_are_validated_before_anything_is_built():
+    v_os = Internet().add_os('someone', 'password1')
+    clash = [{'name': 'a', 'contents': [{'name': 'x.txt', 'contents': ''}, {'name': 'x.txt', 'contents': ''}]}]
+    names = [unit.get_name() for unit in v_os.root.get_contents()]
+
+    assert TreeBuilder.validate(chain(3)) == 4
+    with pytest.raises(exceptions.SUNameError):
+        TreeBuilder.build(clash, v_os.root)
+    with pytest.raises(exceptions.SUInvalidContents):
+        TreeBuilder.build([{'name': 'a', 'contents': [{'name': 'b'}]}], v_os.root)
+    with pytest.raises(exceptions.SUNameError):
+        TreeBuilder.build([{'name': 'home', 'contents': []}], v_os.root)
+    assert [unit.get_name() for unit in v_os.root.get_contents()] == names
+
+
+def test_deep_trees_are_built_and_copied_without_recursion():
+    v_os = Internet().add_os('someone', 'password1')
+    depth = 3000
+
+    top, = TreeBuilder.build(chain(depth), v_os.root)
+    copy = TreeBuilder.copy(top, 'copy', v_os.root)
+    assert TreeBuilder._count_copied(copy) == depth + 1
+
+    unit = copy
+    while isinstance(unit, Directory):
+        unit, = unit.get_contents()
+        assert unit.get_parent() is not None
+    assert unit.get_contents() == 'bottom'
+
+
+def test_copies_do_not_share_units_with_their_source(run):
+    v_os = Internet().add_os('someone', 'password1')
+    for line in ['mkdir a', 'touch a/f.txt', 'write a/f.txt before', 'cp a b', 'write b/f.txt after']:
+        assert run(v_os, line)['exit_code'] == 0
+
+    assert v_os.parse_path('/a/f.txt').get_contents() == 'before'
+    assert v_os.parse_path('/b/f.txt').get_contents() == 'after'
+    assert v_os.parse_path('/b/f.txt').get_parent() is v_os.parse_path('/b')
+
+
+def test_copies_of_base_layer_directories_stay_layered():
+    v_os = Internet().add_os('someone', 'password1')
+    home = v_os.parse_path('/home')
+    assert home._base is not None
+
+    copy = TreeBuilder.copy(home, 'home2', v_os.root)
+    assert copy._base is home._base
+    assert TreeBuilder._count_copied(home) == 1
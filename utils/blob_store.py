@@ -0,0 +1,258 @@
+import os
+import mmap
+import bisect
+import tempfile
+import threading
+
+
+class Blob(object):
+    """Handle to immutable file contents kept in a BlobArena.
+
+    A blob is shared by every file holding the same contents through the
+    ContentPool, which gives its space back to the arena once the last of
+    them lets go of it.
+
+    Attributes:
+        arena: BlobArena holding the contents.
+        chunk: index of the arena chunk holding the contents.
+        offset: offset of the contents in the chunk.
+        length: size of the contents in bytes.
+        capacity: size of the space reserved for the contents in the arena.
+        text: True if the contents are utf-8 encoded text, False for bytes.
+        key: key of the blob in the ContentPool.
+    """
+
+    __slots__ = ('arena', 'chunk', 'offset', 'length', 'capacity', 'text', 'key')
+
+    def __init__(self, arena, chunk, offset, length, capacity, text):
+        self.arena = arena
+        self.chunk = chunk
+        self.offset = offset
+        self.length = length
+        self.capacity = capacity
+        self.text = text
+        self.key = None
+
+    def view(self):
+        """Returns a read-only memoryview over the contents, without copying them."""
+
+        return self.arena.view(self)
+
+    def materialize(self):
+        """Returns the contents as a str (text) or bytes."""
+
+        return str(self.view(), 'utf-8') if self.text else bytes(self.view())
+
+    def __len__(self):
+        return self.length
+
+
+class BlobArena(object):
+    """Memory-mapped arena on disk holding the contents of large files.
+
+    The arena is an anonymous temporary file mapped in chunks of CHUNK_SIZE
+    bytes (or more for a single large blob). Pages are only loaded when read,
+    and the operating system can write cold pages back to the file, so the
+    resident memory follows the contents in use rather than all the contents
+    stored. Freed space is kept in a sorted free list per chunk, merged with
+    its neighbours and reused first fit.
+
+    A blob that is still being written (see reserve and append) grows into
+    the free space right after it when it can, and is otherwise moved to a
+    space twice as large. The space it leaves is only freed by release, so
+    views taken before the move stay valid until then.
+
+    The arena only lives as long as the process: snapshots and the journal
+    are what make contents durable.
+    """
+
+    CHUNK_SIZE = 64 << 20
+    ALIGNMENT = 16
+
+    def __init__(self, directory=None):
+        """Initializes an empty arena backed by a temporary file in directory (the system default if None)."""
+
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._size = 0
+        self._chunks = []
+        self._free = []
+        self._lock = threading.Lock()
+
+    def put(self, data, text=False):
+        """Copies bytes-like data into the arena and returns its Blob."""
+
+        blob = self.reserve(len(data), text)
+        self._chunks[blob.chunk][blob.offset:blob.offset + len(data)] = data
+        blob.length = len(data)
+        return blob
+
+    def reserve(self, capacity, text=False):
+        """Returns an empty Blob with room for capacity bytes, to be filled with append."""
+
+        capacity = BlobArena._aligned(capacity)
+        with self._lock:
+            chunk, offset = self._allocate(capacity)
+        return Blob(self, chunk, offset, 0, capacity, text)
+
+    def append(self, blob, data, retired):
+        """Copies bytes-like data to the end of a blob nobody else holds, growing it if needed.
+
+        Arguments:
+            blob -- blob to write to.
+            data -- bytes-like data to add.
+            retired -- list the spaces the blob moves out of are added to, to be given to release.
+        """
+
+        length = blob.length + len(data)
+        if length > blob.capacity:
+            self._grow(blob, length, retired)
+        memoryview(self._chunks[blob.chunk])[blob.offset + blob.length:blob.offset + length] = data
+        blob.length = length
+
+    def trim(self, blob, length=None):
+        """Cuts a blob nobody else holds to length bytes (its current length if None) and frees the space it does not need."""
+
+        if length is not None:
+            blob.length = length
+        capacity = BlobArena._aligned(blob.length)
+        if capacity < blob.capacity:
+            self.release([(blob.chunk, blob.offset + capacity, blob.capacity - capacity)])
+            blob.capacity = capacity
+
+    def release(self, spaces):
+        """Frees the (chunk, offset, size) spaces retired by append."""
+
+        with self._lock:
+            for chunk, offset, size in spaces:
+                self._free_space(chunk, offset, size)
+
+    def view(self, blob):
+        """Returns a read-only memoryview over the contents of a blob."""
+
+        return memoryview(self._chunks[blob.chunk])[blob.offset:blob.offset + blob.length].toreadonly()
+
+    def free(self, blob):
+        """Gives the space of a blob back to the arena."""
+
+        with self._lock:
+            self._free_space(blob.chunk, blob.offset, blob.capacity)
+
+    def _free_space(self, chunk, offset, length):
+        """Adds a space to the free list of its chunk, merged with its free neighbours. Called holding _lock."""
+
+        extents = self._free[chunk]
+        i = bisect.bisect(extents, [offset, length])
+        if i < len(extents) and offset + length == extents[i][0]:
+            length += extents.pop(i)[1]
+        if i > 0 and extents[i - 1][0] + extents[i - 1][1] == offset:
+            extents[i - 1][1] += length
+        else:
+            extents.insert(i, [offset, length])
+
+    def _grow(self, blob, length, retired):
+        """Makes room for length bytes in a blob, in place if the space after it is free, else by moving it."""
+
+        with self._lock:
+            end = blob.offset + blob.capacity
+            extents = self._free[blob.chunk]
+            i = bisect.bisect(extents, [end, 0])
+            if i < len(extents) and extents[i][0] == end and blob.capacity + extents[i][1] >= length:
+                extent = extents[i]
+                grow = min(extent[1], max(BlobArena._aligned(length), 2 * blob.capacity) - blob.capacity)
+                if grow == extent[1]:
+                    del extents[i]
+                else:
+                    extent[0] += grow
+                    extent[1] -= grow
+                blob.capacity += grow
+                return
+            capacity = max(BlobArena._aligned(length), 2 * blob.capacity)
+            chunk, offset = self._allocate(capacity)
+
+        if blob.length:
+            memoryview(self._chunks[chunk])[offset:offset + blob.length] = memoryview(self._chunks[blob.chunk])[blob.offset:blob.offset + blob.length]
+        retired.append((blob.chunk, blob.offset, blob.capacity))
+        blob.chunk, blob.offset, blob.capacity = chunk, offset, capacity
+
+    @staticmethod
+    def _aligned(length):
+        """Returns the size of the space taken by length bytes."""
+
+        return max(-(-length // BlobArena.ALIGNMENT) * BlobArena.ALIGNMENT, BlobArena.ALIGNMENT)
+
+    def _allocate(self, length):
+        """Returns the (chunk, offset) of length free bytes, mapping a new chunk if needed."""
+
+        for chunk, extents in enumerate(self._free):
+            for i, extent in enumerate(extents):
+                if extent[1] >= length:
+                    offset = extent[0]
+                    if extent[1] == length:
+                        del extents[i]
+                    else:
+                        extent[0] += length
+                        extent[1] -= length
+                    return chunk, offset
+
+        size = max(BlobArena.CHUNK_SIZE, -(-length // mmap.ALLOCATIONGRANULARITY) * mmap.ALLOCATIONGRANULARITY)
+        self._file.truncate(self._size + size)
+        self._chunks.append(mmap.mmap(self._file.fileno(), size, offset=self._size))
+        self._free.append([[length, size - length]] if size > length else [])
+        self._size += size
+        return len(self._chunks) - 1, 0
+
+
+class BlobStore(object):
+    """Decides which file contents live in the blob arena.
+
+    Disabled until configure is called (or HACKNET_BLOB_THRESHOLD is set):
+    contents then stay plain str or bytes objects. Once enabled, contents of
+    at least threshold bytes are moved to the arena by the ContentPool and
+    files hold a Blob handle instead.
+    """
+
+    arena = None
+    threshold = 64 * 1024
+
+    @staticmethod
+    def configure(threshold=64 * 1024, directory=None):
+        """Enables the blob store.
+
+        Arguments:
+            threshold -- minimum size in bytes of the contents kept in the arena.
+            directory -- directory of the arena file (the system default if None).
+        """
+
+        BlobStore.arena = BlobArena(directory)
+        BlobStore.threshold = threshold
+
+    @staticmethod
+    def disable():
+        """Stops moving new contents to the arena. Existing blobs stay valid."""
+
+        BlobStore.arena = None
+
+    @staticmethod
+    def wants(contents):
+        """Returns True if contents (str, bytes or encoded data) take at least threshold bytes once encoded.
+
+        A str is only encoded to be measured when its number of characters
+        alone cannot decide (utf-8 takes one to four bytes per character).
+        """
+
+        if BlobStore.arena is None:
+            return False
+        length = len(contents)
+        if isinstance(contents, str) and length < BlobStore.threshold <= length * 4:
+            length = len(contents.encode('utf-8'))
+        return length >= BlobStore.threshold
+
+    @staticmethod
+    def put(data, text):
+        """Copies encoded contents into the arena and returns their Blob."""
+
+        return BlobStore.arena.put(data, text)
+
+
+if os.environ.get('HACKNET_BLOB_THRESHOLD'):
+    BlobStore.configure(int(os.environ['HACKNET_BLOB_THRESHOLD']))
@@ -0,0 +1,122 @@
+import hashlib
+import itertools
+import threading
+
+from utils.blob_store import Blob, BlobStore
+
+
+class ContentPool(object):
+    """Content-addressed, refcounted pool of the file contents of every system.
+
+    Files never own their contents: they hold the pool's canonical object
+    for them, so identical contents are kept once for the whole internet and
+    copying a file only takes a reference. Contents are immutable, so writing
+    to a file just swaps its reference (copy on write).
+
+    Small contents are keyed by themselves (str and bytes cache their hash).
+    Contents large enough for the blob store are keyed by the blake2b digest
+    of their encoded bytes, and only the first copy is written to the arena.
+    An entry is dropped (and its blob freed) when its last reference is released.
+    References are released explicitly, never when a file is garbage collected:
+    by File.set_contents for the contents it replaces, and by File.discard for
+    a file removed for good (rm, Directory.set_contents, Internet.remove_os).
+
+    Blobs written a piece at a time (see FileAppender) are never hashed:
+    they are adopted under a key of their own, and a blob held by a single
+    file can be detached from the pool to be written to in place.
+    """
+
+    _entries = {}
+    _lock = threading.Lock()
+    _serial = itertools.count()
+
+    @staticmethod
+    def intern(contents):
+        """Takes a reference to contents. Returns the canonical object to hold instead of them."""
+
+        if isinstance(contents, Blob):
+            return ContentPool._acquire(contents.key, contents)
+        if BlobStore.wants(contents):
+            text = isinstance(contents, str)
+            return ContentPool._intern_encoded(contents.encode('utf-8') if text else contents, text)
+        return ContentPool._acquire(contents, contents)
+
+    @staticmethod
+    def load(data, text):
+        """Same as intern, for contents that are still encoded (e.g. read from a snapshot)."""
+
+        if BlobStore.wants(data):
+            return ContentPool._intern_encoded(data, text)
+        return ContentPool.intern(data.decode('utf-8') if text else data)
+
+    @staticmethod
+    def release(contents):
+        """Drops a reference taken by intern, forgetting the contents after the last one."""
+
+        if contents is None:
+            return
+        key = contents.key if isinstance(contents, Blob) else contents
+        with ContentPool._lock:
+            entry = ContentPool._entries.get(key)
+            if entry is None or entry[0] is not contents:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del ContentPool._entries[key]
+        if isinstance(contents, Blob):
+            contents.arena.free(contents)
+
+    @staticmethod
+    def detach(blob):
+        """Takes a blob out of the pool if its caller holds the only reference to it. Returns True if it did.
+
+        The blob then belongs to the caller alone, who can change it and has
+        to give it back with adopt (or free it).
+        """
+
+        with ContentPool._lock:
+            entry = ContentPool._entries.get(blob.key)
+            if entry is None or entry[0] is not blob or entry[1] != 1:
+                return False
+            del ContentPool._entries[blob.key]
+        blob.key = None
+        return True
+
+    @staticmethod
+    def adopt(blob):
+        """Puts a blob filled by its caller in the pool under a key of its own, holding one reference. Returns it."""
+
+        blob.key = ('adopted', next(ContentPool._serial))
+        return ContentPool._acquire(blob.key, blob)
+
+    @staticmethod
+    def stats():
+        """Returns the number of distinct contents and the number of references to them."""
+
+        with ContentPool._lock:
+            return len(ContentPool._entries), sum(entry[1] for entry in ContentPool._entries.values())
+
+    @staticmethod
+    def _acquire(key, contents):
+        with ContentPool._lock:
+            entry = ContentPool._entries.get(key)
+            if entry is None:
+                entry = ContentPool._entries[key] = [contents, 0]
+            entry[1] += 1
+            return entry[0]
+
+    @staticmethod
+    def _intern_encoded(data, text):
+        key = (text, hashlib.blake2b(data, digest_size=16).digest())
+        with ContentPool._lock:
+            entry = ContentPool._entries.get(key)
+            if entry is not None:
+                entry[1] += 1
+                return entry[0]
+        blob = BlobStore.put(data, text)
+        blob.key = key
+        contents = ContentPool._acquire(key, blob)
+        if contents is not blob:
+            blob.arena.free(blob)
+        return contents
@@ -116,3 +116,83 @@ class RootDirException(Exception):
         else:
             self.message = None
             self.info = None
+
+
+class IdAllocatorError(Exception):
+    def __init__(self, *args):
+        if args:
+            self.message = args[0]
+            self.info = args[1:] if len(args) > 1 else None
+        else:
+            self.message = None
+            self.info = None
+
+
+class SnapshotError(Exception):
+    def __init__(self, *args):
+        if args:
+            self.message = args[0]
+            self.info = args[1:] if len(args) > 1 else None
+        else:
+            self.message = None
+            self.info = None
+
+
+class SessionError(Exception):
+    def __init__(self, *args):
+        if args:
+            self.message = args[0]
+            self.info = args[1:] if len(args) > 1 else None
+        else:
+            self.message = None
+            self.info = None
+
+
+class CommandThrottled(Exception):
+    def __init__(self, *args):
+        if args:
+            self.message = args[0]
+            self.info = args[1:] if len(args) > 1 else None
+        else:
+            self.message = None
+            self.info = None
+
+
+class IPExhausted(Exception):
+    def __init__(self, *args):
+        if args:
+            self.message = args[0]
+            self.info = args[1:] if len(args) > 1 else None
+        else:
+            self.message = None
+            self.info = None
+
+
+class IPTaken(Exception):
+    def __init__(self, *args):
+        if args:
+            self.message = args[0]
+            self.info = args[1:] if len(args) > 1 else None
+        else:
+            self.message = None
+            self.info = None
+
+
+class IPNotAllocated(Exception):
+    def __init__(self, *args):
+        if args:
+            self.message = args[0]
+            self.info = args[1:] if len(args) > 1 else None
+        else:
+            self.message = None
+            self.info = None
+
+
+class JournalError(Exception):
+    def __init__(self, *args):
+        if args:
+            self.message = args[0]
+            self.info = args[1:] if len(args) > 1 else None
+        else:
+            self.message = None
+            self.info = None
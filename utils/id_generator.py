@@ -1,21 +1,310 @@
-import string
-import random
+import os
 import json
+import time
+import atexit
+import random
+import string
+import threading
+
+from utils import exceptions
+
+
+class IdAllocator(object):
+    """In-process allocator for unique storage unit ids.
+
+    Ids are fixed length strings of uppercase letters. Every id maps to an
+    integer code, and the codes that are taken are kept in an in-memory index
+    (a bitmap for small id spaces, a set otherwise), so checking an id for
+    uniqueness never touches the disk.
+
+    Durability modes:
+        none -- ids only live in memory.
+        periodic -- the whole id list is written to ids_path at most once every flush_interval seconds (and at exit).
+        journal -- every allocation (or reserved batch) is appended to journal_path with a single write.
+
+    Attributes:
+        durability: one of 'none', 'periodic' or 'journal'.
+        ids_path: json file holding the list of generated ids.
+        journal_path: append-only file holding ids generated since the last compaction.
+        flush_interval: minimum number of seconds between two periodic flushes.
+    """
+
+    DURABILITY_MODES = ('none', 'periodic', 'journal')
+    BITMAP_LIMIT = 2 ** 24
+    LETTERS = string.ascii_uppercase
+
+    def __init__(self, durability='periodic', ids_path='data/generated_ids.json', journal_path='data/generated_ids.journal', flush_interval=5.0):
+        """Initializes the allocator.
+
+        Arguments:
+            durability -- one of 'none', 'periodic' or 'journal'.
+            ids_path -- json file holding the list of generated ids.
+            journal_path -- append-only file holding ids generated since the last compaction.
+            flush_interval -- minimum number of seconds between two periodic flushes.
+        """
+
+        if durability not in IdAllocator.DURABILITY_MODES:
+            raise exceptions.IdAllocatorError(f'Durability mode needs to be one of {IdAllocator.DURABILITY_MODES}.', durability)
+
+        self.durability = durability
+        self.ids_path = ids_path
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+
+        self._loaded = False
+        self._indexes = {}
+        self._counts = {}
+        self._pools = {}
+        self._generated = []
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+        atexit.register(self.flush)
+
+    def allocate(self, length: int=6):
+        """Returns a new unique id of the given length."""
+
+        with self._lock:
+            pool = self._pools.get(length)
+            if pool:
+                return pool.pop()
+
+            gen = self._take(length)
+            self._persist([gen])
+            return gen
+
+    def reserve(self, n: int, length: int=6):
+        """Reserves n ids of the given length with a single write.
+
+        Reserved ids are handed out by the following calls to allocate,
+        which then do not need to touch the disk at all.
+        """
+
+        with self._lock:
+            pool = self._pools.setdefault(length, [])
+            batch = [self._take(length) for _ in range(n - len(pool))]
+            if batch:
+                self._persist(batch)
+                pool.extend(reversed(batch))
+
+    def claim(self, ids):
+        """Marks ids generated elsewhere (e.g. loaded from a snapshot) as taken, with a single write."""
+
+        with self._lock:
+            self._load()
+            batch = [gen for gen in ids if self._mark(gen)]
+            self._generated.extend(batch)
+            if batch:
+                self._persist(batch)
+
+    def is_taken(self, gen: str):
+        """Returns True if the given id has already been generated."""
+
+        self._load()
+        index = self._indexes.get(len(gen))
+        if index is None:
+            return False
+        code = self._encode(gen)
+        if isinstance(index, set):
+            return code in index
+        return bool(index[code >> 3] & (1 << (code & 7)))
+
+    def flush(self):
+        """Writes every generated id to disk, if the durability mode needs it."""
+
+        if self.durability == 'periodic' and self._dirty:
+            with open(self.ids_path, 'w') as f:
+                json.dump(self._generated, f, indent=4)
+            self._dirty = False
+        self._last_flush = time.monotonic()
+
+    def use_files(self, ids_path, journal_path):
+        """Moves the allocator to other files (e.g. one per process), keeping every id it knows of.
+
+        The ids already in the new files are loaded too, and the ids known so
+        far are written to them on the next flush (right away in journal mode).
+        """
+
+        with self._lock:
+            self._load()
+            self.ids_path = ids_path
+            self.journal_path = journal_path
+            if self.durability == 'none':
+                return
+            for gen in self._read_files():
+                if self._mark(gen):
+                    self._generated.append(gen)
+            if self.durability == 'journal':
+                self.compact()
+            else:
+                self._dirty = bool(self._generated)
+
+    def compact(self):
+        """Folds the journal into the json id list and truncates the journal."""
+
+        if self.durability != 'journal':
+            return
+        self._load()
+        with open(self.ids_path, 'w') as f:
+            json.dump(self._generated, f, indent=4)
+        open(self.journal_path, 'w').close()
+
+    def _take(self, length):
+        """Marks a free code of the given length as taken and returns its id."""
+
+        self._load()
+        space = len(IdAllocator.LETTERS) ** length
+        if self._counts.get(length, 0) >= space:
+            raise exceptions.IdAllocatorError(f'No ids of length {length} left.', length)
+
+        index = self._index(length)
+        code = random.randrange(space)
+        if isinstance(index, set):
+            while code in index:
+                code = random.randrange(space)
+            index.add(code)
+        else:
+            while index[code >> 3] & (1 << (code & 7)):
+                code = (code + 1) % space
+            index[code >> 3] |= 1 << (code & 7)
+
+        self._counts[length] = self._counts.get(length, 0) + 1
+        gen = self._decode(code, length)
+        if self.durability != 'none':
+            self._generated.append(gen)
+        return gen
+
+    def _persist(self, batch):
+        """Makes a batch of freshly taken ids durable according to the durability mode."""
+
+        if self.durability == 'journal':
+            with open(self.journal_path, 'a') as f:
+                f.write(' '.join(batch) + '\n')
+        elif self.durability == 'periodic':
+            self._dirty = True
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def _load(self):
+        """Loads the previously generated ids into the in-memory index (only once)."""
+
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.durability == 'none':
+            return
+
+        for gen in self._read_files():
+            if self._mark(gen):
+                self._generated.append(gen)
+
+    def _read_files(self):
+        """Returns the ids stored in ids_path (and journal_path in journal mode)."""
+
+        generated = []
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, 'r') as f:
+                generated.extend(json.load(f))
+        if self.durability == 'journal' and os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r') as f:
+                for line in f:
+                    generated.extend(line.split())
+        return generated
+
+    def _mark(self, gen):
+        """Marks an already generated id as taken. Returns False if it already was."""
+
+        index = self._index(len(gen))
+        code = self._encode(gen)
+        if isinstance(index, set):
+            if code in index:
+                return False
+            index.add(code)
+        else:
+            if index[code >> 3] & (1 << (code & 7)):
+                return False
+            index[code >> 3] |= 1 << (code & 7)
+        self._counts[len(gen)] = self._counts.get(len(gen), 0) + 1
+        return True
+
+    def _index(self, length):
+        """Returns the index of taken codes for the given id length."""
+
+        index = self._indexes.get(length)
+        if index is None:
+            space = len(IdAllocator.LETTERS) ** length
+            index = bytearray((space + 7) // 8) if space <= IdAllocator.BITMAP_LIMIT else set()
+            self._indexes[length] = index
+        return index
+
+    @staticmethod
+    def _encode(gen):
+        """Returns the integer code of an id."""
+
+        code = 0
+        for letter in gen:
+            code = code * 26 + (ord(letter) - 65)
+        return code
+
+    @staticmethod
+    def _decode(code, length):
+        """Returns the id of the given length that an integer code stands for."""
+
+        letters = []
+        for _ in range(length):
+            code, rest = divmod(code, 26)
+            letters.append(IdAllocator.LETTERS[rest])
+        return ''.join(reversed(letters))
 
 
 class IdGenerator(object):
+    """Entry point used by the storage units to get their ids.
+
+    The actual work is done by a pluggable allocator, an IdAllocator by default.
+    """
+
+    allocator = IdAllocator()
+
+    @staticmethod
+    def configure(durability='periodic', **kwargs):
+        """Replaces the allocator with a new IdAllocator using the given durability mode."""
+
+        IdGenerator.set_allocator(IdAllocator(durability, **kwargs))
+
+    @staticmethod
+    def set_allocator(allocator):
+        """Replaces the allocator, flushing the previous one first."""
+
+        IdGenerator.allocator.flush()
+        IdGenerator.allocator = allocator
+
     @staticmethod
     def generate_id(length: int=6):
-        with open("data/generated_ids.json", "r") as f:
-            generated = json.load(f)
-
-        gen = "".join(random.choices(string.ascii_uppercase, k=length))        
-        while gen in generated:
-            gen = ''.join(random.choices(string.ascii_uppercase, k=length))
-
-        generated.append(gen)
-        
-        with open("data/generated_ids.json", "w") as f:
-            json.dump(generated, f, indent=4)
-            
-        return gen
+        return IdGenerator.allocator.allocate(length)
+
+    @staticmethod
+    def generate_code(length: int=6):
+        """Returns a new unique id as its integer code (see format_id)."""
+
+        return IdAllocator._encode(IdGenerator.allocator.allocate(length))
+
+    @staticmethod
+    def format_id(code: int, length: int=6):
+        """Returns the id an integer code stands for."""
+
+        return IdAllocator._decode(code, length)
+
+    @staticmethod
+    def parse_id(gen: str):
+        """Returns the integer code of an id."""
+
+        return IdAllocator._encode(gen)
+
+    @staticmethod
+    def reserve(n: int, length: int=6):
+        IdGenerator.allocator.reserve(n, length)
+
+    @staticmethod
+    def claim(ids):
+        IdGenerator.allocator.claim(ids)
@@ -0,0 +1,121 @@
+import random
+
+from utils import exceptions
+
+
+class IpRegistry(object):
+    """Registry owning the allocation and lookup of IP addresses.
+
+    Addresses have four octets between 1 and 255 and are stored packed into
+    a 32-bit integer. Systems are looked up through a dict keyed by the packed
+    address. Taken addresses are also tracked in a bitset paged by /24 prefix
+    (one 256-bit integer per prefix in use), which lets allocation pick a free
+    neighbour after a collision instead of retrying at random.
+    """
+
+    SPACE = 255 ** 4
+    FULL_PAGE = ((1 << 256) - 1) ^ 1
+
+    def __init__(self):
+        """Initializes an empty registry."""
+
+        self._systems = {}
+        self._pages = {}
+
+    def allocate(self):
+        """Reserves a free address and returns it in dotted form. Raises IPExhausted if every address is taken."""
+
+        if len(self._systems) >= IpRegistry.SPACE:
+            raise exceptions.IPExhausted('No IP addresses left.')
+
+        while True:
+            prefix = (random.randint(1, 255) << 16) | (random.randint(1, 255) << 8) | random.randint(1, 255)
+            page = self._pages.get(prefix, 0)
+            if page == IpRegistry.FULL_PAGE:
+                continue
+            host = random.randint(1, 255)
+            if page & (1 << host):
+                free = IpRegistry.FULL_PAGE & ~page
+                host = (free & -free).bit_length() - 1
+            self._pages[prefix] = page | (1 << host)
+            packed = (prefix << 8) | host
+            self._systems[packed] = None
+            return IpRegistry.unpack(packed)
+
+    def claim(self, ip):
+        """Reserves a specific address (e.g. one loaded from a snapshot). Raises IPTaken if it already is."""
+
+        packed = IpRegistry.pack(ip)
+        if packed in self._systems:
+            raise exceptions.IPTaken('IP address is already taken.', ip)
+        prefix = packed >> 8
+        self._pages[prefix] = self._pages.get(prefix, 0) | (1 << (packed & 0xFF))
+        self._systems[packed] = None
+        return ip
+
+    def register(self, ip, system):
+        """Binds an allocated address to the system owning it. Raises IPNotAllocated if it was not allocated."""
+
+        packed = IpRegistry.pack(ip)
+        if packed not in self._systems:
+            raise exceptions.IPNotAllocated('IP address was not allocated.', ip)
+        self._systems[packed] = system
+
+    def lookup(self, ip):
+        """Returns the system with the given address. Raises OSNotFound if there is none."""
+
+        try:
+            system = self._systems.get(IpRegistry.pack(ip))
+        except (ValueError, AttributeError):
+            system = None
+        if system is None:
+            raise exceptions.OSNotFound('os not found.', ip)
+        return system
+
+    def release(self, ip):
+        """Frees an address so that it can be allocated again."""
+
+        packed = IpRegistry.pack(ip)
+        if self._systems.pop(packed, False) is False:
+            return
+        prefix = packed >> 8
+        page = self._pages[prefix] & ~(1 << (packed & 0xFF))
+        if page:
+            self._pages[prefix] = page
+        else:
+            del self._pages[prefix]
+
+    def systems(self):
+        """Returns an iterator over every registered system."""
+
+        return (system for system in self._systems.values() if system is not None)
+
+    def __contains__(self, ip):
+        try:
+            return IpRegistry.pack(ip) in self._systems
+        except (ValueError, AttributeError):
+            return False
+
+    def __len__(self):
+        return len(self._systems)
+
+    @staticmethod
+    def pack(ip):
+        """Packs a dotted address into a 32-bit integer. Raises ValueError if it is not valid."""
+
+        octets = ip.split('.')
+        if len(octets) != 4:
+            raise ValueError(f'{ip} is not a valid IP address.')
+        packed = 0
+        for octet in octets:
+            value = int(octet)
+            if not 1 <= value <= 255:
+                raise ValueError(f'{ip} is not a valid IP address.')
+            packed = (packed << 8) | value
+        return packed
+
+    @staticmethod
+    def unpack(packed):
+        """Returns the dotted form of a packed address."""
+
+        return f'{packed >> 24}.{(packed >> 16) & 0xFF}.{(packed >> 8) & 0xFF}.{packed & 0xFF}'
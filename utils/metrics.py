@@ -0,0 +1,185 @@
+import time
+import heapq
+import bisect
+import threading
+
+
+class CommandMetrics(object):
+    """Counters and latency histograms of the terminal commands.
+
+    For every command: number of runs, number of failed runs (non zero exit
+    code), a latency histogram and the number of storage units touched. For
+    every system: number of commands, time spent running them and storage
+    units touched. Recording is a few dict and list updates under a lock;
+    cumulative bucket counts are only computed when rendering.
+
+    Systems come and go, so only the top_systems systems that spent the
+    most time running commands are rendered with an ip label, which keeps
+    the number of series bounded however many systems exist.
+
+    Attributes:
+        buckets: upper bounds of the latency histogram buckets, in seconds.
+        top_systems: number of systems rendered.
+    """
+
+    BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+    TOP_SYSTEMS = 10
+
+    def __init__(self, buckets=BUCKETS, top_systems=TOP_SYSTEMS):
+        """Initializes empty metrics using the given histogram buckets and number of systems rendered."""
+
+        self.buckets = buckets
+        self.top_systems = top_systems
+        self._commands = {}
+        self._systems = {}
+        self._lock = threading.Lock()
+
+    def record(self, ip, command, seconds, failed, nodes):
+        """Records one run of a command.
+
+        Arguments:
+            ip -- IP of the system that ran the command.
+            command -- name of the command.
+            seconds -- time the command took.
+            failed -- True if the command exited with a non zero exit code.
+            nodes -- number of storage units the command touched.
+        """
+
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            stats = self._commands.get(command)
+            if stats is None:
+                stats = self._commands[command] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0, 0]
+            stats[0][bucket] += 1
+            stats[1] += seconds
+            stats[2] += 1
+            stats[3] += failed
+            stats[4] += nodes
+
+            system = self._systems.get(ip)
+            if system is None:
+                system = self._systems[ip] = [0, 0.0, 0]
+            system[0] += 1
+            system[1] += seconds
+            system[2] += nodes
+
+    def forget(self, ip):
+        """Drops the metrics of a system that was removed."""
+
+        with self._lock:
+            self._systems.pop(ip, None)
+
+    def export(self):
+        """Returns a copy of the counters, as plain lists and dicts (e.g. to send them to another process)."""
+
+        with self._lock:
+            commands = {command: [list(stats[0])] + stats[1:] for command, stats in self._commands.items()}
+            systems = {ip: list(system) for ip, system in self._systems.items()}
+        return commands, systems
+
+    def merge(self, exported):
+        """Adds counters returned by export (of metrics using the same buckets) to these ones."""
+
+        commands, systems = exported
+        with self._lock:
+            for command, other in commands.items():
+                stats = self._commands.get(command)
+                if stats is None:
+                    stats = self._commands[command] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0, 0]
+                stats[0] = [count + more for count, more in zip(stats[0], other[0])]
+                for index in range(1, 5):
+                    stats[index] += other[index]
+            for ip, other in systems.items():
+                system = self._systems.get(ip)
+                if system is None:
+                    system = self._systems[ip] = [0, 0.0, 0]
+                for index in range(3):
+                    system[index] += other[index]
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format."""
+
+        with self._lock:
+            commands = {command: (list(stats[0]),) + tuple(stats[1:]) for command, stats in self._commands.items()}
+            systems = heapq.nlargest(self.top_systems, ((ip, tuple(system)) for ip, system in self._systems.items()), key=lambda item: item[1][1])
+
+        lines = [
+            '# HELP hacknet_commands_total Terminal commands run.',
+            '# TYPE hacknet_commands_total counter',
+        ]
+        lines.extend(f'hacknet_commands_total{{command="{command}"}} {stats[2]}' for command, stats in sorted(commands.items()))
+        lines += [
+            '# HELP hacknet_command_errors_total Terminal commands that exited with a non zero exit code.',
+            '# TYPE hacknet_command_errors_total counter',
+        ]
+        lines.extend(f'hacknet_command_errors_total{{command="{command}"}} {stats[3]}' for command, stats in sorted(commands.items()))
+        lines += [
+            '# HELP hacknet_command_nodes_total Storage units touched by terminal commands.',
+            '# TYPE hacknet_command_nodes_total counter',
+        ]
+        lines.extend(f'hacknet_command_nodes_total{{command="{command}"}} {stats[4]}' for command, stats in sorted(commands.items()))
+        lines += [
+            '# HELP hacknet_command_duration_seconds Time taken by terminal commands.',
+            '# TYPE hacknet_command_duration_seconds histogram',
+        ]
+        for command, stats in sorted(commands.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (None,), stats[0]):
+                cumulative += count
+                le = '+Inf' if bound is None else repr(bound)
+                lines.append(f'hacknet_command_duration_seconds_bucket{{command="{command}",le="{le}"}} {cumulative}')
+            lines.append(f'hacknet_command_duration_seconds_sum{{command="{command}"}} {stats[1]!r}')
+            lines.append(f'hacknet_command_duration_seconds_count{{command="{command}"}} {stats[2]}')
+
+        for name, index, kind, description in (
+            ('hacknet_system_commands_total', 0, 'counter', 'Terminal commands run by the busiest systems.'),
+            ('hacknet_system_command_seconds_total', 1, 'counter', 'Time spent running the terminal commands of the busiest systems.'),
+            ('hacknet_system_nodes_total', 2, 'counter', 'Storage units touched by the terminal commands of the busiest systems.'),
+        ):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(f'{name}{{ip="{ip}"}} {system[index]!r}' for ip, system in systems)
+        return '\n'.join(lines) + '\n'
+
+
+class Metrics(object):
+    """Entry point used by the terminal to instrument its commands.
+
+    The storage units touched are counted per thread between start and
+    record, by the code walking the file system calling touch.
+    """
+
+    registry = CommandMetrics()
+    _local = threading.local()
+
+    @staticmethod
+    def start():
+        """Starts measuring a command on the current thread. Returns the start time to give to record."""
+
+        Metrics._local.nodes = 0
+        return time.perf_counter()
+
+    @staticmethod
+    def touch(n=1):
+        """Counts storage units touched by the command running on the current thread."""
+
+        local = Metrics._local
+        local.nodes = getattr(local, 'nodes', 0) + n
+
+    @staticmethod
+    def record(ip, command, started, response):
+        """Records a command started with start and its response. Returns the number of storage units it touched."""
+
+        nodes = getattr(Metrics._local, 'nodes', 0)
+        Metrics.registry.record(ip, command, time.perf_counter() - started, response['exit_code'] != 0, nodes)
+        return nodes
+
+    @staticmethod
+    def last_nodes():
+        """Returns the number of storage units touched by the last command measured on the current thread."""
+
+        return getattr(Metrics._local, 'nodes', 0)
+
+    @staticmethod
+    def render():
+        return Metrics.registry.render()
@@ -1,9 +1,108 @@
+import os
+import json
+import queue
+import atexit
 import logging
 import logging.config
+import logging.handlers
 
 
+STORAGE_LOGGERS = (
+    'terminal_game.storage_unit',
+    'terminal_game.directory',
+    'terminal_game.file',
+    'terminal_game.root_dir',
+    'terminal_game.system',
+    'terminal_game.integrity',
+)
+
 logging.config.fileConfig('logging.conf')
+if os.environ.get('HACKNET_LOG_MODE') == 'development':
+    logging.getLogger().setLevel(logging.DEBUG)
+
+_listener = None
 
 
 def get_logger(name):
-    return logging.getLogger(name)
\ No newline at end of file
+    return logging.getLogger(name)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats every record as a single json object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def set_storage_tracing(enabled):
+    """Turns the debug tracing of the storage layer (storage units, directories, files, systems) on or off."""
+
+    for name in STORAGE_LOGGERS:
+        logging.getLogger(name).setLevel(logging.NOTSET if enabled else logging.INFO)
+
+
+def use_production_logging(level=logging.INFO, storage_tracing=False):
+    """Switches logging to production mode.
+
+    Records below level are dropped before their message is ever built.
+    File handlers write json lines, and all handlers are moved behind a
+    queue drained by a background thread, so a logging call only costs
+    putting the record on the queue.
+
+    Arguments:
+        level -- lowest level that gets logged.
+        storage_tracing -- whether to keep the debug tracing of the storage layer.
+    """
+
+    global _listener
+    if _listener:
+        return
+
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    for handler in handlers:
+        if isinstance(handler, logging.FileHandler):
+            handler.setFormatter(JsonFormatter(datefmt='%Y-%m-%d %H:%M:%S'))
+        root.removeHandler(handler)
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+    os.register_at_fork(after_in_child=_restart_listener)
+
+    set_storage_tracing(storage_tracing)
+
+
+def _stop_listener():
+    """Stops the queue listener, after it logged every record left on the queue."""
+
+    if _listener:
+        _listener.stop()
+
+
+def _restart_listener():
+    """Starts a new queue listener in a forked child process, whose threads did not survive the fork."""
+
+    global _listener
+    _listener = logging.handlers.QueueListener(_listener.queue, *_listener.handlers, respect_handler_level=_listener.respect_handler_level)
+    _listener.start()
+
+
+if os.environ.get('HACKNET_LOG_MODE') == 'production':
+    use_production_logging()
+if os.environ.get('HACKNET_STORAGE_TRACING') == '0':
+    set_storage_tracing(False)
@@ -1,33 +1,57 @@
-from terminal_game import directory, root_dir, file
+import os
+import json
+
+from terminal_game import root_dir, file
+from terminal_game.tree_builder import TreeBuilder
 
 
 class Parser(object):
+    _templates = {}
+
     @staticmethod
-    def parse_root(root_dr_contents):
-        dr = root_dir.RootDir([])
+    def load_template(path, prepare=None):
+        """Returns the root directory parsed from a json file, cached once per process.
 
-        for content in root_dr_contents:
-            content.update({'parent': dr})
-            if isinstance(content['contents'], list):
-                dr.add(Parser.parse_dir(content))
-            else:
-                dr.add(Parser.parse_file(content))
+        The file is only read and parsed again when its mtime changes.
 
-        return dr
+        Arguments:
+            path -- path of the json file describing the root directory.
+            prepare -- (optional) function called once on every freshly parsed root.
+        """
+
+        mtime = os.stat(path).st_mtime_ns
+        cached = Parser._templates.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        with open(path, 'r') as f:
+            template = Parser.parse_root(json.load(f))
+        if prepare:
+            prepare(template)
+        Parser._templates[path] = (mtime, template)
+        return template
 
     @staticmethod
-    def parse_dir(dr_dict):
-        dr = directory.Directory(dr_dict['name'], [], dr_dict['parent'])
+    def clone_root(template):
+        """Returns a root directory backed by an already validated template.
 
-        for content in dr_dict['contents']:
-            content.update({'parent': dr})
-            if isinstance(content['contents'], list):
-                dr.add(Parser.parse_dir(content))
-            else:
-                dr.add(Parser.parse_file(content))
+        The template is shared as an immutable base layer: nodes are only
+        copied out of it when they are first needed, without validating or
+        logging them again.
+        """
 
+        return root_dir.RootDir.new_layered('', template, None)
+
+    @staticmethod
+    def parse_root(root_dr_contents):
+        dr = root_dir.RootDir([])
+        TreeBuilder.build(root_dr_contents, dr)
         return dr
 
+    @staticmethod
+    def parse_dir(dr_dict):
+        return TreeBuilder.build_dir(dr_dict['name'], dr_dict['contents'], dr_dict['parent'])
+
     @staticmethod
     def parse_file(fl_dict):
-        return file.File(fl_dict['name'], fl_dict['contents'], fl_dict['parent'])
\ No newline at end of file
+        return file.File(fl_dict['name'], fl_dict['contents'], fl_dict['parent'])